@@ -0,0 +1,119 @@
+"""
+Бенчмарк архива каталога: всё через DEFLATE против STORED для картинок.
+
+Сравнивает время сборки архива и распаковки (как в боте) на папке
+с 2000 синтетических фото. Архив собирает сам parser_gui.build_catalog_archive,
+политики отличаются только compress_type: «deflate» — всё через DEFLATE,
+«stored» — archive_compress_type по умолчанию. Параллельно в сборке только
+хэширование (строка «Хэши фото»), запись ZIP — последовательная.
+
+Варианты фото и AVIF/WebP копии готовятся до замеров, как это уже
+сделано у фото, скачанных парсером (это самая долгая часть запуска).
+
+Запуск:
+    python bench_catalog_zip.py            # 2000 фото по ~60 КБ
+    python bench_catalog_zip.py 500 120    # 500 фото по ~120 КБ
+"""
+
+import sys
+import io
+import os
+import time
+import math
+import shutil
+import zipfile
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+sys.path.insert(0, str(Path(__file__).parent))
+
+from parser_gui import archive_compress_type, build_catalog_archive, hash_images, prepare_image_files  # noqa: E402
+
+POLICIES = {
+    "deflate": lambda name: zipfile.ZIP_DEFLATED,
+    "stored": archive_compress_type,
+}
+
+
+def make_image(path, size_kb):
+    """Настоящий WebP из шума (~size_kb КБ, почти не сжимается) и его производные."""
+    from PIL import Image
+
+    # Шум в WebP q90 — примерно 0.75 байта на пиксель
+    side = max(16, int(math.sqrt(size_kb * 1024 / 0.75)))
+    Image.effect_noise((side, side), 80).convert('RGB').save(path, 'WEBP', quality=90)
+    prepare_image_files(path)
+
+
+def make_images(images_dir, count, size_kb):
+    images_dir.mkdir(parents=True)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+        list(executor.map(lambda i: make_image(images_dir / f"product_{i}.webp", size_kb), range(count)))
+
+
+def make_excel(path, count):
+    """Синтетический xlsx (хорошо сжимаемый XML внутри), колонка H — фото."""
+    from openpyxl import Workbook
+
+    wb = Workbook()
+    ws = wb.active
+    ws.append(["URL", "Название", "Цена", "Группа", "", "", "", "Фото"])
+    for i in range(count):
+        ws.append([f"https://example.com/{i}", f"Товар {i}", 100 + i, "Падел", "", "", "", f"images/product_{i}.webp"])
+    wb.save(path)
+
+
+def extract(archive_path, dest_dir):
+    with zipfile.ZipFile(archive_path) as zip_ref:
+        for info in zip_ref.infolist():
+            target = dest_dir / info.filename
+            target.parent.mkdir(parents=True, exist_ok=True)
+            with zip_ref.open(info) as src, open(target, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    size_kb = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+
+    print("=" * 70)
+    print(f"⏱  БЕНЧМАРК ZIP КАТАЛОГА: {count} фото по {size_kb} КБ")
+    print("=" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        images_dir = tmp / "images"
+        excel_path = tmp / "products_links.xlsx"
+        print("🖼  Готовлю фото, варианты и копии...")
+        make_images(images_dir, count, size_kb)
+        make_excel(excel_path, count)
+
+        # Та же часть сборки, что идёт параллельно, — отдельно для справки
+        start = time.perf_counter()
+        hash_images(images_dir)
+        hash_time = time.perf_counter() - start
+        print(f"Хэши фото (параллельно, входят в сборку): {hash_time:.2f} с")
+        print("-" * 70)
+        print(f"{'Политика':<10} {'Сборка, с':>10} {'Распаковка, с':>14} {'Размер, МБ':>11}")
+        print("-" * 70)
+
+        for policy, compress_type in POLICIES.items():
+            archive_path = tmp / f"catalog_{policy}.zip"
+
+            start = time.perf_counter()
+            build_catalog_archive(archive_path, excel_path, images_dir, compress_type=compress_type)
+            build_time = time.perf_counter() - start
+
+            dest_dir = tmp / f"extract_{policy}"
+            start = time.perf_counter()
+            extract(archive_path, dest_dir)
+            extract_time = time.perf_counter() - start
+
+            size_mb = archive_path.stat().st_size / 1024 / 1024
+            print(f"{policy:<10} {build_time:>10.2f} {extract_time:>14.2f} {size_mb:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Бенчмарк загрузки каталога из Excel: старый загрузчик (две книги + ws.cell)
+против однопроходного read_only (read_products_from_workbook из mini_app.py).
+
+Запуск:
+    python bench_excel_loader.py              # 1k, 10k, 50k строк
+    python bench_excel_loader.py 1000 5000    # свои размеры
+
+Каждый замер идёт в отдельном процессе, чтобы пик RSS не смешивался.
+Память — прирост пика RSS за время загрузки (без импорта модулей).
+"""
+
+import sys
+import io
+import json
+import time
+import subprocess
+import tempfile
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+
+SCRIPT_DIR = Path(__file__).parent
+DEFAULT_SIZES = [1_000, 10_000, 50_000]
+
+
+def make_workbook(path, rows):
+    """Создаёт синтетический каталог в формате products_links.xlsx."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append([f"col{i}" for i in range(1, 24)])
+    for i in range(rows):
+        r = i + 2
+        row = [None] * 23
+        row[0] = f"https://www.tradeinn.com/p/{i}"
+        row[1] = f"Товар {i}"
+        row[2] = 50 + i % 300                         # C: Цена (€)
+        row[3] = ("Падел", "Волейбол", "Теннис", "Бег")[i % 4]
+        row[4] = f"Подгруппа {i % 7}"
+        row[5] = "Кроссовки"
+        row[6] = f"https://cdn.example/{i}.webp"
+        row[7] = f"images/product_{i}.webp"
+        row[8] = "40, 41, 42, 43"
+        row[15] = f"=C{r}*100" if i % 2 else (50 + i % 300) * 100   # P: формула или число
+        row[19] = f"Бренд {i % 25}"
+        row[20] = ("мужские", "женские", "")[i % 3]
+        row[22] = i % 3 or None
+        ws.append(row)
+    wb.save(path)
+
+
+def legacy_read(file_path):
+    """Прежний загрузчик: две полные книги и поячеечный доступ."""
+    from openpyxl import load_workbook
+
+    wb_data = load_workbook(file_path, data_only=True)
+    wb_raw = load_workbook(file_path, data_only=False)
+    ws_data = wb_data.active
+    ws_raw = wb_raw.active
+    count = 0
+    for row_num in range(2, ws_data.max_row + 1):
+        values = [ws_data.cell(row_num, col).value for col in (2, 3, 4, 5, 6, 7, 8, 9, 16, 20, 21, 22, 23)]
+        price_raw = ws_raw.cell(row_num, 16).value
+        if values[0] and (values[8] or price_raw or values[1]):
+            count += 1
+    wb_data.close()
+    wb_raw.close()
+    return count
+
+
+def peak_rss_mb():
+    """Пик RSS текущего процесса в МБ (None, если ОС не даёт)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдаёт КБ, macOS — байты
+    return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+
+
+def run_one(loader, file_path):
+    """Дочерний процесс: один замер, результат — JSON в stdout."""
+    if loader == "legacy":
+        import openpyxl  # noqa: F401 — импорт не входит в замер
+        fn = legacy_read
+    else:
+        sys.path.insert(0, str(SCRIPT_DIR))
+        from mini_app import read_products_from_workbook
+        fn = lambda p: len(read_products_from_workbook(p))
+
+    base_rss = peak_rss_mb()
+    start = time.perf_counter()
+    count = fn(file_path)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+    rss = peak - base_rss if peak is not None else None
+    print(json.dumps({"time": elapsed, "rss": rss, "rows": count}))
+
+
+def measure(loader, file_path):
+    result = subprocess.run(
+        [sys.executable, __file__, "--run", loader, str(file_path)],
+        capture_output=True, text=True, encoding='utf-8', errors='replace', check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or DEFAULT_SIZES
+
+    print("=" * 70)
+    print("⏱  БЕНЧМАРК ЗАГРУЗКИ EXCEL")
+    print("=" * 70)
+    print(f"{'Строк':>8} {'Загрузчик':<12} {'Время, с':>10} {'+RSS, МБ':>12} {'Товаров':>9}")
+    print("-" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in sizes:
+            path = Path(tmp) / f"catalog_{rows}.xlsx"
+            make_workbook(path, rows)
+            for loader in ("legacy", "streaming"):
+                r = measure(loader, path)
+                rss = f"{r['rss']:.1f}" if r['rss'] is not None else "—"
+                print(f"{rows:>8} {loader:<12} {r['time']:>10.3f} {rss:>12} {r['rows']:>9}")
+            print()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_one(sys.argv[2], sys.argv[3])
+    else:
+        main()
@@ -0,0 +1,133 @@
+"""
+Нагрузочный тест раздачи фото: /images/ с кэшем горячих фото в памяти
+и без него (только FileResponse/sendfile).
+
+Имитирует всплеск после поста в канале: 90% запросов идут к нескольким
+десяткам «горячих» фото, остальные — вразброс по всему каталогу.
+Сервер (mini_app.create_web_app) запускается в отдельном процессе,
+нагрузку даёт aiohttp-клиент из этого процесса.
+
+Запуск:
+    python bench_image_cache.py                 # 10 с на режим, 64 соединения
+    python bench_image_cache.py 20 128          # 20 с, 128 соединений
+"""
+
+import sys
+import io
+import os
+import time
+import random
+import asyncio
+import tempfile
+import subprocess
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+
+SCRIPT_DIR = Path(__file__).parent
+PORT = 18181
+IMAGE_COUNT = 2000
+IMAGE_SIZE_KB = 30
+HOT_COUNT = 40
+HOT_SHARE = 0.9
+
+
+def make_images(images_dir):
+    """Синтетические «webp» (несжимаемые байты с заголовком RIFF/WEBP)."""
+    images_dir.mkdir(parents=True)
+    for i in range(IMAGE_COUNT):
+        body = os.urandom(IMAGE_SIZE_KB * 1024)
+        (images_dir / f"product_{i}.webp").write_bytes(b'RIFF' + len(body).to_bytes(4, 'little') + b'WEBP' + body)
+
+
+def serve(mode, images_dir, port):
+    """Дочерний процесс: веб-сервер mini_app без access-лога."""
+    sys.path.insert(0, str(SCRIPT_DIR))
+    import mini_app
+    from aiohttp import web
+
+    # Каталог не публикуем: /images/ он не нужен, а swap_catalog пишет ревизии в хранилище
+    if mode == "off":
+        mini_app.IMAGE_MEMORY_CACHE_MAX_BYTES = 0
+
+    async def run():
+        app = mini_app.create_web_app()
+        app["images_dir"] = Path(images_dir)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        print("READY", flush=True)
+        await asyncio.Event().wait()
+
+    asyncio.run(run())
+
+
+async def load(duration, concurrency):
+    """Гоняет запросы duration секунд; возвращает (задержки в мс, метрики кэша)."""
+    import aiohttp
+
+    rng = random.Random(42)
+    hot = [f"product_{i}.webp" for i in rng.sample(range(IMAGE_COUNT), HOT_COUNT)]
+    latencies = []
+    deadline = time.perf_counter() + duration
+
+    async def client(session):
+        while time.perf_counter() < deadline:
+            name = rng.choice(hot) if rng.random() < HOT_SHARE else f"product_{rng.randrange(IMAGE_COUNT)}.webp"
+            start = time.perf_counter()
+            async with session.get(f"http://127.0.0.1:{PORT}/images/{name}?v=1") as response:
+                await response.read()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await asyncio.gather(*(client(session) for _ in range(concurrency)))
+        async with session.get(f"http://127.0.0.1:{PORT}/metrics") as response:
+            metrics = (await response.json())["image_cache"]
+    return latencies, metrics
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+
+    print("=" * 70)
+    print(f"⏱  НАГРУЗКА НА /images/: {IMAGE_COUNT} фото по {IMAGE_SIZE_KB} КБ, "
+          f"{HOT_COUNT} горячих ({HOT_SHARE:.0%} запросов), {concurrency} соединений, {duration:.0f} с")
+    print("=" * 70)
+    print(f"{'Кэш':<8} {'Запросов/с':>11} {'p50, мс':>9} {'p99, мс':>9} {'Попаданий':>10}")
+    print("-" * 70)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        images_dir = Path(tmp) / "images"
+        make_images(images_dir)
+
+        for mode in ("off", "on"):
+            server = subprocess.Popen(
+                [sys.executable, __file__, "--serve", mode, str(images_dir), str(PORT)],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+            )
+            try:
+                for line in server.stdout:
+                    if line.startswith("READY"):
+                        break
+                latencies, metrics = asyncio.run(load(duration, concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+
+            rps = len(latencies) / duration
+            print(f"{mode:<8} {rps:>11.0f} {percentile(latencies, 0.5):>9.2f} "
+                  f"{percentile(latencies, 0.99):>9.2f} {metrics['hit_rate']:>10.1%}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--serve":
+        serve(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main()
@@ -0,0 +1,104 @@
+"""
+Бенчмарк разбора обновлений webhook: прежний путь (request.json() на
+stdlib + Update(**data)) против нового (orjson по сырым байтам +
+Update.model_validate с контекстом бота, как в handle_webhook).
+
+Три типичных обновления: текстовое сообщение, web_app_data из Mini App
+и документ (ZIP каталога от админа).
+
+Запуск:
+    python bench_webhook_decode.py            # 20 000 итераций на тип
+    python bench_webhook_decode.py 50000
+"""
+
+import sys
+import io
+import json
+import time
+from pathlib import Path
+
+sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+sys.path.insert(0, str(Path(__file__).parent))
+
+from aiogram.types import Update  # noqa: E402
+from mini_app import get_bot, loads_json, orjson  # noqa: E402
+
+bot = get_bot()  # Только для контекста model_validate, в сеть не ходит
+
+USER = {"id": 123456789, "is_bot": False, "first_name": "Алексей", "username": "AlexeyBakaev", "language_code": "ru"}
+CHAT = {"id": 123456789, "first_name": "Алексей", "username": "AlexeyBakaev", "type": "private"}
+
+CART = {
+    "action": "consultation",
+    "items": [
+        {"id": i, "name": f"Кроссовки для падела модель {i}", "price": 12900 + i * 100, "quantity": 1, "image": f"/images/ab/{'c' * 64}.webp?v=0123456789abcdef"}
+        for i in range(8)
+    ],
+    "total": 108000,
+}
+
+UPDATES = {
+    "message": {
+        "update_id": 900000001,
+        "message": {"message_id": 501, "from": USER, "chat": CHAT, "date": 1760000000, "text": "/start"},
+    },
+    "web_app_data": {
+        "update_id": 900000002,
+        "message": {
+            "message_id": 502, "from": USER, "chat": CHAT, "date": 1760000001,
+            "web_app_data": {"data": json.dumps(CART, ensure_ascii=False), "button_text": "🛍 Открыть каталог"},
+        },
+    },
+    "document": {
+        "update_id": 900000003,
+        "message": {
+            "message_id": 503, "from": USER, "chat": CHAT, "date": 1760000002,
+            "document": {
+                "file_name": "catalog_2025-10-01.zip", "mime_type": "application/zip",
+                "file_id": "BQACAgIAAxkBAAIBQ2Zz" + "x" * 50, "file_unique_id": "AgADQ2Zz", "file_size": 48234112,
+            },
+            "caption": "Новый каталог",
+        },
+    },
+}
+
+
+def legacy_decode(body):
+    """Как было: await request.json() (decode + json.loads) и Update(**data)."""
+    data = json.loads(body.decode('utf-8'))
+    return Update(**data)
+
+
+def fast_decode(body):
+    """Как сейчас в handle_webhook."""
+    return Update.model_validate(loads_json(body), context={"bot": bot})
+
+
+def measure(fn, body, iterations):
+    for _ in range(min(1000, iterations)):  # Прогрев
+        fn(body)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(body)
+    return iterations / (time.perf_counter() - start)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    print("=" * 70)
+    print(f"⏱  БЕНЧМАРК РАЗБОРА WEBHOOK: {iterations} итераций, orjson: {'да' if orjson else 'нет'}")
+    print("=" * 70)
+    print(f"{'Обновление':<14} {'Байт':>6} {'Было, /с':>12} {'Стало, /с':>12} {'Ускорение':>10}")
+    print("-" * 70)
+
+    for name, update in UPDATES.items():
+        body = json.dumps(update, ensure_ascii=False).encode('utf-8')
+        assert legacy_decode(body).model_dump() == fast_decode(body).model_dump()
+        legacy = measure(legacy_decode, body, iterations)
+        fast = measure(fast_decode, body, iterations)
+        print(f"{name:<14} {len(body):>6} {legacy:>12,.0f} {fast:>12,.0f} {fast / legacy:>9.2f}x".replace(',', ' '))
+
+
+if __name__ == "__main__":
+    main()
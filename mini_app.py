@@ -12,10 +12,11 @@ import sys
 import platform
 import time
 import io
+from dataclasses import dataclass
 from pathlib import Path
 
-# Фикс кодировки для Windows
-if platform.system() == 'Windows':
+# Фикс кодировки для Windows (если вызывающий скрипт ещё не перевёл вывод в UTF-8)
+if platform.system() == 'Windows' and (sys.stdout.encoding or '').lower() != 'utf-8':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
     sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
@@ -25,6 +26,7 @@ def install_dependencies():
         'aiogram': 'aiogram==3.13.1',
         'aiohttp': 'aiohttp==3.10.5',
         'openpyxl': 'openpyxl==3.1.2',
+        'PIL': 'Pillow==11.3.0',
     }
 
     missing_packages = []
@@ -54,8 +56,10 @@ def install_dependencies():
             print(f"   pip install {' '.join(missing_packages)}")
             sys.exit(1)
 
-# Проверяем и устанавливаем зависимости при импорте
-install_dependencies()
+# Проверяем и устанавливаем зависимости при запуске (импорт из бенчмарков
+# и дочерних процессов ничего не ставит)
+if __name__ == "__main__":
+    install_dependencies()
 
 
 # ═══════════════════════════════════════════════════════════
@@ -158,12 +162,48 @@ import asyncio
 import json
 import logging
 import math
+import mimetypes
+import multiprocessing
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import quote
 from aiohttp import web
 
+try:
+    import brotli  # Необязательно: без него отдаём gzip
+except ImportError:
+    brotli = None
+
+try:
+    import orjson  # Необязательно: без него обновления разбирает stdlib json
+except ImportError:
+    orjson = None
+
+
+def loads_json(body):
+    """Разбирает JSON из байтов: orjson, если установлен, иначе stdlib json."""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body)
+
+# Старые Python не знают эти типы — без них фото уходят как octet-stream
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/avif', '.avif')
+
+
+def image_headers(file_path, cache_control):
+    """Заголовки ответа с фото: тип по расширению и политика кэша."""
+    return {
+        "Content-Type": mimetypes.guess_type(file_path.name)[0] or "application/octet-stream",
+        "Cache-Control": cache_control,
+    }
+
 from aiogram import Bot, Dispatcher, types, F
 from aiogram.filters import Command
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo, ReplyKeyboardMarkup, KeyboardButton, Update
 
 
 # ═══════════════════════════════════════════════════════════
@@ -227,6 +267,15 @@ ADMIN_USERNAMES = ["AlexeyBakaev", "musyanya", "GussionHovo"]
 WEBAPP_HOST = "0.0.0.0"
 WEBAPP_PORT = 8080
 
+# Процессов веб-сервера: 1 — как раньше, один процесс; >1 — supervisor
+# запускает воркеров на одном порту (SO_REUSEPORT, только Linux/macOS).
+# Можно переопределить: python mini_app.py --workers 4
+WEB_WORKERS = 1
+WEBHOOK_FORWARD_PORT = 8081  # Внутренний порт воркера-владельца для пересланных webhook
+
+# Страница /bench/grid (бенчмарк сетки на синтетическом каталоге) — только для отладки
+GRID_BENCHMARK = False
+
 # Режим работы:
 # - "auto" = автоматический туннель через Serveo (бесплатно, без регистрации)
 # - "manual" = ручной режим, нужно указать свой URL ниже
@@ -282,7 +331,10 @@ PRODUCTS_DEFAULT = [
     },
 ]
 
-PRODUCTS = []  # Будет загружено из Excel или использованы стандартные
+CATALOG = None  # Текущий CatalogSnapshot (см. swap_catalog)
+CATALOG_REVISIONS = None  # Ревизии товаров для /api/products/changes (см. update_catalog_revisions)
+WORKER_ID = None  # Номер воркера в режиме нескольких процессов (0 — владелец бота), None — один процесс
+WORKER_GENERATION = None  # Метка запуска supervisor: снимки и метрики прошлых запусков не читаются
 
 
 def get_images_dir():
@@ -308,87 +360,65 @@ def get_images_dir():
     return images_dir
 
 
-def load_products_from_excel(file_path=None):
-    """Загружает товары из Excel файла."""
-    global PRODUCTS
+def get_data_dir():
+    """Корень хранилища: /data на Amvera (persistenceMount), иначе папка со скриптом."""
+    data_path = Path('/data')
+    if data_path.exists() and data_path.is_dir():
+        return data_path
+    return Path(__file__).parent
 
-    # Если путь не указан, ищем сначала в /data (Amvera), потом локально
-    if file_path is None:
-        # Проверяем /data/products_links.xlsx (persistenceMount на Amvera)
-        data_path = Path('/data')
-        if data_path.exists() and data_path.is_dir():
-            data_excel = data_path / "products_links.xlsx"
-            if data_excel.exists():
-                file_path = data_excel
-            else:
-                # Fallback: папка со скриптом
-                script_dir = Path(__file__).parent
-                file_path = script_dir / "products_links.xlsx"
-        else:
-            # Локальная разработка
-            script_dir = Path(__file__).parent
-            file_path = script_dir / "products_links.xlsx"
-    else:
-        file_path = Path(file_path)
 
-    if not file_path.exists():
-        print(f"📦 Excel файл не найден: {file_path}")
-        print("   Используются стандартные товары")
-        print("   Для управления товарами через Excel:")
-        print("   1. Запусти: python parser_gui.py")
-        print("   2. Создай шаблон и заполни ссылки")
-        print("   3. Спарси товары")
-        print("   4. Перезапусти мини-апп\n")
-        PRODUCTS = PRODUCTS_DEFAULT
-        return
+def get_cache_dir():
+    """Папка для служебных кэшей (индекс фото, превью): /data/cache или ./cache."""
+    cache_dir = get_data_dir() / 'cache'
+    cache_dir.mkdir(exist_ok=True)
+    return cache_dir
 
-    try:
-        # Проверяем openpyxl
-        try:
-            import openpyxl
-        except ImportError:
-            print("📦 Устанавливаю openpyxl...")
-            subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'openpyxl'])
-            import openpyxl
 
-        from openpyxl import load_workbook
+# Пол из Excel → значение для фильтра в Mini App
+GENDER_ALIASES = {"женские": "Женский", "мужские": "Мужской", "девочки": "Женский", "мальчики": "Мужской"}
 
-        # Загружаем двумя способами:
-        # data_only=True — кэшированные значения формул (если файл сохранён из Excel)
-        # data_only=False — сырые значения (числа или формулы как строки)
-        wb_data = load_workbook(file_path, data_only=True)
-        wb_raw = load_workbook(file_path, data_only=False)
-        ws_data = wb_data.active
-        ws_raw = wb_raw.active
 
-        products = []
+def read_products_from_workbook(file_path):
+    """
+    Читает товары из Excel за один проход.
+
+    Книга открывается один раз в режиме read_only и читается потоково через
+    iter_rows(values_only=True) — без загрузки всего листа в память и без
+    поячеечных ws.cell().
+
+    Цена в P: в режиме data_only ячейка с формулой отдаёт кэш формулы, а обычная
+    ячейка — своё число. Поэтому отдельная загрузка с data_only=False не нужна:
+    сырое значение формулы — строка "=...", которую мы всё равно не берём.
+    """
+    from openpyxl import load_workbook
 
-        for row_num in range(2, ws_data.max_row + 1):
-            name = ws_data.cell(row_num, 2).value          # B: Название
-            category = ws_data.cell(row_num, 4).value      # D: Группа
-            subcategory = ws_data.cell(row_num, 5).value       # E: Подгруппа
-            product_category = ws_data.cell(row_num, 6).value  # F: Категория товара
-            brand = ws_data.cell(row_num, 20).value            # T: Бренд
-            gender = ws_data.cell(row_num, 21).value           # U: Пол
-            balance = ws_data.cell(row_num, 22).value          # V: Баланс
-            priority = ws_data.cell(row_num, 23).value         # W: Приоритет
-            image_urls = ws_data.cell(row_num, 7).value        # G: URL фото
-            local_images = ws_data.cell(row_num, 8).value      # H: Локальное фото
-            sizes = ws_data.cell(row_num, 9).value             # I: Размеры
-
-            # Берём цену: P(кэш) → P(сырое) → C(€)
-            price_cached = ws_data.cell(row_num, 16).value  # P: кэш формулы
-            price_raw = ws_raw.cell(row_num, 16).value      # P: сырое значение
-            price_eur = ws_data.cell(row_num, 3).value       # C: Цена (€)
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        products = []
 
+        for row_num, row in enumerate(ws.iter_rows(min_row=2, max_col=23, values_only=True), start=2):
+            if len(row) < 23:
+                row = tuple(row) + (None,) * (23 - len(row))
+
+            name = row[1]                  # B: Название
+            price_eur = row[2]             # C: Цена (€)
+            category = row[3]              # D: Группа
+            subcategory = row[4]           # E: Подгруппа
+            product_category = row[5]      # F: Категория товара
+            local_images = row[7]          # H: Локальное фото
+            sizes = row[8]                 # I: Размеры
+            price_rub = row[15]            # P: кэш формулы или число
+            brand = row[19]                # T: Бренд
+            gender = row[20]               # U: Пол
+            balance = row[21]              # V: Баланс
+            priority = row[22]             # W: Приоритет
+
+            # Берём цену: P → C(€)
             price = None
-            # 1. Кэшированное значение формулы (файл сохранён из Excel)
-            if price_cached and isinstance(price_cached, (int, float)) and price_cached > 0:
-                price = int(price_cached)
-            # 2. Сырое число в ячейке (не формула)
-            elif price_raw and isinstance(price_raw, (int, float)) and price_raw > 0:
-                price = int(price_raw)
-            # 3. Фоллбэк на цену в евро
+            if price_rub and isinstance(price_rub, (int, float)) and price_rub > 0:
+                price = int(price_rub)
             elif price_eur and isinstance(price_eur, (int, float)) and price_eur > 0:
                 price = int(price_eur)
 
@@ -400,18 +430,18 @@ def load_products_from_excel(file_path=None):
             image_to_use = "📦"  # По умолчанию placeholder эмодзи
             all_images = []  # Все фотографии для галереи
 
-            # Если есть локальные фотографии, используем первую
+            # Локальные фото могут быть разделены запятыми
             if local_images:
-                # Локальные фото могут быть разделены запятыми
-                local_photos = [img.strip() for img in local_images.split(',')]
-                if local_photos:
-                    # Создаем массив всех локальных фотографий для галереи
-                    for photo in local_photos:
-                        # Убираем префикс "images\" или "images/" если он есть
-                        photo_path = photo.replace('images\\', '').replace('images/', '')
-                        all_images.append(f"/images/{photo_path}")
-
-                    # Используем первую фотографию как основную
+                for photo in local_images.split(','):
+                    photo = photo.strip()
+                    if not photo:
+                        continue
+                    # Убираем префикс "images\" или "images/" если он есть
+                    photo_path = photo.replace('images\\', '').replace('images/', '')
+                    all_images.append(f"/images/{photo_path}")
+
+                # Используем первую фотографию как основную
+                if all_images:
                     image_to_use = all_images[0]
 
             # Парсим размеры в массив
@@ -422,2216 +452,5231 @@ def load_products_from_excel(file_path=None):
             products.append({
                 "id": row_num - 1,
                 "name": name,
-                "price": int(price) if price else 0,
+                "price": price,
                 "image": image_to_use,
                 "images": all_images if all_images else [image_to_use],
                 "sizes": sizes_array,
-                "category": category or "",
-                "subcategory": subcategory or "",
-                "product_category": product_category or "",
-                "brand": brand or "",
-                "gender": {"женские": "Женский", "мужские": "Мужской", "девочки": "Женский", "мальчики": "Мужской"}.get((gender or "").strip().lower(), gender) or "Унисекс",
-                "balance": balance or "",
+                # Текстовые поля — всегда строки: числа в ячейках (группа «2024»)
+                # иначе ломают сортировку и фильтры по значению
+                "category": str(category or ""),
+                "subcategory": str(subcategory or ""),
+                "product_category": str(product_category or ""),
+                "brand": str(brand or ""),
+                "gender": GENDER_ALIASES.get(str(gender or "").strip().lower(), str(gender or "")) or "Унисекс",
+                "balance": str(balance or ""),
                 "priority": int(priority) if priority and isinstance(priority, (int, float)) else 999,
             })
 
-        wb_data.close()
-        wb_raw.close()
+        return products
+    finally:
+        wb.close()
 
-        # Сортируем по приоритету (1 первым, 999 = без приоритета — в конец)
-        products.sort(key=lambda p: p['priority'])
 
-        if products:
-            PRODUCTS = products
-            print(f"✅ Загружено товаров из Excel: {len(products)}")
+def build_json_payload(data):
+    """
+    Сериализует данные в JSON один раз и сразу сжимает.
 
-            # Подсчитываем товары с фотографиями
-            with_photos = sum(1 for p in products if p['image'].startswith('/images/'))
-            print(f"   📸 Товаров с фотографиями: {with_photos}")
-            print(f"   📦 Товаров с эмодзи: {len(products) - with_photos}\n")
-        else:
-            print("⚠️  Excel файл пустой, используются стандартные товары\n")
-            PRODUCTS = PRODUCTS_DEFAULT
+    Возвращает словарь с ETag и телами для каждого Content-Encoding —
+    обработчик отдаёт готовые байты без json.dumps на каждый запрос.
+    """
+    import gzip
+    import hashlib
 
-    except Exception as e:
-        print(f"❌ Ошибка загрузки Excel: {e}")
-        print("   Используются стандартные товары\n")
-        PRODUCTS = PRODUCTS_DEFAULT
+    body = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    digest = hashlib.sha256(body).hexdigest()[:32]
 
-# ═══════════════════════════════════════════════════════════
-# 🤖 TELEGRAM БОТ
-# ═══════════════════════════════════════════════════════════
+    bodies = {"identity": body, "gzip": gzip.compress(body, compresslevel=9)}
+    if brotli is not None:
+        bodies["br"] = brotli.compress(body, quality=11)
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
+    return {
+        "etag": digest,
+        "bodies": bodies,
+    }
 
-bot = Bot(token=BOT_TOKEN)
-dp = Dispatcher()
 
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    Неизменяемая версия каталога.
 
-@dp.message(Command("start"))
-async def cmd_start(message: types.Message):
-    """Команда /start - показывает приветствие и кнопку магазина."""
-    # Проверяем параметр (из канала: /start catalog)
-    args = message.text.split(maxsplit=1)
-    from_channel = len(args) > 1 and args[1] == "catalog"
+    Собирается целиком до публикации, поэтому запрос видит либо старую,
+    либо новую версию — никогда не наполовину загруженную.
+    """
+    products: tuple          # Товары, уже отсортированные по приоритету
+    version: str             # Идентификатор версии (хэш JSON-тела)
+    with_photos: int         # Товаров с реальными фото
+    payload: dict            # Готовое тело /api/products (build_json_payload)
+    facets: dict             # Готовое тело /api/facets (build_json_payload)
+    index: dict              # Индексы для фильтров /api/products (build_catalog_index)
+    digests: tuple           # Хэш содержимого каждого товара (для ревизий)
+
+    @property
+    def total(self):
+        return len(self.products)
+
+
+def count_facet(counts, value):
+    """Увеличивает счётчик значения фасета (пустые значения не считаются)."""
+    if value is None or not str(value).strip():
+        return
+    value = str(value)
+    counts[value] = counts.get(value, 0) + 1
 
-    # Клавиатура с кнопками внизу
-    reply_keyboard = ReplyKeyboardMarkup(
-        keyboard=[
-            [
-                KeyboardButton(
-                    text="🛍 Каталог",
-                    web_app=WebAppInfo(url=WEBAPP_URL),
-                ),
-                KeyboardButton(
-                    text="📢 Наш канал",
-                ),
-            ]
+
+def build_facets(products, version):
+    """
+    Дерево фасетов для вкладок Mini App.
+
+    Группы → подгруппы, у каждого уровня — счётчики брендов; плюс общие
+    счётчики брендов, полов и список размеров. Клиент рисует вкладки
+    из этого дерева, не дожидаясь полного списка товаров, поэтому группы
+    и подгруппы идут в порядке первого появления — как в индексе клиента.
+    """
+    categories = {}
+    brands = {}
+    genders = {}
+    sizes = set()
+
+    for product in products:
+        brand = product.get('brand')
+        count_facet(brands, brand)
+        count_facet(genders, product.get('gender'))
+        sizes.update(str(size) for size in product.get('sizes') or ())
+
+        category = product.get('category')
+        if category is None or not str(category).strip():
+            continue
+        node = categories.setdefault(str(category), {"count": 0, "brands": {}, "subcategories": {}})
+        node["count"] += 1
+        count_facet(node["brands"], brand)
+
+        subcategory = product.get('subcategory')
+        if subcategory is None or not str(subcategory).strip():
+            continue
+        sub_node = node["subcategories"].setdefault(str(subcategory), {"count": 0, "brands": {}})
+        sub_node["count"] += 1
+        count_facet(sub_node["brands"], brand)
+
+    return {
+        "version": version,
+        "total": len(products),
+        "brands": brands,
+        "genders": genders,
+        "sizes": sorted(sizes),
+        "categories": [
+            {
+                "name": name,
+                "count": node["count"],
+                "brands": node["brands"],
+                "subcategories": [
+                    {"name": sub_name, **sub_node}
+                    for sub_name, sub_node in node["subcategories"].items()
+                ],
+            }
+            for name, node in categories.items()
         ],
-        resize_keyboard=True,
-        is_persistent=True,
-    )
+    }
 
-    if from_channel:
-        # Пришёл из канала — сразу показываем inline кнопку с Mini App
-        inline_keyboard = InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(
-                        text="🛍 Открыть каталог",
-                        web_app=WebAppInfo(url=WEBAPP_URL),
-                    )
-                ]
-            ]
-        )
-        await message.answer(
-            "🏐 <b>Добро пожаловать в NIMBLI!</b>\n\n"
-            "Нажми кнопку чтобы открыть каталог! 👇",
-            reply_markup=inline_keyboard,
-            parse_mode="HTML",
-        )
-        # Также ставим кнопку каталога внизу
-        await message.answer(
-            "Или используй кнопку внизу экрана ⬇️",
-            reply_markup=reply_keyboard,
-            parse_mode="HTML",
-        )
-    else:
-        await message.answer(
-            "🏐 <b>Добро пожаловать в NIMBLI!</b>\n\n"
-            "⚡ Твой спортивный магазин!\n"
-            "Нажми кнопку <b>🛍 Каталог</b> внизу экрана!",
-            reply_markup=reply_keyboard,
-            parse_mode="HTML",
-        )
 
+# Поля, по которым /api/products фильтрует на сервере (плюс size и q)
+CATALOG_FILTER_FIELDS = ("category", "subcategory", "brand", "gender")
 
-@dp.message(F.text == "📢 Наш канал")
-async def btn_channel(message: types.Message):
-    """Кнопка 'Наш канал' — ссылка на канал."""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="📢 Перейти в канал",
-                    url="https://t.me/nimbli_sport",
-                )
-            ]
-        ]
-    )
-    await message.answer(
-        "🏐 <b>NIMBLI</b> | Нишевый спорт из Европы\n\n"
-        "Подпишись на наш канал!",
-        reply_markup=keyboard,
-        parse_mode="HTML",
-    )
 
+def build_catalog_index(products):
+    """
+    Инвертированные индексы для серверных фильтров /api/products.
 
-@dp.message(Command("shop"))
-async def cmd_shop(message: types.Message):
-    """Команда /shop - открывает магазин."""
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🛍 Открыть магазин",
-                    web_app=WebAppInfo(url=WEBAPP_URL),
-                )
-            ]
-        ]
-    )
-    await message.answer(
-        "Нажми кнопку, чтобы открыть каталог:",
-        reply_markup=keyboard,
-    )
+    Значение поля → кортеж позиций товаров по возрастанию (то есть в
+    порядке выдачи), id → позиция для курсора и имена в нижнем регистре
+    для поиска.
+    """
+    fields = {field: {} for field in CATALOG_FILTER_FIELDS + ("size",)}
+    for pos, product in enumerate(products):
+        for field in CATALOG_FILTER_FIELDS:
+            value = product.get(field)
+            if value is not None and str(value).strip():
+                fields[field].setdefault(str(value), []).append(pos)
+        for size in product.get('sizes') or ():
+            fields["size"].setdefault(str(size), []).append(pos)
+
+    return {
+        "fields": {
+            field: {value: tuple(positions) for value, positions in values.items()}
+            for field, values in fields.items()
+        },
+        "positions": {product['id']: pos for pos, product in enumerate(products)},
+        "names": tuple(str(product.get('name') or '').lower() for product in products),
+    }
 
 
-CHANNEL_USERNAME = "@nimbli_sport"
+# Поля, которых нет в полном каталоге /api/products (только в страницах):
+# base64-превью плохо сжимаются и на тысячах товаров весят сотни КБ
+FULL_CATALOG_OMIT_FIELDS = ("lqip",)
 
-@dp.message(Command("post"))
-async def cmd_post(message: types.Message):
-    """Команда /post - в личке публикует в канал, в группе — прямо в группу."""
-    username = message.from_user.username
-    if username not in ADMIN_USERNAMES:
-        return
 
-    keyboard = InlineKeyboardMarkup(
-        inline_keyboard=[
-            [
-                InlineKeyboardButton(
-                    text="🛍 Открыть каталог",
-                    url="https://t.me/Catalog_Alex_bot?start=catalog",
-                )
-            ]
-        ]
-    )
+def full_catalog_item(product):
+    """Товар в виде полного каталога: без FULL_CATALOG_OMIT_FIELDS."""
+    return {key: value for key, value in product.items() if key not in FULL_CATALOG_OMIT_FIELDS}
 
-    post_text = (
-        "<b>NIMBLI</b> | Нишевый спорт из Европы 🏀\n\n"
-        "Падел | Волейбол | Теннис | Бег 🏸🏐🎾\n"
-        "— оригинальные бренды\n"
-        "— прямая поставка из Европы\n"
-        "— цены ниже рынка\n"
-        "— доставка почти до вашей двери 🔥"
+
+def make_catalog_snapshot(products):
+    """Строит CatalogSnapshot: статистика, JSON-тело и фасеты считаются один раз."""
+    products = tuple(products)
+    payload = build_json_payload([full_catalog_item(p) for p in products])
+    return CatalogSnapshot(
+        products=products,
+        version=payload["etag"],
+        with_photos=sum(1 for p in products if p['image'].startswith('/images/')),
+        payload=payload,
+        facets=build_json_payload(build_facets(products, payload["etag"])),
+        index=build_catalog_index(products),
+        digests=tuple(product_digest(p) for p in products),
     )
 
-    try:
-        if message.chat.type == "private":
-            # Из личных сообщений — публикуем в канал
-            await bot.send_message(
-                chat_id=CHANNEL_USERNAME,
-                text=post_text,
-                reply_markup=keyboard,
-                parse_mode="HTML",
-            )
-            await message.answer("✅ Пост опубликован в канал!")
-        else:
-            # Из группы — публикуем прямо в группу
-            await message.answer(
-                post_text,
-                reply_markup=keyboard,
-                parse_mode="HTML",
-            )
-            # Удаляем команду /post
-            try:
-                await message.delete()
-            except:
-                pass
-    except Exception as e:
-        await message.answer(f"❌ Ошибка публикации: {e}")
 
+def product_digest(product):
+    """Короткий хэш содержимого товара: меняется при любом изменении полей."""
+    import hashlib
 
-@dp.message(Command("reload"))
-async def cmd_reload(message: types.Message):
-    """Команда /reload - перезагружает каталог товаров из Excel."""
-    await message.answer("🔄 Перезагружаю каталог товаров...")
+    body = json.dumps(product, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(body.encode('utf-8')).hexdigest()[:16]
 
-    try:
-        load_products_from_excel()
-        await message.answer(
-            f"✅ Каталог обновлён!\n\n"
-            f"📦 Товаров: {len(PRODUCTS)}\n"
-            f"📸 С фото: {sum(1 for p in PRODUCTS if p['image'].startswith('/images/'))}"
-        )
-    except Exception as e:
-        await message.answer(f"❌ Ошибка обновления каталога:\n{str(e)}")
 
+def swap_catalog(snapshot):
+    """Публикует новую версию каталога одной заменой ссылки (и обновляет ревизии товаров)."""
+    global CATALOG, CATALOG_REVISIONS
+    previous = CATALOG_REVISIONS if CATALOG_REVISIONS is not None else load_catalog_revisions()
+    revisions = update_catalog_revisions(previous, snapshot)
+    if revisions is not previous:
+        save_catalog_revisions(revisions)
+    CATALOG_REVISIONS = revisions
+    CATALOG = snapshot
+    clear_image_cache()  # Папка images могла смениться вместе с каталогом
+    if WORKER_ID == 0:
+        # Владелец публикует каталог для остальных воркеров
+        publish_shared_catalog(snapshot, revisions)
+    return snapshot
 
-@dp.message(F.document)
-async def handle_document(message: types.Message):
-    """Обрабатывает загрузку архивов с каталогом товаров."""
-    # Проверяем права админа
-    username = message.from_user.username
-    if username not in ADMIN_USERNAMES:
-        await message.answer(
-            "🚫 <b>Доступ запрещён!</b>\n\n"
-            "Загружать каталог могут только администраторы.\n"
-            "Обратитесь к @AlexeyBakaev, @musyanya или @GussionHovo",
-            parse_mode="HTML"
-        )
-        logger.warning(
-            f"⚠️ Попытка загрузки каталога от неавторизованного пользователя: "
-            f"@{username} ({message.from_user.full_name})"
-        )
-        return
 
-    document = message.document
+# ═══════════════════════════════════════════════════════════
+# 🔁 РЕВИЗИИ ТОВАРОВ (дельта-синхронизация клиента)
+# ═══════════════════════════════════════════════════════════
+#
+# Каждая публикация каталога с изменениями увеличивает seq. Товар хранит
+# seq, в котором он последний раз изменился; удалённый — «надгробие» с
+# seq удаления. Клиент с копией каталога на seq=N спрашивает только то,
+# что изменилось после N. epoch меняется, если состояние потеряно, —
+# тогда клиент скачивает каталог целиком.
 
-    # Проверяем расширение файла (только ZIP для простоты)
-    if not document.file_name.endswith('.zip'):
-        await message.answer(
-            "⚠️ Пожалуйста, отправь ZIP архив с каталогом.\n\n"
-            "📝 Как создать архив:\n"
-            "  1. Положи в одну папку:\n"
-            "     • products_links.xlsx\n"
-            "     • папку images/\n"
-            "  2. Выдели оба → ПКМ → Отправить → Сжатая ZIP-папка\n\n"
-            "Структура архива:\n"
-            "  📁 catalog.zip\n"
-            "     ├── 📄 products_links.xlsx\n"
-            "     └── 📁 images/\n"
-            "          ├── 🖼 product_1.webp\n"
-            "          ├── 🖼 product_2.webp\n"
-            "          └── ..."
-        )
-        return
 
-    try:
-        await message.answer("📥 Скачиваю архив...")
+def new_catalog_revisions():
+    """Пустое состояние ревизий с новым epoch."""
+    import secrets
 
-        # Определяем где сохранять файлы (приоритет /data для Amvera)
-        data_path = Path('/data')
-        if data_path.exists() and data_path.is_dir():
-            # На Amvera - сохраняем в /data (persistenceMount)
-            extract_dir = data_path
-        else:
-            # Локально - сохраняем в папку со скриптом
-            extract_dir = Path(__file__).parent
+    return {"epoch": secrets.token_hex(8), "seq": 0, "products": {}, "removed": {}}
 
-        archive_path = extract_dir / document.file_name
 
-        await bot.download(document, destination=archive_path)
-        await message.answer("✅ Архив скачан, распаковываю...")
+def get_catalog_revisions_path():
+    return get_cache_dir() / 'catalog_revisions.json'
 
-        # Распаковываем ZIP
-        import zipfile
-        with zipfile.ZipFile(archive_path, 'r') as zip_ref:
-            zip_ref.extractall(extract_dir)
 
-        # Удаляем архив
-        archive_path.unlink()
+def load_catalog_revisions():
+    """Состояние ревизий с диска или новое (файла нет / битый)."""
+    try:
+        revisions = json.loads(get_catalog_revisions_path().read_text(encoding='utf-8'))
+        if {"epoch", "seq", "products", "removed"} <= set(revisions):
+            return revisions
+    except (OSError, ValueError, TypeError):
+        pass
+    return new_catalog_revisions()
 
-        await message.answer("✅ Архив распакован, обновляю каталог...")
 
-        # Перезагружаем товары
-        load_products_from_excel()
+def save_catalog_revisions(revisions):
+    """Атомарно сохраняет состояние ревизий."""
+    import os
 
-        await message.answer(
-            f"🎉 Каталог успешно обновлён!\n\n"
-            f"📦 Товаров: {len(PRODUCTS)}\n"
-            f"📸 С фотографиями: {sum(1 for p in PRODUCTS if p['image'].startswith('/images/'))}\n\n"
-            f"Используй /shop чтобы открыть магазин"
-        )
+    path = get_catalog_revisions_path()
+    tmp_path = path.with_name(path.name + '.tmp')
+    try:
+        tmp_path.write_text(json.dumps(revisions), encoding='utf-8')
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить ревизии каталога: {e}")
 
-    except zipfile.BadZipFile:
-        await message.answer("❌ Ошибка: файл повреждён или это не ZIP архив")
-    except Exception as e:
-        logger.error("Ошибка обработки архива: %s", e)
-        await message.answer(f"❌ Ошибка обработки архива:\n{str(e)}")
 
+def update_catalog_revisions(revisions, snapshot):
+    """
+    Сравнивает снимок с прошлыми ревизиями.
 
-@dp.message(F.web_app_data)
-async def handle_web_app_data(message: types.Message):
-    """Обрабатывает данные из Mini App (консультация)."""
-    print(f"\n🎯 WEB_APP_DATA ПОЛУЧЕН! Данные: {message.web_app_data.data[:200]}\n", flush=True)
-    try:
-        data = json.loads(message.web_app_data.data)
-        print(f"📦 Распарсено: {data}\n", flush=True)
-        action = data.get("action", "order")
-        items = data.get("items", [])
-        total = data.get("total", 0)
+    Возвращает новое состояние (seq + 1, новые и изменённые товары и
+    надгробия удалённых получают этот seq) или тот же объект, если
+    ничего не изменилось. Ключи — id товара строкой (как в JSON).
+    """
+    seq = revisions["seq"] + 1
+    old_products = revisions["products"]
+    products = {}
+    changed = False
+
+    for product, digest in zip(snapshot.products, snapshot.digests):
+        key = str(product['id'])
+        old = old_products.get(key)
+        if old is not None and old[1] == digest:
+            products[key] = old
+        else:
+            products[key] = [seq, digest]
+            changed = True
 
-        if not items:
-            await message.answer("❌ Вы не выбрали ни одного интересного товара!")
-            return
+    removed = {key: rev for key, rev in revisions["removed"].items() if key not in products}
+    for key in old_products:
+        if key not in products:
+            removed[key] = seq
+            changed = True
 
-        # Формируем список товаров для сообщения менеджеру
-        products_list = ""
-        for item in items:
-            rounded_price = math.ceil(item['price'] / 100) * 100
-            products_list += f"• {item['name']} — {rounded_price:,.0f} ₽\n".replace(',', ' ')
+    if not changed:
+        return revisions
+    return {"epoch": revisions["epoch"], "seq": seq, "products": products, "removed": removed}
 
-        # Формируем текст для предзаполнения в личке
-        rounded_total = math.ceil(total / 100) * 100
-        prefilled_text = f"Здравствуйте, подскажите о наличии товара:\n\n{products_list}\n💰 Общая стоимость: {rounded_total:,.0f} ₽".replace(',', ' ')
-        encoded_text = quote(prefilled_text)
 
-        # Показываем сообщение пользователю с выбором менеджера
-        message_text = "⭐ <b>Вас заинтересовали следующие товары:</b>\n\n"
+# ═══════════════════════════════════════════════════════════
+# 🗂 ОБЩИЙ СНИМОК КАТАЛОГА (несколько воркеров)
+# ═══════════════════════════════════════════════════════════
+#
+# Воркер-владелец после каждой публикации пишет каталог одним файлом:
+# MAGIC, длина заголовка, JSON-заголовок (версия, метка запуска, ETag,
+# ревизии, смещения) и подряд готовые тела /api/products и /api/facets
+# во всех кодировках плюс полный список товаров (с lqip) для страниц.
+# Остальные воркеры отображают файл через mmap и отдают тела прямо из
+# него — сжатые байты живут в page cache один раз на все процессы.
+# Общие только тела: товары и индексы фильтров каждый воркер разбирает
+# и строит у себя (это объекты Python, их не разделить между процессами),
+# зато без чтения Excel и без повторного сжатия.
 
-        for item in items:
-            rounded_price = math.ceil(item['price'] / 100) * 100
-            formatted_price = f"{rounded_price:,.0f}".replace(',', ' ')
-            message_text += (
-                f"<b>{item['name']}</b>\n"
-                f"💰 Цена: {formatted_price} ₽\n\n"
-            )
+SHARED_CATALOG_MAGIC = b"CATSNAP1"
+SHARED_CATALOG_POLL = 1.0  # Как часто воркеры проверяют, не обновился ли файл (с)
+SHARED_CATALOG_EXPORT_LOCK = threading.Lock()  # Экспорты по очереди: старый не перетрёт новый
 
-        formatted_total = f"{rounded_total:,.0f}".replace(',', ' ')
-        message_text += f"📊 <b>Общая стоимость: {formatted_total} ₽</b>\n\n"
-        message_text += (
-            "💬 <b>Выберите менеджера для консультации:</b>"
-        )
 
-        # Кнопки для связи с менеджерами (с предзаполненным текстом)
-        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
-            [types.InlineKeyboardButton(
-                text="👤 @AlexeyBakaev",
-                url=f"https://t.me/AlexeyBakaev?text={encoded_text}"
-            )],
-            [types.InlineKeyboardButton(
-                text="👤 @musyanya",
-                url=f"https://t.me/musyanya?text={encoded_text}"
-            )]
-        ])
+def get_shared_catalog_path():
+    return get_cache_dir() / 'catalog.shared'
 
-        await message.answer(message_text, parse_mode="HTML", reply_markup=keyboard)
 
-        # Логируем в консоль
-        logger.info(
-            "Запрос консультации от %s (@%s): %d товаров на %d ₽",
-            message.from_user.full_name,
-            message.from_user.username or "без username",
-            len(items),
-            total,
-        )
+def publish_shared_catalog(snapshot, revisions):
+    """
+    Экспортирует снимок в пуле ввода-вывода: JSON товаров и запись файла
+    на большом каталоге не должны держать event loop владельца.
+    Вне event loop (запуск, скрипты) — сразу.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        export_shared_catalog(snapshot, revisions)
+        return
+    loop.run_in_executor(get_io_executor(), export_shared_catalog, snapshot, revisions)
 
-    except (json.JSONDecodeError, KeyError) as e:
-        logger.error("Ошибка обработки данных: %s", e)
-        await message.answer("❌ Произошла ошибка при обработке данных.")
 
+def export_shared_catalog(snapshot, revisions):
+    """
+    Пишет общий снимок каталога (атомарно: временный файл + os.replace).
 
-# ═══════════════════════════════════════════════════════════
-# 🌐 ВЕБ-СЕРВЕР (раздаёт HTML и API)
-# ═══════════════════════════════════════════════════════════
+    Снимок, который успел смениться более новым, не пишется.
+    """
+    with SHARED_CATALOG_EXPORT_LOCK:
+        if snapshot is CATALOG:
+            write_shared_catalog(snapshot, revisions)
+
+
+def write_shared_catalog(snapshot, revisions):
+    import os
+
+    sections = {}
+    blobs = []
+    offset = 0
+    items = {"identity": json.dumps(snapshot.products, ensure_ascii=False, separators=(',', ':')).encode('utf-8')}
+    for name, bodies in (("products", snapshot.payload["bodies"]), ("facets", snapshot.facets["bodies"]), ("items", items)):
+        for encoding, body in bodies.items():
+            sections[f"{name}.{encoding}"] = [offset, len(body)]
+            blobs.append(body)
+            offset += len(body)
+
+    header = json.dumps({
+        "version": snapshot.version,
+        "generation": WORKER_GENERATION,
+        "with_photos": snapshot.with_photos,
+        "etags": {"products": snapshot.payload["etag"], "facets": snapshot.facets["etag"]},
+        "revisions": revisions,
+        "sections": sections,
+    }, ensure_ascii=False).encode('utf-8')
+
+    path = get_shared_catalog_path()
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(SHARED_CATALOG_MAGIC)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            for body in blobs:
+                f.write(body)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("⚠️  Не удалось записать общий снимок каталога: %s", e)
+
+
+def load_shared_catalog(path, generation=None):
+    """
+    Открывает общий снимок через mmap. Возвращает (CatalogSnapshot, ревизии)
+    или None, если снимок остался от другого запуска (метка generation).
 
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Магазин</title>
-    <script src="https://telegram.org/js/telegram-web-app.js"></script>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
+    Тела ответов — memoryview на отображение файла (без копий); товары
+    и индексы фильтров разбираются в памяти воркера.
+    """
+    import mmap
+
+    with open(path, 'rb') as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    if view[:len(SHARED_CATALOG_MAGIC)] != SHARED_CATALOG_MAGIC:
+        raise ValueError(f"не снимок каталога: {path}")
+
+    header_start = len(SHARED_CATALOG_MAGIC) + 4
+    header_len = int.from_bytes(view[len(SHARED_CATALOG_MAGIC):header_start], 'little')
+    header = json.loads(bytes(view[header_start:header_start + header_len]))
+    if header.get("generation") != generation:
+        return None
+    data_start = header_start + header_len
+
+    def payload(name):
+        bodies = {}
+        for section, (offset, length) in header["sections"].items():
+            prefix, _, encoding = section.partition(".")
+            if prefix == name:
+                bodies[encoding] = view[data_start + offset:data_start + offset + length]
+        return {"etag": header["etags"].get(name), "bodies": bodies}
+
+    products = tuple(loads_json(bytes(payload("items")["bodies"]["identity"])))
+    snapshot = CatalogSnapshot(
+        products=products,
+        version=header["version"],
+        with_photos=header["with_photos"],
+        payload=payload("products"),
+        facets=payload("facets"),
+        index=build_catalog_index(products),
+        digests=(),  # Ревизии считает только владелец
+    )
+    return snapshot, header["revisions"]
 
-        @keyframes fadeInUp {
-            from {
-                opacity: 0;
-                transform: translateY(20px);
-            }
-            to {
-                opacity: 1;
-                transform: translateY(0);
-            }
-        }
 
-        @keyframes pulse {
-            0%, 100% { transform: scale(1); }
-            50% { transform: scale(1.05); }
-        }
+def adopt_shared_catalog(snapshot, revisions):
+    """Публикует в этом воркере каталог из общего снимка (без пересчёта ревизий)."""
+    global CATALOG, CATALOG_REVISIONS
+    CATALOG_REVISIONS = revisions
+    CATALOG = snapshot
+    clear_image_cache()
+    return snapshot
 
-        @keyframes slideUp {
-            from {
-                opacity: 0;
-                transform: translateY(100%);
-            }
-            to {
-                opacity: 1;
-                transform: translateY(0);
-            }
-        }
 
-        @keyframes gradientShift {
-            0% {
-                background-position: 0% 50%;
-            }
-            50% {
-                background-position: 100% 50%;
-            }
-            100% {
-                background-position: 0% 50%;
-            }
-        }
+async def watch_shared_catalog(interval=SHARED_CATALOG_POLL):
+    """Следит за общим снимком и подхватывает новую версию (воркеры кроме владельца)."""
+    path = get_shared_catalog_path()
+    loop = asyncio.get_running_loop()
+    seen = None
+    while True:
+        try:
+            stat = path.stat()
+            key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            key = None
 
-        @keyframes float {
-            0%, 100% {
-                transform: translateY(0px);
-            }
-            50% {
-                transform: translateY(-20px);
-            }
-        }
+        if key is not None and key != seen:
+            try:
+                loaded = await loop.run_in_executor(
+                    get_io_executor(), load_shared_catalog, path, WORKER_GENERATION,
+                )
+                seen = key
+                if loaded is None:
+                    # Файл от прошлого запуска — ждём, пока владелец запишет свежий
+                    logger.debug("🗂 Воркер %s: общий снимок от другого запуска, жду владельца", WORKER_ID)
+                else:
+                    snapshot, revisions = loaded
+                    adopt_shared_catalog(snapshot, revisions)
+                    logger.info("🗂 Воркер %s: каталог %s (%d товаров)", WORKER_ID, snapshot.version[:8], snapshot.total)
+            except (OSError, ValueError) as e:
+                logger.warning("⚠️  Не удалось прочитать общий снимок каталога: %s", e)
+        await asyncio.sleep(interval)
 
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', sans-serif;
-            background: linear-gradient(-45deg, #e2e6ea, #d6dae0, #caced4, #dfe3e7);
-            background-size: 400% 400%;
-            animation: gradientShift 15s ease infinite;
-            color: #1a1a1a;
-            padding: 20px;
-            padding-bottom: 100px;
-            min-height: 100vh;
-            position: relative;
-            overflow-x: hidden;
-        }
 
-        body::before {
-            content: '';
-            position: fixed;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background: rgba(255, 255, 255, 0.2);
-            backdrop-filter: blur(100px);
-            pointer-events: none;
-            z-index: 0;
-        }
+# Версия формата снимка каталога: увеличь, если меняется разбор Excel
+CATALOG_SNAPSHOT_FORMAT = 2  # 2 — текстовые поля товаров всегда строки
 
-        .header {
-            text-align: center;
-            margin-bottom: 24px;
-            animation: fadeInUp 0.6s ease-out;
-            position: relative;
-            z-index: 1;
-        }
 
-        h1 {
-            font-size: 52px;
-            font-weight: 900;
-            margin-bottom: 8px;
-            color: white;
-            text-shadow:
-                0 2px 10px rgba(0,0,0,0.3),
-                0 4px 20px rgba(0,0,0,0.2),
-                0 0 40px rgba(255,215,0,0.3);
-            letter-spacing: 5px;
-            animation: float 3s ease-in-out infinite;
-            text-transform: uppercase;
-        }
+def get_catalog_snapshot_path(file_path):
+    """Путь к снимку каталога рядом с Excel: products_links.snapshot.json."""
+    return file_path.with_name(f"{file_path.stem}.snapshot.json")
 
-        .subtitle {
-            color: rgba(30, 30, 30, 0.85);
-            margin-bottom: 0;
-            font-size: 16px;
-            font-weight: 600;
-            text-shadow: 0 2px 10px rgba(255,255,255,0.5);
-            letter-spacing: 2px;
-        }
 
-        .categories-container {
-            margin: 32px auto 16px;
-            max-width: 100%;
-            animation: fadeInUp 0.8s ease-out 0.2s both;
-        }
+def file_sha256(file_path):
+    """SHA-256 содержимого файла (читается блоками)."""
+    import hashlib
 
-        .categories-tabs {
-            display: flex;
-            justify-content: center;
-            gap: 10px;
-            overflow-x: auto;
-            padding: 4px 20px 12px;
-            scrollbar-width: thin;
-            scrollbar-color: rgba(102, 126, 234, 0.3) transparent;
-        }
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        .categories-tabs::-webkit-scrollbar {
-            height: 4px;
-        }
 
-        .categories-tabs::-webkit-scrollbar-track {
-            background: transparent;
-        }
+def save_catalog_snapshot(file_path, products, sha256=None):
+    """
+    Сохраняет разобранный каталог рядом с Excel.
 
-        .categories-tabs::-webkit-scrollbar-thumb {
-            background: rgba(102, 126, 234, 0.3);
-            border-radius: 2px;
-        }
+    Снимок привязан к размеру, mtime и хэшу книги. Запись атомарная:
+    сначала во временный файл, потом os.replace.
+    """
+    import os
+
+    stat = file_path.stat()
+    snapshot = {
+        "format": CATALOG_SNAPSHOT_FORMAT,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "sha256": sha256 or file_sha256(file_path),
+        "products": products,
+    }
+    snapshot_path = get_catalog_snapshot_path(file_path)
+    tmp_path = snapshot_path.with_name(snapshot_path.name + ".tmp")
+    try:
+        tmp_path.write_text(json.dumps(snapshot, ensure_ascii=False), encoding='utf-8')
+        os.replace(tmp_path, snapshot_path)
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить снимок каталога: {e}")
 
-        .category-tab {
-            flex-shrink: 0;
-            padding: 10px 20px;
-            border: none;
-            border-radius: 20px;
-            background: rgba(255, 255, 255, 0.7);
-            backdrop-filter: blur(10px);
-            color: #2d3748;
-            font-size: 14px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.08);
-            white-space: nowrap;
-        }
 
-        .category-tab:hover {
-            background: rgba(255, 255, 255, 0.9);
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.12);
-        }
+def load_catalog_snapshot(file_path):
+    """
+    Возвращает товары из снимка, если Excel не менялся, иначе None.
 
-        .category-tab.active {
-            background: linear-gradient(135deg, #FFD700 0%, #DAA520 100%);
-            color: #2d3748;
-            box-shadow: 0 4px 15px rgba(255, 215, 0, 0.5);
-        }
+    Совпали размер и mtime — снимок берётся сразу. Изменился только mtime
+    (файл перезаписан тем же содержимым) — сверяем хэш и обновляем снимок.
+    """
+    snapshot_path = get_catalog_snapshot_path(file_path)
+    try:
+        snapshot = json.loads(snapshot_path.read_text(encoding='utf-8'))
+        stat = file_path.stat()
+    except (OSError, ValueError):
+        return None
 
-        .subcategories-container {
-            max-height: 0;
-            overflow: hidden;
-            transition: max-height 0.4s ease, opacity 0.3s ease;
-            opacity: 0;
-        }
+    if not isinstance(snapshot, dict) or snapshot.get("format") != CATALOG_SNAPSHOT_FORMAT:
+        return None
+    if snapshot.get("size") != stat.st_size:
+        return None
 
-        .subcategories-container.visible {
-            max-height: 60px;
-            opacity: 1;
-        }
+    products = snapshot.get("products")
+    if not isinstance(products, list):
+        return None
+    if snapshot.get("mtime_ns") == stat.st_mtime_ns:
+        return products
 
-        .subcategories-tabs {
-            display: flex;
-            gap: 8px;
-            padding: 0 20px 10px;
-            overflow-x: auto;
-            scrollbar-width: none;
-        }
-        .subcategories-tabs::-webkit-scrollbar {
-            display: none;
-        }
+    sha256 = file_sha256(file_path)
+    if snapshot.get("sha256") != sha256:
+        return None
+    save_catalog_snapshot(file_path, products, sha256=sha256)
+    return products
 
-        .subcategory-tab {
-            flex-shrink: 0;
-            padding: 6px 16px;
-            border: none;
-            border-radius: 16px;
-            background: rgba(255, 255, 255, 0.5);
-            color: #555;
-            font-size: 12px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            white-space: nowrap;
-        }
 
-        .subcategory-tab:hover {
-            background: rgba(255, 255, 255, 0.8);
-        }
+# Фото с отпечатком в URL не меняются никогда — кэшируем на год
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_VERSION_LENGTH = 16  # Символов sha256 в ?v=
 
-        .subcategory-tab.active {
-            background: rgba(255, 215, 0, 0.3);
-            color: #2d3748;
-            border: 1.5px solid rgba(218, 165, 32, 0.5);
-        }
 
-        .brands-container {
-            max-height: 0;
-            overflow: hidden;
-            transition: max-height 0.4s ease, opacity 0.3s ease;
-            opacity: 0;
-        }
+# Ширины готовых вариантов фото (parser_gui.py кладёт <имя>_w<ширина>.webp рядом)
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
 
-        .brands-container.visible {
-            max-height: 50px;
-            opacity: 1;
-        }
 
-        .brands-tabs {
-            display: flex;
-            justify-content: center;
-            gap: 6px;
-            padding: 0 20px 8px;
-            overflow-x: auto;
-            scrollbar-width: none;
-        }
+def is_content_addressed(path):
+    """
+    Имя файла — sha256 содержимого (images/ab/<sha256>.webp из parser_gui.py)
+    или вариант такого файла (<sha256>_w320.webp).
+    """
+    stem = Path(path).stem
+    base, sep, width = stem.rpartition('_w')
+    if sep and width.isdigit():
+        stem = base
+    return len(stem) == 64 and all(c in '0123456789abcdef' for c in stem)
 
-        .brands-tabs::-webkit-scrollbar {
-            display: none;
-        }
 
-        .brand-tab {
-            flex-shrink: 0;
-            padding: 5px 12px;
-            border: 1px solid rgba(0,0,0,0.1);
-            border-radius: 14px;
-            background: rgba(255, 255, 255, 0.5);
-            color: #666;
-            font-size: 11px;
-            font-weight: 600;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            white-space: nowrap;
-        }
+def load_image_index():
+    """Индекс хэшей фото: {путь: [размер, mtime_ns, sha256]}."""
+    try:
+        index = json.loads((get_cache_dir() / 'image_index.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    return index if isinstance(index, dict) else {}
 
-        .brand-tab:hover {
-            background: rgba(255, 255, 255, 0.8);
-        }
 
-        .brand-tab.active {
-            background: #2d3748;
-            color: white;
-            border-color: #2d3748;
-        }
+def save_image_index(index):
+    """Атомарно сохраняет индекс хэшей фото."""
+    import os
 
-        /* Фильтр размеров */
-        .size-filter-container {
-            max-height: 0;
-            overflow: hidden;
-            transition: max-height 0.4s ease, opacity 0.3s ease;
-            opacity: 0;
-            margin-top: 8px;
-        }
-        .size-filter-container.visible {
-            max-height: 200px;
-            opacity: 1;
-            overflow-y: auto;
-        }
-        .size-filter-header {
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            padding: 0 4px;
-            margin-bottom: 8px;
-        }
-        .size-filter-title {
-            font-size: 12px;
-            font-weight: 600;
-            color: var(--tg-theme-hint-color, #999);
-        }
-        .size-filter-reset {
-            font-size: 11px;
-            color: #667eea;
-            cursor: pointer;
-            border: none;
-            background: none;
-            padding: 2px 6px;
-        }
-        .size-filter-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(65px, 1fr));
-            gap: 6px;
-            padding: 0 4px;
-        }
-        .size-filter-btn {
-            padding: 7px 4px;
-            border: 1.5px solid rgba(0,0,0,0.12);
-            border-radius: 8px;
-            background: rgba(255,255,255,0.6);
-            font-size: 12px;
-            font-weight: 500;
-            color: #333;
-            cursor: pointer;
-            text-align: center;
-            transition: all 0.2s ease;
-        }
-        .size-filter-btn:hover {
-            border-color: rgba(0,0,0,0.25);
-        }
-        .size-filter-btn.active {
-            background: #2d3748;
-            color: white;
-            border-color: #2d3748;
-        }
+    index_path = get_cache_dir() / 'image_index.json'
+    tmp_path = index_path.with_name(index_path.name + '.tmp')
+    try:
+        tmp_path.write_text(json.dumps(index), encoding='utf-8')
+        os.replace(tmp_path, index_path)
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить индекс фото: {e}")
 
-        /* Фильтр по полу */
-        .gender-filter-container {
-            display: flex;
-            gap: 8px;
-            justify-content: center;
-            margin-top: 10px;
-            padding: 0 4px;
-            overflow-x: auto;
-            scrollbar-width: none;
-        }
-        .gender-filter-container::-webkit-scrollbar {
-            display: none;
-        }
-        .gender-tab {
-            flex-shrink: 0;
-            padding: 5px 14px;
-            border: 1px solid rgba(0,0,0,0.1);
-            border-radius: 14px;
-            background: rgba(255,255,255,0.5);
-            font-size: 12px;
-            font-weight: 500;
-            color: #555;
-            cursor: pointer;
-            transition: all 0.2s ease;
-        }
-        .gender-tab.active {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            border-color: transparent;
-        }
 
-        /* Бейдж баланса на карточке */
-        .priority-badge {
-            position: absolute;
-            top: 8px;
-            left: 8px;
-            padding: 3px 8px;
-            border-radius: 6px;
-            font-size: 10px;
-            font-weight: 700;
-            z-index: 10;
-            color: white;
-            text-transform: uppercase;
-            letter-spacing: 0.5px;
-        }
-        .priority-badge.hot {
-            background: linear-gradient(135deg, #ff416c 0%, #ff4b2b 100%);
-        }
-        .priority-badge.new {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-        }
+# Размытое превью-заглушка (LQIP): ширина в пикселях и качество WebP
+LQIP_WIDTH = 16
+LQIP_QUALITY = 30
 
-        .search-container {
-            margin: 20px auto 24px;
-            max-width: 600px;
-            animation: fadeInUp 0.8s ease-out 0.3s both;
-        }
 
-        .search-wrapper {
-            position: relative;
-            display: flex;
-            align-items: center;
-        }
+def make_lqip(image_path):
+    """
+    Крошечное превью фото как data: URI (16px WebP, ~100–300 байт)
+    и его средний цвет "#rrggbb".
 
-        .search-icon {
-            position: absolute;
-            left: 18px;
-            font-size: 20px;
-            opacity: 0.6;
-            pointer-events: none;
-            z-index: 2;
-        }
+    Сетка показывает превью (или просто цвет) размытым, пока грузится
+    настоящее фото. ["", ""] — если фото не открылось (запоминается, чтобы
+    не пробовать на каждой загрузке).
+    """
+    import base64
+    from PIL import Image, ImageOps
 
-        .search-input {
-            width: 100%;
-            padding: 16px 50px 16px 52px;
-            font-size: 16px;
-            border: none;
-            border-radius: 20px;
-            background: rgba(255, 255, 255, 0.85);
-            backdrop-filter: blur(10px);
-            box-shadow:
-                0 4px 20px rgba(0, 0, 0, 0.1),
-                inset 0 1px 0 rgba(255, 255, 255, 0.9);
-            transition: all 0.3s ease;
-            font-family: inherit;
-            color: #333;
-        }
+    try:
+        with Image.open(image_path) as image:
+            image = ImageOps.exif_transpose(image).convert("RGB")
+            image.thumbnail((LQIP_WIDTH, LQIP_WIDTH * 4))
+            buffer = io.BytesIO()
+            image.save(buffer, "WEBP", quality=LQIP_QUALITY)
+            red, green, blue = image.resize((1, 1), Image.BOX).getpixel((0, 0))
+    except Exception:
+        return ["", ""]
+    uri = "data:image/webp;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+    return [uri, f"#{red:02x}{green:02x}{blue:02x}"]
 
-        .search-input:focus {
-            outline: none;
-            background: rgba(255, 255, 255, 0.95);
-            box-shadow:
-                0 6px 30px rgba(0, 0, 0, 0.15),
-                inset 0 1px 0 rgba(255, 255, 255, 1),
-                0 0 0 3px rgba(129, 212, 250, 0.3);
-            transform: translateY(-2px);
-        }
 
-        .search-input::placeholder {
-            color: rgba(0, 0, 0, 0.4);
-        }
+def load_lqip_cache():
+    """Кэш LQIP по sha256 фото: {хэш: [data URI, средний цвет]}."""
+    try:
+        cache = json.loads((get_cache_dir() / 'lqip.json').read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
 
-        .clear-search {
-            position: absolute;
-            right: 18px;
-            font-size: 20px;
-            color: rgba(0, 0, 0, 0.5);
-            cursor: pointer;
-            padding: 4px 8px;
-            border-radius: 50%;
-            transition: all 0.2s ease;
-            z-index: 2;
-        }
+
+def save_lqip_cache(cache):
+    """Атомарно сохраняет кэш LQIP."""
+    import os
+
+    cache_path = get_cache_dir() / 'lqip.json'
+    tmp_path = cache_path.with_name(cache_path.name + '.tmp')
+    try:
+        tmp_path.write_text(json.dumps(cache), encoding='utf-8')
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"⚠️  Не удалось сохранить кэш превью: {e}")
+
+
+def prepare_image_urls(products, images_dir):
+    """
+    Готовит URL фото для API.
+
+    К каждому URL добавляется отпечаток содержимого: /images/x.webp?v=<хэш>.
+    Такие URL отдаются с Cache-Control immutable: новое фото — новый URL.
+    Файлы из хранилища по хэшам уже неизменны и остаются как есть.
+    Хэши остальных берутся из индекса (пересчёт только при смене размера
+    или mtime).
+
+    Если рядом с основным фото есть готовые варианты (<имя>_w320.webp),
+    товар получает srcset: {ширина: URL}. И всегда — lqip: крошечное
+    размытое превью и color: его средний цвет (см. make_lqip), посчитанные
+    один раз на хэш фото. lqip уходит только в страницы /api/products,
+    в полный каталог — лишь color (см. FULL_CATALOG_OMIT_FIELDS).
+    """
+    index = load_image_index()
+    index_changed = False
+    urls = {}
+    digests = {}  # URL без отпечатка → sha256 содержимого
+
+    def fingerprint(url):
+        nonlocal index_changed
+        if not url.startswith('/images/') or url in urls:
+            return urls.get(url, url)
+
+        rel = url[len('/images/'):]
+        result = url
+        if is_content_addressed(rel):
+            digests[url] = Path(rel).stem
+        else:
+            file_path = images_dir / rel
+            try:
+                stat = file_path.stat()
+            except OSError:
+                stat = None
+            if stat is not None:
+                entry = index.get(rel)
+                if not entry or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+                    entry = [stat.st_size, stat.st_mtime_ns, file_sha256(file_path)]
+                    index[rel] = entry
+                    index_changed = True
+                digests[url] = entry[2]
+                result = f"{url}?v={entry[2][:IMAGE_VERSION_LENGTH]}"
+        urls[url] = result
+        return result
+
+    def variants(url):
+        base = Path(url[len('/images/'):])
+        srcset = {}
+        for width in IMAGE_VARIANT_WIDTHS:
+            rel = base.with_name(f"{base.stem}_w{width}.webp").as_posix()
+            if (images_dir / rel).is_file():
+                srcset[width] = fingerprint(f"/images/{rel}")
+        return srcset
+
+    lqips = load_lqip_cache()
+    lqips_changed = False
+
+    def lqip(url):
+        nonlocal lqips_changed
+        digest = digests.get(url)
+        if digest is None:
+            return None
+        if not isinstance(lqips.get(digest), list):  # Нет или старый формат (только URI)
+            lqips[digest] = make_lqip(images_dir / url[len('/images/'):])
+            lqips_changed = True
+        return lqips[digest]
+
+    prepared = []
+    for product in products:
+        if product['image'].startswith('/images/'):
+            product = dict(product)
+            srcset = variants(product['image'])
+            if srcset:
+                product['srcset'] = srcset
+            main_image = product['image']
+            product['image'] = fingerprint(main_image)
+            product['images'] = [fingerprint(url) for url in product['images']]
+            placeholder = lqip(main_image)
+            if placeholder and placeholder[0]:
+                product['lqip'], product['color'] = placeholder
+        prepared.append(product)
+
+    if index_changed:
+        save_image_index(index)
+    if lqips_changed:
+        save_lqip_cache(lqips)
+    return prepared
+
+
+def get_excel_path():
+    """Путь к Excel каталога: /data (Amvera), иначе папка со скриптом."""
+    # Проверяем /data/products_links.xlsx (persistenceMount на Amvera)
+    data_path = Path('/data')
+    if data_path.exists() and data_path.is_dir():
+        data_excel = data_path / "products_links.xlsx"
+        if data_excel.exists():
+            return data_excel
+
+    # Локальная разработка или fallback: папка со скриптом
+    return Path(__file__).parent / "products_links.xlsx"
+
+
+def build_catalog(file_path=None, images_dir=None, strict=False):
+    """
+    Собирает CatalogSnapshot из Excel, не трогая текущий каталог.
+
+    images_dir — откуда брать фото для отпечатков URL (по умолчанию живая
+    папка; при загрузке архива — staging). Если Excel нет, он пустой или
+    битый — снимок из стандартных товаров. С strict=True вместо этого
+    ValueError: загруженный архив отклоняется, живой каталог не трогается.
+    """
+    file_path = get_excel_path() if file_path is None else Path(file_path)
+    images_dir = get_images_dir() if images_dir is None else Path(images_dir)
+
+    if not file_path.exists():
+        if strict:
+            raise ValueError(f"Нет файла {file_path.name}")
+        print(f"📦 Excel файл не найден: {file_path}")
+        print("   Используются стандартные товары")
+        print("   Для управления товарами через Excel:")
+        print("   1. Запусти: python parser_gui.py")
+        print("   2. Создай шаблон и заполни ссылки")
+        print("   3. Спарси товары")
+        print("   4. Перезапусти мини-апп\n")
+        return make_catalog_snapshot(PRODUCTS_DEFAULT)
+
+    try:
+        # Проверяем openpyxl
+        try:
+            import openpyxl
+        except ImportError:
+            print("📦 Устанавливаю openpyxl...")
+            subprocess.check_call([sys.executable, '-m', 'pip', 'install', 'openpyxl'])
+            import openpyxl
+
+        # Excel не менялся — берём готовый снимок без разбора XLSX
+        products = load_catalog_snapshot(file_path)
+        if products is not None:
+            print("⚡ Каталог загружен из снимка (Excel не менялся)")
+        else:
+            products = read_products_from_workbook(file_path)
+
+            # Сортируем по приоритету (1 первым, 999 = без приоритета — в конец)
+            products.sort(key=lambda p: p['priority'])
+
+            if products:
+                save_catalog_snapshot(file_path, products)
+
+        if not products:
+            if strict:
+                raise ValueError(f"В {file_path.name} нет ни одного товара")
+            print("⚠️  Excel файл пустой, используются стандартные товары\n")
+            return make_catalog_snapshot(PRODUCTS_DEFAULT)
+
+        catalog = make_catalog_snapshot(prepare_image_urls(products, images_dir))
+        print(f"✅ Загружено товаров из Excel: {catalog.total}")
+        print(f"   📸 Товаров с фотографиями: {catalog.with_photos}")
+        print(f"   📦 Товаров с эмодзи: {catalog.total - catalog.with_photos}\n")
+        return catalog
+
+    except Exception as e:
+        if strict:
+            if isinstance(e, ValueError):
+                raise
+            raise ValueError(f"Не удалось прочитать {file_path.name}: {e}") from e
+        print(f"❌ Ошибка загрузки Excel: {e}")
+        print("   Используются стандартные товары\n")
+        return make_catalog_snapshot(PRODUCTS_DEFAULT)
+
+
+def load_products_from_excel(file_path=None):
+    """Загружает товары из Excel и публикует их как текущий каталог."""
+    return swap_catalog(build_catalog(file_path))
+
+
+# ═══════════════════════════════════════════════════════════
+# ⚙️  ФОНОВЫЕ ЗАДАЧИ (вне event loop)
+# ═══════════════════════════════════════════════════════════
+
+# Разбор Excel — в отдельном процессе (CPU, не держит GIL основного),
+# распаковка архивов — в потоке (диск). Оба пула создаются лениво.
+PARSE_EXECUTOR = None
+IO_EXECUTOR = None
+
+# Как часто обновлять сообщение о прогрессе в чате админа (сек)
+PROGRESS_INTERVAL = 3
+
+
+def get_parse_executor():
+    """Пул процессов для разбора каталога (один воркер, spawn на всех ОС)."""
+    global PARSE_EXECUTOR
+    if PARSE_EXECUTOR is None:
+        PARSE_EXECUTOR = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return PARSE_EXECUTOR
+
+
+def get_io_executor():
+    """Пул потоков для распаковки архивов и работы с файлами."""
+    global IO_EXECUTOR
+    if IO_EXECUTOR is None:
+        IO_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="catalog-io")
+    return IO_EXECUTOR
+
+
+def shutdown_executors():
+    """Останавливает фоновые пулы при выходе."""
+    global PARSE_EXECUTOR, IO_EXECUTOR, THUMB_EXECUTOR
+    for executor in (PARSE_EXECUTOR, IO_EXECUTOR, THUMB_EXECUTOR):
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+    PARSE_EXECUTOR = None
+    IO_EXECUTOR = None
+    THUMB_EXECUTOR = None
+
+
+async def run_with_progress(executor, func, *args, status=None, text=""):
+    """
+    Выполняет func(*args) в пуле и ждёт результат, не блокируя event loop.
+
+    Если передано сообщение status — раз в PROGRESS_INTERVAL секунд
+    дописывает в него, сколько уже идёт работа.
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.run_in_executor(executor, func, *args)
+    started = time.monotonic()
+
+    while True:
+        done, _ = await asyncio.wait({future}, timeout=PROGRESS_INTERVAL)
+        if done:
+            return future.result()
+        if status is not None:
+            try:
+                await status.edit_text(f"{text} ({int(time.monotonic() - started)} с)")
+            except Exception:
+                pass  # Прогресс не критичен (например, текст не изменился)
+
+
+async def reload_catalog(file_path=None, status=None, publish=True, images_dir=None, strict=False):
+    """
+    Перезагружает каталог вне event loop и публикует его атомарно.
+
+    Разбор идёт в пуле процессов; пока он работает, запросы обслуживаются
+    из предыдущей версии. Если пул процессов недоступен — разбор в потоке.
+    С publish=False снимок только собирается (для подмены позже),
+    strict=True — см. build_catalog.
+    """
+    text = "🔄 Читаю Excel и собираю каталог..."
+    if status is not None:
+        await status.edit_text(text)
+
+    try:
+        catalog = await run_with_progress(
+            get_parse_executor(), build_catalog, file_path, images_dir, strict, status=status, text=text,
+        )
+    except (BrokenProcessPool, OSError) as e:
+        global PARSE_EXECUTOR
+        logger.warning("Пул процессов недоступен (%s), разбираю каталог в потоке", e)
+        PARSE_EXECUTOR = None
+        catalog = await run_with_progress(
+            get_io_executor(), build_catalog, file_path, images_dir, strict, status=status, text=text,
+        )
+    return swap_catalog(catalog) if publish else catalog
+
+
+# ═══════════════════════════════════════════════════════════
+# 📥 ПРИЁМ АРХИВА КАТАЛОГА (staging → проверка → подмена папок)
+# ═══════════════════════════════════════════════════════════
+
+# Ограничения на содержимое архива
+MAX_ARCHIVE_ENTRIES = 20000
+MAX_ENTRY_SIZE = 25 * 1024 * 1024          # 25 МБ на файл
+MAX_UNPACKED_SIZE = 2 * 1024 * 1024 * 1024  # 2 ГБ всего
+
+EXCEL_NAME = "products_links.xlsx"
+MANIFEST_NAME = "manifest.json"  # Хэши фото, кладёт parser_gui.py
+
+# Сигнатуры начала файла для проверки, что это действительно картинка
+IMAGE_SIGNATURES = {
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.webp': (b'RIFF',),
+    '.avif': (b'',),  # Проверяется по ftyp в is_valid_image_header
+}
+
+
+def is_valid_image_header(ext, header):
+    """Быстрая проверка, что байты похожи на картинку своего формата."""
+    signatures = IMAGE_SIGNATURES.get(ext)
+    if not signatures or not header.startswith(signatures):
+        return False
+    if ext == '.webp' and header[8:12] != b'WEBP':
+        return False
+    if ext == '.avif' and (header[4:8] != b'ftyp' or header[8:12] not in (b'avif', b'avis')):
+        return False
+    return True
+
+
+def is_decodable_image(path):
+    """
+    Проверяет, что картинка целиком читается Pillow: verify() — структура
+    файла, затем декодирование (JPEG — в уменьшенном масштабе через draft),
+    чтобы поймать обрезанные данные. Форматы, которых эта сборка Pillow не
+    знает, остаются на проверке сигнатуры.
+    """
+    from PIL import Image
+
+    if path.suffix.lower() not in Image.registered_extensions():
+        return True
+    try:
+        with Image.open(path) as img:
+            img.verify()
+        with Image.open(path) as img:
+            img.draft('RGB', (64, 64))
+            img.load()
+    except Exception:
+        return False
+    return True
+
+
+def classify_archive_entry(name):
+    """
+    Определяет, куда распаковать файл архива.
+
+    Возвращает относительный путь внутри staging (Path) или None, если файл
+    не нужен (служебные файлы macOS, лишние документы). Пути с выходом
+    за пределы архива — ошибка.
+    """
+    from pathlib import PurePosixPath
+
+    name = name.replace('\\', '/')
+    path = PurePosixPath(name)
+    parts = path.parts
+    if path.is_absolute() or '..' in parts or (parts and ':' in parts[0]):
+        raise ValueError(f"Недопустимый путь в архиве: {name}")
+
+    if not parts or parts[0] == '__MACOSX' or parts[-1].startswith('.'):
+        return None
+
+    # Архив мог быть сделан из папки: catalog/products_links.xlsx
+    if len(parts) > 1 and parts[0] != 'images' and parts[1:2] in ((EXCEL_NAME,), (MANIFEST_NAME,), ('images',)):
+        parts = parts[1:]
+
+    if parts in ((EXCEL_NAME,), (MANIFEST_NAME,)):
+        return Path(parts[0])
+    if len(parts) >= 2 and parts[0] == 'images' and path.suffix.lower() in IMAGE_SIGNATURES:
+        return Path(*parts)
+    return None
+
+
+def read_archive_manifest(zip_ref, entries):
+    """Читает manifest.json из архива или возвращает None (старые архивы)."""
+    for info in entries:
+        if classify_archive_entry(info.filename) == Path(MANIFEST_NAME):
+            if info.file_size > MAX_ENTRY_SIZE:
+                raise ValueError("manifest.json слишком большой")
+            try:
+                manifest = json.loads(zip_ref.read(info))
+            except ValueError:
+                raise ValueError("manifest.json повреждён")
+            if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+                raise ValueError("manifest.json без списка файлов")
+            return manifest
+    return None
+
+
+def live_image_digests(images_dir, rels):
+    """
+    sha256 фото из живой папки: {путь внутри images: хэш}.
+
+    Хэши берутся из индекса (см. load_image_index) и пересчитываются только
+    для файлов, у которых сменился размер или mtime.
+    """
+    index = load_image_index()
+    changed = False
+    digests = {}
+    for rel in rels:
+        path = images_dir / rel
+        stat = path.stat()
+        entry = index.get(rel)
+        if not entry or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+            entry = [stat.st_size, stat.st_mtime_ns, file_sha256(path)]
+            index[rel] = entry
+            changed = True
+        digests[rel] = entry[2]
+    if changed:
+        save_image_index(index)
+    return digests
+
+
+def build_live_manifest(images_dir):
+    """Манифест фото, которые сейчас на сервере (формат manifest.json из parser_gui.py)."""
+    rels = sorted(
+        path.relative_to(images_dir).as_posix()
+        for path in images_dir.rglob('*')
+        if path.is_file() and not path.name.startswith('.')
+    )
+    digests = live_image_digests(images_dir, rels)
+    return {"format": 1, "files": {f"images/{rel}": digests[rel] for rel in rels}}
+
+
+def link_unchanged_images(manifest, staged, staging_dir, live_images_dir):
+    """
+    Достраивает staging/images для архива изменений.
+
+    Фото из манифеста, которых нет в архиве, берутся из живой папки жёсткой
+    ссылкой (без копирования байтов); если ссылки не поддерживаются — копией.
+    Хэш каждого такого фото сверяется с манифестом: архив, собранный не от
+    текущего состояния сервера, отклоняется. Фото, которых нет в манифесте,
+    в новую папку не попадают — так удаляются.
+    """
+    import os
+    import shutil
+
+    (staging_dir / 'images').mkdir(parents=True, exist_ok=True)
+    pending = []
+    for name in manifest["files"]:
+        target = classify_archive_entry(name)
+        if target is None or target.parts[0] != 'images' or target in staged:
+            continue
+        rel = Path(*target.parts[1:]).as_posix()
+        if not (live_images_dir / rel).is_file():
+            raise ValueError(f"Нет фото {name} на сервере — отправь полный архив")
+        pending.append((name, target, rel))
+
+    digests = live_image_digests(live_images_dir, [rel for _, _, rel in pending])
+    for name, target, rel in pending:
+        if digests[rel] != manifest["files"][name]:
+            raise ValueError(f"Фото {name} на сервере отличается от манифеста — отправь полный архив")
+
+    for name, target, rel in pending:
+        source = live_images_dir / rel
+        dest = staging_dir / target
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, dest)
+        except OSError:
+            shutil.copy2(source, dest)
+    return len(pending)
+
+
+def stage_catalog_archive(archive_path, staging_dir, live_images_dir=None):
+    """
+    Проверяет архив и распаковывает нужные файлы в staging_dir.
+
+    Файлы пишутся потоково с контролем реального размера (защита от
+    zip-бомб), картинки проверяются по сигнатуре, декодированием (Pillow)
+    и по хэшу из manifest.json.
+    Архив изменений (mode=delta) дополняется неизменёнными фото из
+    live_images_dir. Живые данные не трогаются.
+    Возвращает {"excel": bool, "images": int, "linked": int, "skipped": int, "mode": str}.
+    """
+    import hashlib
+
+    summary = {"excel": False, "images": 0, "linked": 0, "skipped": 0, "mode": "full"}
+    staged = set()
+    unpacked = 0
+
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        entries = [info for info in zip_ref.infolist() if not info.is_dir()]
+        if len(entries) > MAX_ARCHIVE_ENTRIES:
+            raise ValueError(f"Слишком много файлов в архиве: {len(entries)}")
+
+        manifest = read_archive_manifest(zip_ref, entries)
+        if manifest is not None:
+            summary["mode"] = manifest.get("mode", "full")
+        expected = manifest["files"] if manifest is not None else {}
+
+        for info in entries:
+            target = classify_archive_entry(info.filename)
+            if target is None:
+                summary["skipped"] += 1
+                continue
+            if target == Path(MANIFEST_NAME):
+                continue
+            if info.file_size > MAX_ENTRY_SIZE:
+                raise ValueError(f"Файл слишком большой: {info.filename}")
+            unpacked += info.file_size
+            if unpacked > MAX_UNPACKED_SIZE:
+                raise ValueError("Архив слишком большой после распаковки")
+
+            is_image = target.parts[0] == 'images'
+            dest = staging_dir / target
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            digest = hashlib.sha256()
+            with zip_ref.open(info) as src, open(dest, 'wb') as dst:
+                header = src.read(16)
+                if is_image and not is_valid_image_header(dest.suffix.lower(), header):
+                    raise ValueError(f"Файл не похож на картинку: {info.filename}")
+                dst.write(header)
+                digest.update(header)
+                written = len(header)
+                for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                    written += len(chunk)
+                    if written > info.file_size:
+                        raise ValueError(f"Размер файла не совпадает с заявленным: {info.filename}")
+                    dst.write(chunk)
+                    digest.update(chunk)
+
+            if is_image:
+                name = target.as_posix()
+                if name in expected and expected[name] != digest.hexdigest():
+                    raise ValueError(f"Хэш не совпадает с manifest.json: {info.filename}")
+                if not is_decodable_image(dest):
+                    raise ValueError(f"Картинка повреждена или обрезана: {info.filename}")
+                staged.add(target)
+                summary["images"] += 1
+            else:
+                summary["excel"] = True
+
+    if summary["mode"] == "delta":
+        if live_images_dir is None:
+            raise ValueError("Архив изменений нельзя применить: нет текущей папки images")
+        summary["linked"] = link_unchanged_images(manifest, staged, staging_dir, live_images_dir)
+    elif not summary["excel"] and not summary["images"]:
+        raise ValueError(f"В архиве нет {EXCEL_NAME} и папки images/")
+
+    # Сам архив больше не нужен — освобождаем место до подмены
+    archive_path.unlink()
+    return summary
+
+
+IMAGES_VERSIONS_DIR = ".images_versions"  # Версии папки фото; images — симлинк на текущую
+
+
+def swap_images_dir(staged_images, data_dir, old_dir):
+    """
+    Атомарно переключает data_dir/images на staged_images.
+
+    images — симлинк на версию в .images_versions; подмена — один
+    os.replace временного симлинка, так что запросы всегда видят либо
+    старую, либо новую папку целиком. Прежняя версия уезжает в old_dir.
+    Обычная папка images (первый запуск) один раз переносится в версии.
+    Без симлинков (Windows без прав) — два переименования, как раньше.
+    """
+    import os
+
+    live_images = data_dir / 'images'
+    versions_dir = data_dir / IMAGES_VERSIONS_DIR
+    versions_dir.mkdir(exist_ok=True)
+    version = versions_dir / f"images_{time.time_ns()}"
+    os.replace(staged_images, version)
+
+    previous = None
+    if live_images.is_symlink():
+        previous = live_images.resolve()
+    elif live_images.exists():
+        previous = versions_dir / f"images_{time.time_ns()}_legacy"
+        os.replace(live_images, previous)
+
+    tmp_link = data_dir / f".images_link_{os.getpid()}"
+    try:
+        if tmp_link.is_symlink():
+            tmp_link.unlink()
+        os.symlink(Path(IMAGES_VERSIONS_DIR) / version.name, tmp_link, target_is_directory=True)
+    except OSError:
+        if live_images.is_symlink():
+            live_images.unlink()
+        os.replace(version, live_images)
+    else:
+        os.replace(tmp_link, live_images)
+
+    if previous is not None and previous.exists() and previous.parent == versions_dir:
+        os.replace(previous, old_dir)
+
+
+def swap_catalog_dirs(staging_dir, data_dir):
+    """
+    Подменяет живые images/ и Excel подготовленными из staging.
+
+    Только переименования внутри одной файловой системы — время не зависит
+    от размера архива. Фото переключаются атомарно (см. swap_images_dir),
+    старая версия уезжает в staging и удаляется потом вместе с ним.
+    """
+    import os
+
+    staged_images = staging_dir / 'images'
+    if staged_images.is_dir():
+        swap_images_dir(staged_images, data_dir, staging_dir / 'images_old')
+
+    staged_excel = staging_dir / EXCEL_NAME
+    if staged_excel.exists():
+        live_excel = data_dir / EXCEL_NAME
+        staged_snapshot = get_catalog_snapshot_path(staged_excel)
+        if staged_snapshot.exists():
+            os.replace(staged_snapshot, get_catalog_snapshot_path(live_excel))
+        os.replace(staged_excel, live_excel)
+
+# ═══════════════════════════════════════════════════════════
+# 📝 ЛОГИРОВАНИЕ
+# ═══════════════════════════════════════════════════════════
+#
+# Обработчики только кладут запись в очередь (QueueHandler), а вывод в
+# stdout идёт в отдельном потоке (QueueListener) — event loop не ждёт
+# запись в консоль. «Горячие» логгеры прореживаются: из INFO-записей
+# проходит каждая N-я. Полные тела обновлений — только на DEBUG.
+
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = "text"            # "text" или "json" (одна JSON-строка на запись)
+WEBHOOK_LOGGER_NAME = f"{__name__}.webhook"
+LOG_SAMPLE_EVERY = {
+    "aiohttp.access": 20,          # Каждый 20-й запрос (фото, API)
+    WEBHOOK_LOGGER_NAME: 10,       # Каждое 10-е обновление
+}
+
+LOG_LISTENER = None  # QueueListener (см. setup_logging)
+
+
+class JsonLogFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение и поля из extra."""
+
+    RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in self.RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает каждую N-ю INFO-запись для логгеров из every ({имя: N}).
+
+    DEBUG (включён намеренно) и WARNING+ проходят всегда.
+    """
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+        self.counters = {}
+
+    def filter(self, record):
+        if record.levelno != logging.INFO:
+            return True
+        every = self.every.get(record.name)
+        if not every or every <= 1:
+            return True
+        count = self.counters.get(record.name, 0)
+        self.counters[record.name] = count + 1
+        return count % every == 0
+
+
+def setup_logging(level=None, log_format=None):
+    """Настраивает асинхронное логирование (повторный вызов ничего не делает)."""
+    import atexit
+    import logging.handlers
+    import queue
+
+    global LOG_LISTENER
+    if LOG_LISTENER is not None:
+        return LOG_LISTENER
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if (log_format or LOG_FORMAT) == "json":
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_EVERY))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level if level is not None else LOG_LEVEL)
+
+    LOG_LISTENER = logging.handlers.QueueListener(log_queue, stream_handler)
+    LOG_LISTENER.start()
+    atexit.register(LOG_LISTENER.stop)  # Допечатать очередь при выходе
+    return LOG_LISTENER
+
+
+# ═══════════════════════════════════════════════════════════
+# 🤖 TELEGRAM БОТ
+# ═══════════════════════════════════════════════════════════
+
+# Логирование настраивается при запуске (setup_logging в __main__ и
+# worker_entry), бот создаётся лениво — импорт модуля без побочных эффектов
+logger = logging.getLogger(__name__)
+webhook_logger = logging.getLogger(WEBHOOK_LOGGER_NAME)
+
+BOT = None
+dp = Dispatcher()
+
+
+def get_bot():
+    """Экземпляр Bot (создаётся при первом обращении)."""
+    global BOT
+    if BOT is None:
+        BOT = Bot(token=BOT_TOKEN)
+    return BOT
+
+
+@dp.message(Command("start"))
+async def cmd_start(message: types.Message):
+    """Команда /start - показывает приветствие и кнопку магазина."""
+    # Проверяем параметр (из канала: /start catalog)
+    args = message.text.split(maxsplit=1)
+    from_channel = len(args) > 1 and args[1] == "catalog"
+
+    # Клавиатура с кнопками внизу
+    reply_keyboard = ReplyKeyboardMarkup(
+        keyboard=[
+            [
+                KeyboardButton(
+                    text="🛍 Каталог",
+                    web_app=WebAppInfo(url=WEBAPP_URL),
+                ),
+                KeyboardButton(
+                    text="📢 Наш канал",
+                ),
+            ]
+        ],
+        resize_keyboard=True,
+        is_persistent=True,
+    )
+
+    if from_channel:
+        # Пришёл из канала — сразу показываем inline кнопку с Mini App
+        inline_keyboard = InlineKeyboardMarkup(
+            inline_keyboard=[
+                [
+                    InlineKeyboardButton(
+                        text="🛍 Открыть каталог",
+                        web_app=WebAppInfo(url=WEBAPP_URL),
+                    )
+                ]
+            ]
+        )
+        await message.answer(
+            "🏐 <b>Добро пожаловать в NIMBLI!</b>\n\n"
+            "Нажми кнопку чтобы открыть каталог! 👇",
+            reply_markup=inline_keyboard,
+            parse_mode="HTML",
+        )
+        # Также ставим кнопку каталога внизу
+        await message.answer(
+            "Или используй кнопку внизу экрана ⬇️",
+            reply_markup=reply_keyboard,
+            parse_mode="HTML",
+        )
+    else:
+        await message.answer(
+            "🏐 <b>Добро пожаловать в NIMBLI!</b>\n\n"
+            "⚡ Твой спортивный магазин!\n"
+            "Нажми кнопку <b>🛍 Каталог</b> внизу экрана!",
+            reply_markup=reply_keyboard,
+            parse_mode="HTML",
+        )
+
+
+@dp.message(F.text == "📢 Наш канал")
+async def btn_channel(message: types.Message):
+    """Кнопка 'Наш канал' — ссылка на канал."""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="📢 Перейти в канал",
+                    url="https://t.me/nimbli_sport",
+                )
+            ]
+        ]
+    )
+    await message.answer(
+        "🏐 <b>NIMBLI</b> | Нишевый спорт из Европы\n\n"
+        "Подпишись на наш канал!",
+        reply_markup=keyboard,
+        parse_mode="HTML",
+    )
+
+
+@dp.message(Command("shop"))
+async def cmd_shop(message: types.Message):
+    """Команда /shop - открывает магазин."""
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="🛍 Открыть магазин",
+                    web_app=WebAppInfo(url=WEBAPP_URL),
+                )
+            ]
+        ]
+    )
+    await message.answer(
+        "Нажми кнопку, чтобы открыть каталог:",
+        reply_markup=keyboard,
+    )
+
+
+CHANNEL_USERNAME = "@nimbli_sport"
+
+@dp.message(Command("post"))
+async def cmd_post(message: types.Message):
+    """Команда /post - в личке публикует в канал, в группе — прямо в группу."""
+    username = message.from_user.username
+    if username not in ADMIN_USERNAMES:
+        return
+
+    keyboard = InlineKeyboardMarkup(
+        inline_keyboard=[
+            [
+                InlineKeyboardButton(
+                    text="🛍 Открыть каталог",
+                    url="https://t.me/Catalog_Alex_bot?start=catalog",
+                )
+            ]
+        ]
+    )
+
+    post_text = (
+        "<b>NIMBLI</b> | Нишевый спорт из Европы 🏀\n\n"
+        "Падел | Волейбол | Теннис | Бег 🏸🏐🎾\n"
+        "— оригинальные бренды\n"
+        "— прямая поставка из Европы\n"
+        "— цены ниже рынка\n"
+        "— доставка почти до вашей двери 🔥"
+    )
+
+    try:
+        if message.chat.type == "private":
+            # Из личных сообщений — публикуем в канал
+            await get_bot().send_message(
+                chat_id=CHANNEL_USERNAME,
+                text=post_text,
+                reply_markup=keyboard,
+                parse_mode="HTML",
+            )
+            await message.answer("✅ Пост опубликован в канал!")
+        else:
+            # Из группы — публикуем прямо в группу
+            await message.answer(
+                post_text,
+                reply_markup=keyboard,
+                parse_mode="HTML",
+            )
+            # Удаляем команду /post
+            try:
+                await message.delete()
+            except:
+                pass
+    except Exception as e:
+        await message.answer(f"❌ Ошибка публикации: {e}")
+
+
+@dp.message(Command("reload"))
+async def cmd_reload(message: types.Message):
+    """Команда /reload - перезагружает каталог товаров из Excel."""
+    status = await message.answer("🔄 Перезагружаю каталог товаров...")
+
+    try:
+        catalog = await reload_catalog(status=status)
+        await status.edit_text(
+            f"✅ Каталог обновлён!\n\n"
+            f"📦 Товаров: {catalog.total}\n"
+            f"📸 С фото: {catalog.with_photos}"
+        )
+    except Exception as e:
+        await message.answer(f"❌ Ошибка обновления каталога:\n{str(e)}")
+
+
+@dp.message(F.document)
+async def handle_document(message: types.Message):
+    """Обрабатывает загрузку архивов с каталогом товаров."""
+    # Проверяем права админа
+    username = message.from_user.username
+    if username not in ADMIN_USERNAMES:
+        await message.answer(
+            "🚫 <b>Доступ запрещён!</b>\n\n"
+            "Загружать каталог могут только администраторы.\n"
+            "Обратитесь к @AlexeyBakaev, @musyanya или @GussionHovo",
+            parse_mode="HTML"
+        )
+        logger.warning(
+            f"⚠️ Попытка загрузки каталога от неавторизованного пользователя: "
+            f"@{username} ({message.from_user.full_name})"
+        )
+        return
+
+    document = message.document
+
+    # Проверяем расширение файла (только ZIP для простоты)
+    if not document.file_name.endswith('.zip'):
+        await message.answer(
+            "⚠️ Пожалуйста, отправь ZIP архив с каталогом.\n\n"
+            "📝 Как создать архив:\n"
+            "  1. Положи в одну папку:\n"
+            "     • products_links.xlsx\n"
+            "     • папку images/\n"
+            "  2. Выдели оба → ПКМ → Отправить → Сжатая ZIP-папка\n\n"
+            "Структура архива:\n"
+            "  📁 catalog.zip\n"
+            "     ├── 📄 products_links.xlsx\n"
+            "     └── 📁 images/\n"
+            "          ├── 🖼 product_1.webp\n"
+            "          ├── 🖼 product_2.webp\n"
+            "          └── ..."
+        )
+        return
+
+    staging_dir = None
+    try:
+        status = await message.answer("📥 Скачиваю архив...")
+
+        # Всё готовим в staging внутри того же хранилища (/data на Amvera),
+        # чтобы финальная подмена была простым переименованием
+        data_dir = get_data_dir()
+        staging_dir = data_dir / ".staging" / f"upload_{int(time.time() * 1000)}"
+        staging_dir.mkdir(parents=True)
+        archive_path = staging_dir / "upload.zip"
+
+        await get_bot().download(document, destination=archive_path)
+
+        # Проверяем и распаковываем в потоке — живой каталог пока не трогаем
+        text = "✅ Архив скачан, проверяю и распаковываю..."
+        await status.edit_text(text)
+        summary = await run_with_progress(
+            get_io_executor(), stage_catalog_archive, archive_path, staging_dir, get_images_dir(),
+            status=status, text=text,
+        )
+
+        # Собираем каталог заранее (в пуле процессов), до подмены файлов.
+        # Битый или пустой Excel — ValueError, живые данные не трогаются
+        excel_path = staging_dir / EXCEL_NAME if summary["excel"] else None
+        images_dir = staging_dir / 'images' if (staging_dir / 'images').is_dir() else None
+        catalog = await reload_catalog(
+            excel_path, status=status, publish=False, images_dir=images_dir, strict=True,
+        )
+
+        # Подменяем папки и публикуем каталог — время не зависит от размера архива
+        await asyncio.get_running_loop().run_in_executor(
+            get_io_executor(), swap_catalog_dirs, staging_dir, data_dir,
+        )
+        swap_catalog(catalog)
+
+        skipped = f"\n⏭ Пропущено лишних файлов: {summary['skipped']}" if summary["skipped"] else ""
+        linked = f"\n🧩 Без изменений (взято с сервера): {summary['linked']}" if summary["mode"] == "delta" else ""
+        await status.edit_text(
+            f"🎉 Каталог успешно обновлён!\n\n"
+            f"📦 Товаров: {catalog.total}\n"
+            f"📸 С фотографиями: {catalog.with_photos}\n"
+            f"🖼 Фото в архиве: {summary['images']}{linked}{skipped}\n\n"
+            f"Используй /shop чтобы открыть магазин"
+        )
+
+    except zipfile.BadZipFile:
+        await message.answer("❌ Ошибка: файл повреждён или это не ZIP архив")
+    except ValueError as e:
+        await message.answer(f"❌ Архив отклонён, каталог не изменён:\n{e}")
+    except Exception as e:
+        logger.error("Ошибка обработки архива: %s", e)
+        await message.answer(f"❌ Ошибка обработки архива:\n{str(e)}")
+    finally:
+        # Удаляем staging (и старую папку images после подмены) в фоне
+        if staging_dir is not None:
+            import shutil
+            asyncio.get_running_loop().run_in_executor(
+                get_io_executor(), shutil.rmtree, staging_dir, True,
+            )
+
+
+@dp.message(F.web_app_data)
+async def handle_web_app_data(message: types.Message):
+    """Обрабатывает данные из Mini App (консультация)."""
+    # Аргументы форматируются, только если DEBUG включён
+    logger.debug("🎯 WEB_APP_DATA: %.200s", message.web_app_data.data)
+    try:
+        data = json.loads(message.web_app_data.data)
+        logger.debug("📦 Распарсено: %s", data)
+        action = data.get("action", "order")
+        items = data.get("items", [])
+        total = data.get("total", 0)
+
+        if not items:
+            await message.answer("❌ Вы не выбрали ни одного интересного товара!")
+            return
+
+        # Формируем список товаров для сообщения менеджеру
+        products_list = ""
+        for item in items:
+            rounded_price = math.ceil(item['price'] / 100) * 100
+            products_list += f"• {item['name']} — {rounded_price:,.0f} ₽\n".replace(',', ' ')
+
+        # Формируем текст для предзаполнения в личке
+        rounded_total = math.ceil(total / 100) * 100
+        prefilled_text = f"Здравствуйте, подскажите о наличии товара:\n\n{products_list}\n💰 Общая стоимость: {rounded_total:,.0f} ₽".replace(',', ' ')
+        encoded_text = quote(prefilled_text)
+
+        # Показываем сообщение пользователю с выбором менеджера
+        message_text = "⭐ <b>Вас заинтересовали следующие товары:</b>\n\n"
+
+        for item in items:
+            rounded_price = math.ceil(item['price'] / 100) * 100
+            formatted_price = f"{rounded_price:,.0f}".replace(',', ' ')
+            message_text += (
+                f"<b>{item['name']}</b>\n"
+                f"💰 Цена: {formatted_price} ₽\n\n"
+            )
+
+        formatted_total = f"{rounded_total:,.0f}".replace(',', ' ')
+        message_text += f"📊 <b>Общая стоимость: {formatted_total} ₽</b>\n\n"
+        message_text += (
+            "💬 <b>Выберите менеджера для консультации:</b>"
+        )
+
+        # Кнопки для связи с менеджерами (с предзаполненным текстом)
+        keyboard = types.InlineKeyboardMarkup(inline_keyboard=[
+            [types.InlineKeyboardButton(
+                text="👤 @AlexeyBakaev",
+                url=f"https://t.me/AlexeyBakaev?text={encoded_text}"
+            )],
+            [types.InlineKeyboardButton(
+                text="👤 @musyanya",
+                url=f"https://t.me/musyanya?text={encoded_text}"
+            )]
+        ])
+
+        await message.answer(message_text, parse_mode="HTML", reply_markup=keyboard)
+
+        # Логируем в консоль
+        logger.info(
+            "Запрос консультации от %s (@%s): %d товаров на %d ₽",
+            message.from_user.full_name,
+            message.from_user.username or "без username",
+            len(items),
+            total,
+        )
+
+    except (json.JSONDecodeError, KeyError) as e:
+        logger.error("Ошибка обработки данных: %s", e)
+        await message.answer("❌ Произошла ошибка при обработке данных.")
+
+
+# ═══════════════════════════════════════════════════════════
+# 🌐 ВЕБ-СЕРВЕР (раздаёт HTML и API)
+# ═══════════════════════════════════════════════════════════
+
+HTML_TEMPLATE = """
+<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Магазин</title>
+    <script src="https://telegram.org/js/telegram-web-app.js"></script>
+    <style>
+        * {
+            margin: 0;
+            padding: 0;
+            box-sizing: border-box;
+        }
+
+        @keyframes fadeInUp {
+            from {
+                opacity: 0;
+                transform: translateY(20px);
+            }
+            to {
+                opacity: 1;
+                transform: translateY(0);
+            }
+        }
+
+        @keyframes pulse {
+            0%, 100% { transform: scale(1); }
+            50% { transform: scale(1.05); }
+        }
+
+        @keyframes slideUp {
+            from {
+                opacity: 0;
+                transform: translateY(100%);
+            }
+            to {
+                opacity: 1;
+                transform: translateY(0);
+            }
+        }
+
+        @keyframes gradientShift {
+            0% {
+                background-position: 0% 50%;
+            }
+            50% {
+                background-position: 100% 50%;
+            }
+            100% {
+                background-position: 0% 50%;
+            }
+        }
+
+        @keyframes float {
+            0%, 100% {
+                transform: translateY(0px);
+            }
+            50% {
+                transform: translateY(-20px);
+            }
+        }
+
+        body {
+            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', sans-serif;
+            background: linear-gradient(-45deg, #e2e6ea, #d6dae0, #caced4, #dfe3e7);
+            background-size: 400% 400%;
+            animation: gradientShift 15s ease infinite;
+            color: #1a1a1a;
+            padding: 20px;
+            padding-bottom: 100px;
+            min-height: 100vh;
+            position: relative;
+            overflow-x: hidden;
+        }
+
+        body::before {
+            content: '';
+            position: fixed;
+            top: 0;
+            left: 0;
+            right: 0;
+            bottom: 0;
+            background: rgba(255, 255, 255, 0.2);
+            backdrop-filter: blur(100px);
+            pointer-events: none;
+            z-index: 0;
+        }
+
+        .header {
+            text-align: center;
+            margin-bottom: 24px;
+            animation: fadeInUp 0.6s ease-out;
+            position: relative;
+            z-index: 1;
+        }
+
+        h1 {
+            font-size: 52px;
+            font-weight: 900;
+            margin-bottom: 8px;
+            color: white;
+            text-shadow:
+                0 2px 10px rgba(0,0,0,0.3),
+                0 4px 20px rgba(0,0,0,0.2),
+                0 0 40px rgba(255,215,0,0.3);
+            letter-spacing: 5px;
+            animation: float 3s ease-in-out infinite;
+            text-transform: uppercase;
+        }
+
+        .subtitle {
+            color: rgba(30, 30, 30, 0.85);
+            margin-bottom: 0;
+            font-size: 16px;
+            font-weight: 600;
+            text-shadow: 0 2px 10px rgba(255,255,255,0.5);
+            letter-spacing: 2px;
+        }
+
+        .categories-container {
+            margin: 32px auto 16px;
+            max-width: 100%;
+            animation: fadeInUp 0.8s ease-out 0.2s both;
+        }
+
+        .categories-tabs {
+            display: flex;
+            justify-content: center;
+            gap: 10px;
+            overflow-x: auto;
+            padding: 4px 20px 12px;
+            scrollbar-width: thin;
+            scrollbar-color: rgba(102, 126, 234, 0.3) transparent;
+        }
+
+        .categories-tabs::-webkit-scrollbar {
+            height: 4px;
+        }
+
+        .categories-tabs::-webkit-scrollbar-track {
+            background: transparent;
+        }
+
+        .categories-tabs::-webkit-scrollbar-thumb {
+            background: rgba(102, 126, 234, 0.3);
+            border-radius: 2px;
+        }
+
+        .category-tab {
+            flex-shrink: 0;
+            padding: 10px 20px;
+            border: none;
+            border-radius: 20px;
+            background: rgba(255, 255, 255, 0.7);
+            backdrop-filter: blur(10px);
+            color: #2d3748;
+            font-size: 14px;
+            font-weight: 600;
+            cursor: pointer;
+            transition: all 0.3s ease;
+            box-shadow: 0 2px 8px rgba(0, 0, 0, 0.08);
+            white-space: nowrap;
+        }
+
+        .category-tab:hover {
+            background: rgba(255, 255, 255, 0.9);
+            transform: translateY(-2px);
+            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.12);
+        }
+
+        .category-tab.active {
+            background: linear-gradient(135deg, #FFD700 0%, #DAA520 100%);
+            color: #2d3748;
+            box-shadow: 0 4px 15px rgba(255, 215, 0, 0.5);
+        }
+
+        .subcategories-container {
+            max-height: 0;
+            overflow: hidden;
+            transition: max-height 0.4s ease, opacity 0.3s ease;
+            opacity: 0;
+        }
+
+        .subcategories-container.visible {
+            max-height: 60px;
+            opacity: 1;
+        }
+
+        .subcategories-tabs {
+            display: flex;
+            gap: 8px;
+            padding: 0 20px 10px;
+            overflow-x: auto;
+            scrollbar-width: none;
+        }
+        .subcategories-tabs::-webkit-scrollbar {
+            display: none;
+        }
+
+        .subcategory-tab {
+            flex-shrink: 0;
+            padding: 6px 16px;
+            border: none;
+            border-radius: 16px;
+            background: rgba(255, 255, 255, 0.5);
+            color: #555;
+            font-size: 12px;
+            font-weight: 600;
+            cursor: pointer;
+            transition: all 0.3s ease;
+            white-space: nowrap;
+        }
+
+        .subcategory-tab:hover {
+            background: rgba(255, 255, 255, 0.8);
+        }
+
+        .subcategory-tab.active {
+            background: rgba(255, 215, 0, 0.3);
+            color: #2d3748;
+            border: 1.5px solid rgba(218, 165, 32, 0.5);
+        }
+
+        .brands-container {
+            max-height: 0;
+            overflow: hidden;
+            transition: max-height 0.4s ease, opacity 0.3s ease;
+            opacity: 0;
+        }
+
+        .brands-container.visible {
+            max-height: 50px;
+            opacity: 1;
+        }
+
+        .brands-tabs {
+            display: flex;
+            justify-content: center;
+            gap: 6px;
+            padding: 0 20px 8px;
+            overflow-x: auto;
+            scrollbar-width: none;
+        }
+
+        .brands-tabs::-webkit-scrollbar {
+            display: none;
+        }
+
+        .brand-tab {
+            flex-shrink: 0;
+            padding: 5px 12px;
+            border: 1px solid rgba(0,0,0,0.1);
+            border-radius: 14px;
+            background: rgba(255, 255, 255, 0.5);
+            color: #666;
+            font-size: 11px;
+            font-weight: 600;
+            cursor: pointer;
+            transition: all 0.3s ease;
+            white-space: nowrap;
+        }
+
+        .brand-tab:hover {
+            background: rgba(255, 255, 255, 0.8);
+        }
+
+        .brand-tab.active {
+            background: #2d3748;
+            color: white;
+            border-color: #2d3748;
+        }
+
+        /* Фильтр размеров */
+        .size-filter-container {
+            max-height: 0;
+            overflow: hidden;
+            transition: max-height 0.4s ease, opacity 0.3s ease;
+            opacity: 0;
+            margin-top: 8px;
+        }
+        .size-filter-container.visible {
+            max-height: 200px;
+            opacity: 1;
+            overflow-y: auto;
+        }
+        .size-filter-header {
+            display: flex;
+            align-items: center;
+            justify-content: space-between;
+            padding: 0 4px;
+            margin-bottom: 8px;
+        }
+        .size-filter-title {
+            font-size: 12px;
+            font-weight: 600;
+            color: var(--tg-theme-hint-color, #999);
+        }
+        .size-filter-reset {
+            font-size: 11px;
+            color: #667eea;
+            cursor: pointer;
+            border: none;
+            background: none;
+            padding: 2px 6px;
+        }
+        .size-filter-grid {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(65px, 1fr));
+            gap: 6px;
+            padding: 0 4px;
+        }
+        .size-filter-btn {
+            padding: 7px 4px;
+            border: 1.5px solid rgba(0,0,0,0.12);
+            border-radius: 8px;
+            background: rgba(255,255,255,0.6);
+            font-size: 12px;
+            font-weight: 500;
+            color: #333;
+            cursor: pointer;
+            text-align: center;
+            transition: all 0.2s ease;
+        }
+        .size-filter-btn:hover {
+            border-color: rgba(0,0,0,0.25);
+        }
+        .size-filter-btn.active {
+            background: #2d3748;
+            color: white;
+            border-color: #2d3748;
+        }
+
+        /* Фильтр по полу */
+        .gender-filter-container {
+            display: flex;
+            gap: 8px;
+            justify-content: center;
+            margin-top: 10px;
+            padding: 0 4px;
+            overflow-x: auto;
+            scrollbar-width: none;
+        }
+        .gender-filter-container::-webkit-scrollbar {
+            display: none;
+        }
+        .gender-tab {
+            flex-shrink: 0;
+            padding: 5px 14px;
+            border: 1px solid rgba(0,0,0,0.1);
+            border-radius: 14px;
+            background: rgba(255,255,255,0.5);
+            font-size: 12px;
+            font-weight: 500;
+            color: #555;
+            cursor: pointer;
+            transition: all 0.2s ease;
+        }
+        .gender-tab.active {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            border-color: transparent;
+        }
+
+        /* Бейдж баланса на карточке */
+        .priority-badge {
+            position: absolute;
+            top: 8px;
+            left: 8px;
+            padding: 3px 8px;
+            border-radius: 6px;
+            font-size: 10px;
+            font-weight: 700;
+            z-index: 10;
+            color: white;
+            text-transform: uppercase;
+            letter-spacing: 0.5px;
+        }
+        .priority-badge.hot {
+            background: linear-gradient(135deg, #ff416c 0%, #ff4b2b 100%);
+        }
+        .priority-badge.new {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+        }
+
+        .search-container {
+            margin: 20px auto 24px;
+            max-width: 600px;
+            animation: fadeInUp 0.8s ease-out 0.3s both;
+        }
+
+        .search-wrapper {
+            position: relative;
+            display: flex;
+            align-items: center;
+        }
+
+        .search-icon {
+            position: absolute;
+            left: 18px;
+            font-size: 20px;
+            opacity: 0.6;
+            pointer-events: none;
+            z-index: 2;
+        }
+
+        .search-input {
+            width: 100%;
+            padding: 16px 50px 16px 52px;
+            font-size: 16px;
+            border: none;
+            border-radius: 20px;
+            background: rgba(255, 255, 255, 0.85);
+            backdrop-filter: blur(10px);
+            box-shadow:
+                0 4px 20px rgba(0, 0, 0, 0.1),
+                inset 0 1px 0 rgba(255, 255, 255, 0.9);
+            transition: all 0.3s ease;
+            font-family: inherit;
+            color: #333;
+        }
+
+        .search-input:focus {
+            outline: none;
+            background: rgba(255, 255, 255, 0.95);
+            box-shadow:
+                0 6px 30px rgba(0, 0, 0, 0.15),
+                inset 0 1px 0 rgba(255, 255, 255, 1),
+                0 0 0 3px rgba(129, 212, 250, 0.3);
+            transform: translateY(-2px);
+        }
+
+        .search-input::placeholder {
+            color: rgba(0, 0, 0, 0.4);
+        }
+
+        .clear-search {
+            position: absolute;
+            right: 18px;
+            font-size: 20px;
+            color: rgba(0, 0, 0, 0.5);
+            cursor: pointer;
+            padding: 4px 8px;
+            border-radius: 50%;
+            transition: all 0.2s ease;
+            z-index: 2;
+        }
 
         .clear-search:hover {
             color: rgba(0, 0, 0, 0.8);
             background: rgba(0, 0, 0, 0.05);
         }
 
-        .products-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(170px, 1fr));
-            gap: 20px;
-            margin-bottom: 20px;
-            position: relative;
-            z-index: 1;
+        .products-grid {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(170px, 1fr));
+            gap: 20px;
+            margin-bottom: 20px;
+            position: relative;
+            z-index: 1;
+        }
+
+        .product-card {
+            background: linear-gradient(135deg, #ffffff 0%, #f8f9fa 100%);
+            border-radius: 16px;
+            padding: 14px;
+            cursor: pointer;
+            transition: all 0.3s ease;
+            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.08);
+            position: relative;
+            overflow: hidden;
+            animation: fadeInUp 0.6s ease-out;
+            animation-fill-mode: both;
+            border: 1px solid rgba(0, 0, 0, 0.06);
+        }
+
+        .product-card:hover {
+            transform: translateY(-4px) scale(1.03);
+            box-shadow: 0 8px 20px rgba(0, 0, 0, 0.12);
+        }
+
+        .product-card:active {
+            transform: scale(0.98);
+        }
+
+        .product-card.in-cart {
+            border-color: #667eea;
+            box-shadow: 0 4px 16px rgba(102, 126, 234, 0.2);
+        }
+
+        .product-image {
+            position: relative;
+            width: 100%;
+            height: 140px;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            background: linear-gradient(135deg, #f0f4f8 0%, #e2e8f0 100%);
+            border-radius: 12px;
+            margin-bottom: 12px;
+            overflow: hidden;
+        }
+
+        .product-image img {
+            max-width: 100%;
+            max-height: 120px;
+            object-fit: contain;
+            position: relative;
+            opacity: 0;
+            transition: opacity 0.3s ease;
+        }
+
+        .product-image img.loaded {
+            opacity: 1;
+        }
+
+        /* Размытое превью (LQIP) или средний цвет, пока грузится фото */
+        .product-image .lqip {
+            position: absolute;
+            inset: 0;
+            background-size: contain;
+            background-position: center;
+            background-repeat: no-repeat;
+            filter: blur(10px);
+            transform: scale(1.1);
+        }
+
+        .product-image div {
+            font-size: 56px;
+        }
+
+        .product-badge {
+            position: absolute;
+            top: 8px;
+            right: 8px;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            padding: 4px 10px;
+            border-radius: 12px;
+            font-size: 10px;
+            font-weight: 700;
+            z-index: 3;
+            box-shadow: 0 2px 8px rgba(102, 126, 234, 0.4);
+            display: none;
+        }
+
+        .product-card.in-cart .product-badge {
+            display: block;
+            animation: pulse 2s infinite;
+        }
+
+        .product-name {
+            font-weight: 600;
+            font-size: 14px;
+            margin-bottom: 8px;
+            color: #2d3748;
+            line-height: 1.4;
+            display: -webkit-box;
+            -webkit-line-clamp: 2;
+            -webkit-box-orient: vertical;
+            overflow: hidden;
+            min-height: 40px;
+        }
+
+        .product-price {
+            font-size: 20px;
+            font-weight: 800;
+            color: #667eea;
+            letter-spacing: -0.5px;
+        }
+        .price-delivery-hint {
+            font-size: 10px;
+            font-weight: 400;
+            color: #999;
+            letter-spacing: 0;
+        }
+
+        .product-quantity {
+            display: flex;
+            align-items: center;
+            justify-content: space-between;
+            margin-top: 10px;
+            gap: 10px;
+            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
+            padding: 6px;
+            border-radius: 12px;
+        }
+
+        .quantity-btn {
+            width: 36px;
+            height: 36px;
+            border-radius: 10px;
+            border: none;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            font-size: 20px;
+            font-weight: bold;
+            cursor: pointer;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            transition: all 0.3s ease;
+            box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
+        }
+
+        .quantity-btn:hover {
+            transform: translateY(-2px);
+            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
+        }
+
+        .quantity-btn:active {
+            transform: scale(0.95);
+        }
+
+        .quantity-display {
+            font-weight: 700;
+            font-size: 18px;
+            min-width: 30px;
+            text-align: center;
+            color: var(--tg-theme-text-color, #212529);
+        }
+
+        .cart-footer {
+            position: fixed;
+            bottom: 0;
+            left: 0;
+            right: 0;
+            background: rgba(255, 255, 255, 0.25);
+            backdrop-filter: blur(30px) saturate(180%);
+            -webkit-backdrop-filter: blur(30px) saturate(180%);
+            padding: 20px;
+            box-shadow: 0 -8px 32px rgba(0, 0, 0, 0.2);
+            display: none;
+            border-top: 1px solid rgba(255, 255, 255, 0.4);
+            z-index: 100;
+        }
+
+        .cart-footer.visible {
+            display: block;
+            animation: slideUp 0.4s cubic-bezier(0.4, 0, 0.2, 1);
+        }
+
+        .cart-summary {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            margin-bottom: 14px;
+            font-size: 16px;
+            font-weight: 700;
+            color: #2d2d2d;
+            text-shadow: 0 1px 3px rgba(255,255,255,0.5);
+        }
+
+        .cart-total {
+            font-size: 26px;
+            font-weight: 900;
+            background: linear-gradient(135deg, #FF6B35, #FFD93D);
+            -webkit-background-clip: text;
+            -webkit-text-fill-color: transparent;
+            background-clip: text;
+            filter: drop-shadow(0 2px 4px rgba(255,107,53,0.3));
+        }
+
+        .order-btn {
+            width: 100%;
+            padding: 18px;
+            border-radius: 16px;
+            border: none;
+            background: linear-gradient(135deg, #FF6B35 0%, #FFD93D 100%);
+            color: white;
+            font-size: 18px;
+            font-weight: 800;
+            cursor: pointer;
+            box-shadow: 0 8px 24px rgba(255,107,53,0.4);
+            transition: all 0.4s cubic-bezier(0.4, 0, 0.2, 1);
+            letter-spacing: 1px;
+            text-transform: uppercase;
+            position: relative;
+            overflow: hidden;
+        }
+
+        .order-btn::before {
+            content: '';
+            position: absolute;
+            top: 0;
+            left: -100%;
+            width: 100%;
+            height: 100%;
+            background: linear-gradient(90deg, transparent, rgba(255,255,255,0.3), transparent);
+            transition: left 0.5s;
+        }
+
+        .order-btn:hover::before {
+            left: 100%;
+        }
+
+        .order-btn:hover {
+            transform: translateY(-3px) scale(1.02);
+            box-shadow: 0 12px 32px rgba(255,107,53,0.5);
+        }
+
+        .order-btn:active {
+            transform: scale(0.98);
+        }
+
+        .empty-cart {
+            text-align: center;
+            padding: 60px 20px;
+            color: var(--tg-theme-hint-color, #6c757d);
+        }
+
+        .empty-cart-icon {
+            font-size: 72px;
+            margin-bottom: 20px;
+            opacity: 0.5;
+            animation: pulse 3s infinite;
+        }
+
+        /* Модальное окно товара */
+        .modal-overlay {
+            position: fixed;
+            top: 0;
+            left: 0;
+            right: 0;
+            bottom: 0;
+            background: rgba(0, 0, 0, 0.7);
+            backdrop-filter: blur(10px);
+            display: none;
+            align-items: center;
+            justify-content: center;
+            z-index: 1000;
+            padding: 20px;
+            animation: fadeIn 0.3s ease;
+        }
+
+        @keyframes fadeIn {
+            from { opacity: 0; }
+            to { opacity: 1; }
+        }
+
+        .modal-overlay.active {
+            display: flex;
+        }
+
+        .modal-content {
+            background: #ffffff;
+            border-radius: 20px;
+            max-width: 500px;
+            width: 100%;
+            max-height: 90vh;
+            overflow-y: auto;
+            position: relative;
+            box-shadow: 0 10px 40px rgba(0, 0, 0, 0.3);
+            animation: slideInUp 0.4s cubic-bezier(0.4, 0, 0.2, 1);
+        }
+
+        @keyframes slideInUp {
+            from {
+                opacity: 0;
+                transform: translateY(50px);
+            }
+            to {
+                opacity: 1;
+                transform: translateY(0);
+            }
+        }
+
+        .modal-close {
+            position: absolute;
+            top: 16px;
+            right: 16px;
+            width: 36px;
+            height: 36px;
+            border-radius: 50%;
+            background: rgba(0, 0, 0, 0.1);
+            border: none;
+            font-size: 24px;
+            cursor: pointer;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            z-index: 1;
+            transition: all 0.3s ease;
+        }
+
+        .modal-close:hover {
+            background: rgba(0, 0, 0, 0.2);
+            transform: rotate(90deg);
+        }
+
+        .modal-image-container {
+            position: relative;
+            width: 100%;
+            height: 300px;
+            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
+            border-radius: 20px 20px 0 0;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            overflow: hidden;
+        }
+
+        .modal-image {
+            width: 100%;
+            height: 100%;
+            object-fit: cover;
+            transition: opacity 0.3s ease;
+        }
+
+        .gallery-nav {
+            position: absolute;
+            top: 50%;
+            transform: translateY(-50%);
+            width: 40px;
+            height: 40px;
+            background: rgba(255, 255, 255, 0.9);
+            border: none;
+            border-radius: 50%;
+            font-size: 24px;
+            cursor: pointer;
+            display: flex;
+            align-items: center;
+            justify-content: center;
+            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.2);
+            transition: all 0.3s ease;
+            z-index: 10;
+        }
+
+        .gallery-nav:hover {
+            background: white;
+            transform: translateY(-50%) scale(1.1);
+        }
+
+        .gallery-nav-prev {
+            left: 10px;
+        }
+
+        .gallery-nav-next {
+            right: 10px;
+        }
+
+        .gallery-counter {
+            position: absolute;
+            bottom: 10px;
+            left: 50%;
+            transform: translateX(-50%);
+            background: rgba(0, 0, 0, 0.7);
+            color: white;
+            padding: 6px 14px;
+            border-radius: 20px;
+            font-size: 12px;
+            font-weight: 600;
+            z-index: 10;
+        }
+
+        .sizes-section {
+            margin-bottom: 20px;
+        }
+
+        .sizes-title {
+            font-size: 16px;
+            font-weight: 700;
+            margin-bottom: 12px;
+            color: var(--tg-theme-text-color, #212529);
+        }
+
+        .sizes-grid {
+            display: grid;
+            grid-template-columns: repeat(auto-fill, minmax(60px, 1fr));
+            gap: 8px;
+        }
+
+        .size-badge {
+            padding: 10px;
+            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
+            border: 2px solid rgba(102, 126, 234, 0.3);
+            border-radius: 10px;
+            text-align: center;
+            font-weight: 600;
+            font-size: 14px;
+            color: #212529;
+            transition: all 0.3s ease;
+        }
+
+        .size-badge:hover {
+            background: linear-gradient(135deg, rgba(102, 126, 234, 0.2) 0%, rgba(118, 75, 162, 0.2) 100%);
+            border-color: #667eea;
+            transform: translateY(-2px);
+        }
+
+        .modal-body {
+            padding: 24px;
+        }
+
+        .modal-title {
+            font-size: 24px;
+            font-weight: 800;
+            margin-bottom: 12px;
+            color: #212529;
+            line-height: 1.3;
+        }
+
+        .modal-price-section {
+            display: flex;
+            justify-content: space-between;
+            align-items: center;
+            padding: 16px;
+            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
+            border-radius: 14px;
+            margin-bottom: 20px;
+        }
+
+        .modal-price-label {
+            font-size: 14px;
+            font-weight: 600;
+            color: #6c757d;
+        }
+
+        .modal-price {
+            font-size: 32px;
+            font-weight: 800;
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            -webkit-background-clip: text;
+            -webkit-text-fill-color: transparent;
+            background-clip: text;
+        }
+
+        .modal-info-section {
+            margin-bottom: 20px;
+        }
+
+        .modal-info-title {
+            font-size: 16px;
+            font-weight: 700;
+            margin-bottom: 12px;
+            color: #212529;
+        }
+
+        .modal-info-item {
+            display: flex;
+            justify-content: space-between;
+            padding: 10px 0;
+            border-bottom: 1px solid rgba(0, 0, 0, 0.05);
+        }
+
+        .modal-info-item:last-child {
+            border-bottom: none;
+        }
+
+        .modal-info-label {
+            font-size: 14px;
+            color: #6c757d;
+        }
+
+        .modal-info-value {
+            font-size: 14px;
+            font-weight: 600;
+            color: #212529;
+        }
+
+        .modal-actions {
+            display: flex;
+            gap: 12px;
+        }
+
+        .modal-btn {
+            flex: 1;
+            padding: 16px;
+            border-radius: 14px;
+            border: none;
+            font-size: 16px;
+            font-weight: 700;
+            cursor: pointer;
+            transition: all 0.3s ease;
+        }
+
+        .modal-btn-primary {
+            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+            color: white;
+            box-shadow: 0 4px 16px rgba(102, 126, 234, 0.4);
+        }
+
+        .modal-btn-primary:hover {
+            transform: translateY(-2px);
+            box-shadow: 0 6px 20px rgba(102, 126, 234, 0.5);
+        }
+
+        .modal-btn-secondary {
+            background: rgba(102, 126, 234, 0.1);
+            color: #667eea;
+        }
+
+        .modal-btn-secondary:hover {
+            background: rgba(102, 126, 234, 0.2);
+        }
+        /* Particles на фоне */
+        .particle {
+            position: fixed;
+            width: 4px;
+            height: 4px;
+            background: rgba(255, 255, 255, 0.5);
+            border-radius: 50%;
+            pointer-events: none;
+            animation: float-particle 8s infinite;
+        }
+
+        @keyframes float-particle {
+            0%, 100% {
+                transform: translateY(0) translateX(0);
+                opacity: 0;
+            }
+            10% {
+                opacity: 1;
+            }
+            90% {
+                opacity: 1;
+            }
+            100% {
+                transform: translateY(-100vh) translateX(20px);
+                opacity: 0;
+            }
+        }
+
+        .badge {
+            position: absolute;
+            top: 10px;
+            right: 10px;
+            background: linear-gradient(135deg, #6c5ce7, #a855f7);
+            color: white;
+            padding: 5px 12px;
+            border-radius: 10px;
+            font-size: 11px;
+            font-weight: 700;
+            z-index: 2;
+            letter-spacing: 0.3px;
+            box-shadow: 0 2px 8px rgba(108, 92, 231, 0.4);
+            text-shadow: 0 1px 2px rgba(0,0,0,0.2);
+        }
+
+        .badge.new {
+            background: linear-gradient(135deg, #4facfe, #00f2fe);
+            box-shadow: 0 4px 15px rgba(79, 172, 254, 0.4);
+        }
+
+        .gender-badge {
+            display: inline-block;
+            padding: 2px 8px;
+            border-radius: 8px;
+            font-size: 10px;
+            font-weight: 600;
+            margin-top: 4px;
+        }
+        .gender-badge.male {
+            background: rgba(66, 133, 244, 0.15);
+            color: #4285f4;
+        }
+        .gender-badge.female {
+            background: rgba(234, 67, 149, 0.15);
+            color: #ea4395;
+        }
+        .gender-badge.unisex {
+            background: rgba(102, 126, 234, 0.15);
+            color: #667eea;
+        }
+
+    </style>
+</head>
+<body>
+    <!-- Animated particles -->
+    <div class="particles-container"></div>
+
+    <div class="header">
+        <h1>🏐 NIMBLI</h1>
+        <p class="subtitle">Твой спорт • Твоя победа • Твой успех</p>
+    </div>
+
+    <div class="categories-container">
+        <div class="categories-tabs" id="categoriesTabs"></div>
+        <div class="subcategories-container" id="subcategoriesContainer">
+            <div class="subcategories-tabs" id="subcategoriesTabs"></div>
+        </div>
+        <div class="brands-container" id="brandsContainer">
+            <div class="brands-tabs" id="brandsTabs"></div>
+        </div>
+        <div class="size-filter-container" id="sizeFilterContainer">
+            <div class="size-filter-header">
+                <span class="size-filter-title">Размер (EU)</span>
+                <button class="size-filter-reset" id="sizeFilterReset" style="display:none;">Сбросить</button>
+            </div>
+            <div class="size-filter-grid" id="sizeFilterGrid"></div>
+        </div>
+        <div class="gender-filter-container" id="genderFilterContainer"></div>
+    </div>
+
+    <div class="search-container">
+        <div class="search-wrapper">
+            <span class="search-icon">🔍</span>
+            <input
+                type="text"
+                id="searchInput"
+                class="search-input"
+                placeholder="Поиск товаров..."
+                autocomplete="off"
+            />
+            <span class="clear-search" id="clearSearch" style="display: none;">✕</span>
+        </div>
+    </div>
+
+    <div class="products-grid" id="productsGrid"></div>
+
+    <div class="cart-footer" id="cartFooter">
+        <div class="cart-summary">
+            <span>⭐ Интересных: <span id="cartCount">0</span></span>
+            <span class="cart-total"><span id="cartTotal">0</span> ₽</span>
+        </div>
+        <button class="order-btn" id="orderBtn">💬 Консультация</button>
+    </div>
+
+    <!-- Модальное окно детального просмотра -->
+    <div class="modal-overlay" id="productModal">
+        <div class="modal-content">
+            <button class="modal-close" onclick="closeProductModal()">×</button>
+            <div class="modal-image-container">
+                <img class="modal-image" id="modalImage" src="" alt="">
+            </div>
+            <div class="modal-body">
+                <h2 class="modal-title" id="modalTitle"></h2>
+
+                <div class="modal-price-section">
+                    <span class="modal-price-label">Цена</span>
+                    <span class="modal-price" id="modalPrice"></span>
+                </div>
+
+                <div id="modalGenderSection" style="display: none; margin-bottom: 12px;">
+                    <span id="modalGenderBadge"></span>
+                </div>
+
+                <div class="sizes-section" id="sizesSection" style="display: none;">
+                    <h3 class="sizes-title">👟 Размеры (EU)</h3>
+                    <div class="sizes-grid" id="sizesGrid"></div>
+                </div>
+
+                <div class="modal-actions">
+                    <button class="modal-btn modal-btn-secondary" onclick="closeProductModal()">Закрыть</button>
+                    <button class="modal-btn modal-btn-primary" id="modalAddBtn" onclick="">В корзину</button>
+                </div>
+            </div>
+        </div>
+    </div>
+
+    <script>
+        // Создаём floating particles
+        function createParticles() {
+            const particleCount = 25;
+            for (let i = 0; i < particleCount; i++) {
+                const particle = document.createElement('div');
+                particle.className = 'particle';
+                particle.style.left = Math.random() * 100 + '%';
+                particle.style.animationDelay = Math.random() * 8 + 's';
+                particle.style.animationDuration = (8 + Math.random() * 4) + 's';
+                document.body.appendChild(particle);
+            }
+        }
+
+        const tg = window.Telegram.WebApp;
+        tg.expand();
+        tg.MainButton.hide();
+
+        let cart = {};  // Теперь это список интересных товаров
+        let products = [];
+        let currentCategory = null;  // Текущая выбранная группа
+        let currentSubcategory = null;  // Текущая выбранная подгруппа
+        let currentBrand = null;  // Текущий выбранный бренд
+        let selectedSizes = new Set();  // Выбранные размеры для фильтра
+        let currentGender = null;  // Текущий выбранный пол
+        let facets = null;  // Дерево фасетов из /api/facets (вкладки до загрузки товаров)
+        let catalogLoaded = false;  // Весь каталог получен — дальше всё считается по индексам
+        const FIRST_PAGE_SIZE = 24;  // Карточек на первый экран до загрузки всего каталога
+        const FIRST_PAGE_FIELDS = 'id,name,price,image,srcset,lqip,color,priority,gender,balance,category,subcategory,brand,sizes';
+        // Пока весь каталог грузится, в products — страница, которую сервер отобрал
+        // под фильтры с параметрами previewKey; другие фильтры просят свою страницу
+        let previewKey = null;
+        let previewPending = null;
+
+        // URL превью фото: /images/x.webp?v=... → /thumb/320/x.webp?v=...
+        function thumbUrl(url, width) {
+            return '/thumb/' + width + url.slice('/images'.length);
+        }
+
+        // srcset из готовых вариантов фото ({160: url, 320: url, ...}) не шире maxWidth
+        function variantSrcset(srcset, maxWidth) {
+            return Object.keys(srcset)
+                .map(Number)
+                .filter(w => w <= maxWidth)
+                .sort((a, b) => a - b)
+                .map(w => `${srcset[w]} ${w}w`)
+                .join(', ');
+        }
+
+        // Форматирование цены с пробелами (22000 → 22 000)
+        function formatPrice(price) {
+            return (Math.ceil(price / 100) * 100).toString().replace(/\B(?=(\d{3})+(?!\d))/g, ' ');
+        }
+
+        // Инициализация particles при загрузке
+        createParticles();
+
+        // Service worker: повторное открытие — оболочка, каталог и фото из кэша
+        if ('serviceWorker' in navigator && location.pathname === '/') {
+            navigator.serviceWorker.register('/sw.js').catch(() => {});
+        }
+        let currentProduct = null;  // Текущий товар в модальном окне
+
+        // ═══ Локальная копия каталога (IndexedDB) ═══
+        // Хранит товары вместе с epoch/seq ревизии; при повторном открытии
+        // показываем копию сразу и догружаем только изменения.
+        const CATALOG_DB_NAME = 'catalog';
+        const CATALOG_DB_STORE = 'state';
+
+        function openCatalogDb() {
+            return new Promise((resolve, reject) => {
+                const request = indexedDB.open(CATALOG_DB_NAME, 1);
+                request.onupgradeneeded = () => request.result.createObjectStore(CATALOG_DB_STORE);
+                request.onsuccess = () => resolve(request.result);
+                request.onerror = () => reject(request.error);
+            });
+        }
+
+        async function readCachedCatalog() {
+            try {
+                const db = await openCatalogDb();
+                return await new Promise(resolve => {
+                    const request = db.transaction(CATALOG_DB_STORE).objectStore(CATALOG_DB_STORE).get('catalog');
+                    request.onsuccess = () => resolve(request.result || null);
+                    request.onerror = () => resolve(null);
+                });
+            } catch (e) {
+                return null;  // IndexedDB недоступна — работаем без копии
+            }
+        }
+
+        async function saveCachedCatalog(entry) {
+            if (!entry.epoch) return;
+            try {
+                const db = await openCatalogDb();
+                db.transaction(CATALOG_DB_STORE, 'readwrite').objectStore(CATALOG_DB_STORE).put(entry, 'catalog');
+            } catch (e) {
+                // Копия — только ускорение, без неё всё работает
+            }
+        }
+
+        // Порядок как на сервере: приоритет, затем строка Excel (id)
+        function sortCatalog(list) {
+            const rank = p => (typeof p.priority === 'number' ? p.priority : 999);
+            return list.sort((a, b) => rank(a) - rank(b) || a.id - b.id);
+        }
+
+        function applyCatalogChanges(list, delta) {
+            const byId = new Map(list.map(p => [p.id, p]));
+            delta.removed.forEach(id => byId.delete(id));
+            delta.changed.forEach(p => byId.set(p.id, p));
+            return sortCatalog([...byId.values()]);
+        }
+
+        function showCatalog(list) {
+            products = list;
+            catalogLoaded = true;
+            renderCategories();
+            renderProducts(searchInput.value);
+        }
+
+        async function loadFullCatalog() {
+            const res = await fetch('/api/products');
+            const data = await res.json();
+            showCatalog(data);
+            saveCachedCatalog({
+                epoch: res.headers.get('X-Catalog-Epoch'),
+                seq: parseInt(res.headers.get('X-Catalog-Seq')) || 0,
+                products: data
+            });
+        }
+
+        // Повторное открытие: копия из IndexedDB сразу, затем только изменения
+        async function syncCachedCatalog(cached) {
+            showCatalog(cached.products);
+            try {
+                const res = await fetch(`/api/products/changes?since=${cached.seq}&epoch=${encodeURIComponent(cached.epoch)}`);
+                const delta = await res.json();
+                if (delta.reset) {
+                    await loadFullCatalog();
+                    return;
+                }
+                if (delta.changed.length || delta.removed.length) {
+                    showCatalog(applyCatalogChanges(cached.products, delta));
+                }
+                if (delta.seq !== cached.seq) {
+                    saveCachedCatalog({ epoch: delta.epoch, seq: delta.seq, products: products });
+                }
+            } catch (e) {
+                // Нет сети — остаёмся на локальной копии
+            }
+        }
+
+        // Первое открытие: фасеты и первая страница, следом весь каталог
+        function loadCatalogFromServer() {
+            // Фасеты лёгкие и приходят раньше — вкладки видны до загрузки товаров
+            fetch('/api/facets')
+                .then(res => res.json())
+                .then(data => {
+                    if (catalogLoaded) return;
+                    facets = data;
+                    renderCategories();
+                })
+                .catch(() => {});
+
+            // Первый экран — маленькая страница без лишних полей, следом весь каталог
+            renderProducts(searchInput.value);
+            loadFullCatalog();
+        }
+
+        // Параметры страницы /api/products под текущие фильтры и поиск
+        function previewParams(searchQuery) {
+            const params = new URLSearchParams({ limit: FIRST_PAGE_SIZE, fields: FIRST_PAGE_FIELDS });
+            if (currentCategory) params.set('category', currentCategory);
+            if (currentSubcategory) params.set('subcategory', currentSubcategory);
+            if (currentBrand) params.set('brand', currentBrand);
+            if (currentGender) params.set('gender', currentGender);
+            if (selectedSizes.size > 0) params.set('size', [...selectedSizes].join(','));
+            if (searchQuery && searchQuery.trim()) params.set('q', searchQuery.trim());
+            return params.toString();
+        }
+
+        // Страница под фильтры, пока нет всего каталога (вкладки — из фасетов всего каталога)
+        function loadPreviewPage(key) {
+            if (previewPending === key) return;
+            previewPending = key;
+            fetch('/api/products?' + key)
+                .then(res => res.json())
+                .then(page => {
+                    // Каталог уже пришёл или фильтр успел смениться
+                    if (catalogLoaded || previewPending !== key) return;
+                    previewKey = key;
+                    products = page.items;
+                    renderProducts(searchInput.value);
+                })
+                .catch(() => {});
+        }
+
+        // Загружаем товары (на странице бенчмарка — синтетический каталог;
+        // runGridBenchmark подключается отдельным скриптом, см. GRID_BENCH_SCRIPT)
+        if (location.pathname === '/bench/grid') {
+            requestAnimationFrame(() => runGridBenchmark());
+        } else {
+            readCachedCatalog().then(cached => {
+                if (cached && cached.products && cached.products.length) {
+                    syncCachedCatalog(cached);
+                } else {
+                    loadCatalogFromServer();
+                }
+            });
+        }
+
+        // Поиск товаров
+        const searchInput = document.getElementById('searchInput');
+        const clearSearch = document.getElementById('clearSearch');
+
+        searchInput.addEventListener('input', (e) => {
+            const query = e.target.value;
+            renderProducts(query);
+            clearSearch.style.display = query ? 'block' : 'none';
+        });
+
+        clearSearch.addEventListener('click', () => {
+            searchInput.value = '';
+            clearSearch.style.display = 'none';
+            renderProducts('');
+            searchInput.focus();
+        });
+
+        // Открытие модального окна
+        function openProductModal(productId) {
+            currentProduct = products.find(p => p.id === productId);
+            if (!currentProduct) return;
+
+            const modal = document.getElementById('productModal');
+            const modalImage = document.getElementById('modalImage');
+            const modalTitle = document.getElementById('modalTitle');
+            const modalPrice = document.getElementById('modalPrice');
+            const modalAddBtn = document.getElementById('modalAddBtn');
+            const sizesSection = document.getElementById('sizesSection');
+            const sizesGrid = document.getElementById('sizesGrid');
+
+            // Устанавливаем изображение (только первое)
+            if (currentProduct.image && currentProduct.image.startsWith('/images/')) {
+                // Крупный вариант под ширину экрана и плотность пикселей
+                if (currentProduct.srcset) {
+                    modalImage.srcset = variantSrcset(currentProduct.srcset, 1280);
+                    modalImage.sizes = '100vw';
+                } else {
+                    modalImage.removeAttribute('srcset');
+                }
+                modalImage.src = currentProduct.image;
+                modalImage.style.display = 'block';
+            } else {
+                modalImage.style.display = 'none';
+            }
+
+            modalTitle.textContent = currentProduct.name;
+            modalPrice.textContent = formatPrice(currentProduct.price) + ' ₽';
+
+            // Показываем пол, если указан
+            const genderSection = document.getElementById('modalGenderSection');
+            const genderBadge = document.getElementById('modalGenderBadge');
+            if (currentProduct.gender) {
+                const gl = currentProduct.gender.toLowerCase();
+                let genderClass = 'unisex';
+                if (gl.includes('мужск') || gl.includes('male') || gl.includes('man') || gl.includes('men')) genderClass = 'male';
+                else if (gl.includes('женск') || gl.includes('female') || gl.includes('woman') || gl.includes('women')) genderClass = 'female';
+                genderBadge.className = 'gender-badge ' + genderClass;
+                genderBadge.textContent = currentProduct.gender;
+                genderSection.style.display = 'block';
+            } else {
+                genderSection.style.display = 'none';
+            }
+
+            // Показываем размеры, если они есть
+            if (currentProduct.sizes && currentProduct.sizes.length > 0) {
+                sizesSection.style.display = 'block';
+                sizesGrid.innerHTML = '';
+                currentProduct.sizes.forEach(size => {
+                    const sizeBadge = document.createElement('div');
+                    sizeBadge.className = 'size-badge';
+                    sizeBadge.textContent = size;
+                    sizesGrid.appendChild(sizeBadge);
+                });
+            } else {
+                sizesSection.style.display = 'none';
+            }
+
+            // Обновляем кнопку
+            const isInteresting = cart[productId] && cart[productId] > 0;
+            modalAddBtn.textContent = isInteresting ? '✓ Убрать из интересного' : '⭐ Интересно';
+            modalAddBtn.onclick = () => toggleInteresting(productId);
+
+            modal.classList.add('active');
+            tg.HapticFeedback.impactOccurred('medium');
+        }
+
+        // Закрытие модального окна
+        function closeProductModal() {
+            const modal = document.getElementById('productModal');
+            modal.classList.remove('active');
+            currentProduct = null;
+        }
+
+        // Переключение "Интересно"
+        function toggleInteresting(productId) {
+            if (cart[productId] && cart[productId] > 0) {
+                delete cart[productId];
+            } else {
+                cart[productId] = 1;
+            }
+            renderProducts();
+            updateCartFooter();
+            closeProductModal();
+            tg.HapticFeedback.impactOccurred('light');
+        }
+
+        // Закрытие модального окна при клике на overlay
+        document.getElementById('productModal').addEventListener('click', function(e) {
+            if (e.target === this) {
+                closeProductModal();
+            }
+        });
+
+        // ═══ Виртуализированная сетка ═══
+        // В DOM только карточки видимых рядов (+ запас), узлы переиспользуются.
+        const VIRTUAL_BUFFER_ROWS = 3;
+        const GRID_MIN_CARD_WIDTH = 170;  // Как minmax(170px, 1fr) в .products-grid
+        const GRID_GAP = 20;              // Как gap в .products-grid
+        let filteredProducts = [];
+        let gridRowHeight = 0;            // Высота ряда с отступом (меряется по карточкам)
+        const renderedCards = new Map();  // id товара → карточка в DOM
+        const cardPool = [];              // Свободные карточки для переиспользования
+        let renderedCatalog = null;       // Массив products, из которого заполнены карточки
+
+        // ═══ Индексы каталога ═══
+        // Строятся один раз на каталог: значение фильтра → битсет позиций в products.
+        // Фильтры и счётчики — пересечения битсетов вместо проходов по всему массиву.
+        let catalogIndex = null;
+
+        function bitsetNew(size) {
+            return new Uint32Array((size + 31) >>> 5);
+        }
+
+        function bitsetAnd(a, b) {
+            const out = new Uint32Array(a.length);
+            for (let i = 0; i < a.length; i++) out[i] = a[i] & b[i];
+            return out;
+        }
+
+        function bitsetOrInto(target, b) {
+            for (let i = 0; i < target.length; i++) target[i] |= b[i];
+        }
+
+        function popcount(word) {
+            word -= (word >>> 1) & 0x55555555;
+            word = (word & 0x33333333) + ((word >>> 2) & 0x33333333);
+            return (((word + (word >>> 4)) & 0x0F0F0F0F) * 0x01010101) >>> 24;
+        }
+
+        // Размер пересечения без промежуточного массива
+        function bitsetAndCount(a, b) {
+            let count = 0;
+            for (let i = 0; i < a.length; i++) {
+                const word = a[i] & b[i];
+                if (word) count += popcount(word);
+            }
+            return count;
+        }
+
+        // Обход позиций по возрастанию — порядок товаров сохраняется
+        function bitsetForEach(bits, callback) {
+            for (let w = 0; w < bits.length; w++) {
+                let word = bits[w];
+                while (word) {
+                    const lowest = word & -word;
+                    callback((w << 5) + 31 - Math.clz32(lowest));
+                    word ^= lowest;
+                }
+            }
+        }
+
+        function buildCatalogIndex(list) {
+            const index = {
+                source: list,
+                all: bitsetNew(list.length),
+                byId: new Map(),
+                names: new Array(list.length),
+                category: new Map(),
+                subcategory: new Map(),
+                brand: new Map(),
+                size: new Map(),
+                gender: new Map()
+            };
+            const add = (map, value, i) => {
+                // Пустые значения во вкладки не попадают — и в индекс тоже
+                if (value === null || value === undefined || String(value).trim() === '') return;
+                let bits = map.get(value);
+                if (!bits) map.set(value, bits = bitsetNew(list.length));
+                bits[i >>> 5] |= 1 << (i & 31);
+            };
+
+            list.forEach((product, i) => {
+                index.all[i >>> 5] |= 1 << (i & 31);
+                index.byId.set(product.id, product);
+                index.names[i] = (product.name || '').toLowerCase();
+                add(index.category, product.category, i);
+                add(index.subcategory, product.subcategory, i);
+                add(index.brand, product.brand, i);
+                add(index.gender, product.gender, i);
+                (product.sizes || []).forEach(size => add(index.size, size, i));
+            });
+            return index;
+        }
+
+        function getCatalogIndex() {
+            if (!catalogIndex || catalogIndex.source !== products) {
+                catalogIndex = buildCatalogIndex(products);
+            }
+            return catalogIndex;
+        }
+
+        function valueBits(map, value) {
+            return map.get(value) || bitsetNew(getCatalogIndex().source.length);
+        }
+
+        // Битсет товаров под текущие фильтры.
+        // stopAt='brand' — только группа и подгруппа (для списка брендов),
+        // stopAt='size' — ещё и бренд (для размеров и пола).
+        function selectionBits(stopAt = null) {
+            const index = getCatalogIndex();
+            let bits = index.all;
+            if (currentCategory) bits = bitsetAnd(bits, valueBits(index.category, currentCategory));
+            if (currentSubcategory) bits = bitsetAnd(bits, valueBits(index.subcategory, currentSubcategory));
+            if (stopAt === 'brand') return bits;
+            if (currentBrand) bits = bitsetAnd(bits, valueBits(index.brand, currentBrand));
+            if (stopAt === 'size') return bits;
+            if (selectedSizes.size > 0) {
+                // Любой из выбранных размеров; товары без размеров отсеиваются
+                const sizeBits = bitsetNew(index.source.length);
+                selectedSizes.forEach(size => bitsetOrInto(sizeBits, valueBits(index.size, size)));
+                bits = bitsetAnd(bits, sizeBits);
+            }
+            if (currentGender) bits = bitsetAnd(bits, valueBits(index.gender, currentGender));
+            return bits;
+        }
+
+        // Значения фасета, которые встречаются в выборке, с количеством товаров
+        function facetCounts(map, bits) {
+            const counts = new Map();
+            map.forEach((valueBitset, value) => {
+                const count = bitsetAndCount(valueBitset, bits);
+                if (count > 0) counts.set(value, count);
+            });
+            return counts;
+        }
+
+        // Счётчики брендов из дерева фасетов — пока товары ещё грузятся
+        function preloadedBrandCounts() {
+            if (!facets) return new Map();
+            let node = facets;
+            const category = currentCategory && facets.categories.find(c => c.name === currentCategory);
+            if (category) {
+                node = category;
+                const sub = currentSubcategory && category.subcategories.find(s => s.name === currentSubcategory);
+                if (sub) node = sub;
+            }
+            return new Map(Object.entries(node.brands));
+        }
+
+        function filterProducts(searchQuery) {
+            // Фильтруем товары по группе, подгруппе, бренду, размерам и полу
+            const index = getCatalogIndex();
+            const query = searchQuery ? searchQuery.toLowerCase() : '';
+            const result = [];
+            bitsetForEach(selectionBits(), i => {
+                // Фильтр по поисковому запросу
+                if (!query || index.names[i].includes(query)) result.push(products[i]);
+            });
+            return result;
+        }
+
+        // HTML карточки (без бейджа «Интересно» — он зависит от корзины)
+        function cardHtml(product) {
+            // Определяем как показывать изображение
+            let imageHtml;
+            if (product.image.startsWith('/images/')) {
+                // Реальная фотография — готовые варианты или превью под размер карточки
+                const src = product.srcset ? (product.srcset[320] || product.image) : thumbUrl(product.image, 320);
+                const srcset = product.srcset
+                    ? variantSrcset(product.srcset, 640)
+                    : `${thumbUrl(product.image, 160)} 160w, ${thumbUrl(product.image, 320)} 320w`;
+                // Размытое превью (первая страница) или средний цвет фото (полный каталог)
+                const lqipHtml = product.lqip
+                    ? `<div class="lqip" style="background-image: url(${product.lqip})"></div>`
+                    : (product.color ? `<div class="lqip" style="background-color: ${product.color}"></div>` : '');
+                imageHtml = `${lqipHtml}<img src="${src}" srcset="${srcset}" sizes="(max-width: 600px) 45vw, 200px" alt="${product.name}" loading="lazy" decoding="async" onload="this.classList.add('loaded')" onerror="this.parentNode.innerHTML='<div>📦</div>'">`;
+            } else {
+                // Placeholder эмодзи
+                imageHtml = `<div>${product.image}</div>`;
+            }
+
+            // Определяем класс пола
+            let genderBadgeHtml = '';
+            if (product.gender) {
+                const gl = product.gender.toLowerCase();
+                let genderClass = 'unisex';
+                if (gl.includes('мужск') || gl.includes('male') || gl.includes('man') || gl.includes('men')) genderClass = 'male';
+                else if (gl.includes('женск') || gl.includes('female') || gl.includes('woman') || gl.includes('women')) genderClass = 'female';
+                genderBadgeHtml = `<div class="gender-badge ${genderClass}">${product.gender}</div>`;
+            }
+
+            // Бейдж баланса (Мощность и т.д.) — справа сверху
+            const balanceHtml = product.balance ? `<div class="badge">${product.balance}</div>` : '';
+
+            return `
+                ${product.priority === 1 ? '<div class="priority-badge hot">Hot</div>' : product.priority === 2 ? '<div class="priority-badge new">New</div>' : ''}
+                <div class="product-image">${imageHtml}</div>
+                <div class="product-name">${product.name}</div>
+                <div class="product-price">${formatPrice(product.price)} ₽ <span class="price-delivery-hint">с доставкой</span></div>
+                ${genderBadgeHtml}
+                ${balanceHtml}
+            `;
+        }
+
+        // Заполняет карточку товаром: содержимое пересоздаётся только при смене товара,
+        // тогда возвращает true (нужен замер высоты), иначе false
+        function fillCard(card, product) {
+            let refilled = false;
+            if (card.dataset.id !== String(product.id)) {
+                card.dataset.id = product.id;
+                card.innerHTML = cardHtml(product);
+                // При клике открываем модальное окно
+                card.onclick = () => openProductModal(product.id);
+                refilled = true;
+            }
+
+            const isInteresting = (cart[product.id] || 0) > 0;
+            card.classList.toggle('in-cart', isInteresting);
+            const badge = card.querySelector('.product-badge');
+            if (isInteresting && !badge) {
+                card.insertAdjacentHTML('afterbegin', '<div class="product-badge">⭐ Интересно</div>');
+            } else if (!isInteresting && badge) {
+                badge.remove();
+            }
+            return refilled;
+        }
+
+        function takeCard() {
+            const card = cardPool.pop();
+            if (card) {
+                card.style.animation = 'none';  // Без повторной анимации появления
+                return card;
+            }
+            const newCard = document.createElement('div');
+            newCard.className = 'product-card';
+            return newCard;
+        }
+
+        function releaseAllCards() {
+            renderedCards.forEach(card => {
+                card.remove();
+                cardPool.push(card);
+            });
+            renderedCards.clear();
+        }
+
+        function gridColumns(grid) {
+            return Math.max(1, Math.floor((grid.clientWidth + GRID_GAP) / (GRID_MIN_CARD_WIDTH + GRID_GAP)));
+        }
+
+        // Рисует только ряды в области видимости; остальное — отступы сверху и снизу
+        function renderVisibleCards() {
+            const grid = document.getElementById('productsGrid');
+            if (filteredProducts.length === 0) return;
+
+            const columns = gridColumns(grid);
+            const totalRows = Math.ceil(filteredProducts.length / columns);
+            const rowHeight = gridRowHeight || 300;  // Оценка до первого замера
+            const gridTop = grid.getBoundingClientRect().top + window.scrollY;  // Верх сетки без учёта отступа
+
+            const firstRow = Math.max(0, Math.floor((window.scrollY - gridTop) / rowHeight) - VIRTUAL_BUFFER_ROWS);
+            const lastRow = Math.min(totalRows - 1, Math.max(firstRow, Math.ceil((window.scrollY + window.innerHeight - gridTop) / rowHeight) + VIRTUAL_BUFFER_ROWS));
+            const start = firstRow * columns;
+            const end = Math.min(filteredProducts.length, (lastRow + 1) * columns);
+
+            // Карточки, ушедшие из окна, — в пул
+            const visibleIds = new Set();
+            for (let i = start; i < end; i++) visibleIds.add(filteredProducts[i].id);
+            renderedCards.forEach((card, id) => {
+                if (!visibleIds.has(id)) {
+                    card.remove();
+                    cardPool.push(card);
+                    renderedCards.delete(id);
+                }
+            });
+
+            // Видимые карточки — по порядку, с переиспользованием узлов
+            let prev = null;
+            const refilled = [];
+            for (let i = start; i < end; i++) {
+                const product = filteredProducts[i];
+                let card = renderedCards.get(product.id);
+                if (!card) {
+                    card = takeCard();
+                    renderedCards.set(product.id, card);
+                }
+                if (fillCard(card, product)) refilled.push(card);
+                const next = prev ? prev.nextSibling : grid.firstChild;
+                if (card !== next) grid.insertBefore(card, next);
+                prev = card;
+            }
+
+            // Одинаковая высота рядов — иначе отступы не совпадут с реальной сеткой.
+            // После сброса меряем все карточки, дальше — только перерисованные:
+            // если содержимое (длинное название, бейджи) не влезает в ряд,
+            // ряды растут для всей сетки
+            let maxHeight = 0;
+            (gridRowHeight ? refilled : [...renderedCards.values()])
+                .forEach(card => { maxHeight = Math.max(maxHeight, card.scrollHeight); });
+            if (maxHeight > 0 && maxHeight + GRID_GAP > gridRowHeight) {
+                grid.style.gridAutoRows = maxHeight + 'px';
+                gridRowHeight = maxHeight + GRID_GAP;
+                return renderVisibleCards();
+            }
+
+            grid.style.paddingTop = firstRow * rowHeight + 'px';
+            grid.style.paddingBottom = Math.max(0, totalRows - lastRow - 1) * rowHeight + 'px';
+        }
+
+        function renderProducts(searchQuery = '') {
+            if (!catalogLoaded) {
+                // Страница под эти фильтры ещё не пришла — просим её, карточки пока прежние
+                const key = previewParams(searchQuery);
+                if (key !== previewKey) {
+                    loadPreviewPage(key);
+                    return;
+                }
+            }
+            const grid = document.getElementById('productsGrid');
+            const scrollY = window.scrollY;
+
+            // Пришёл новый каталог — старое содержимое карточек не годится даже для тех же id
+            if (renderedCatalog !== products) {
+                renderedCatalog = products;
+                releaseAllCards();
+                cardPool.forEach(card => { delete card.dataset.id; });
+            }
+
+            // Страницу до загрузки каталога сервер уже отфильтровал
+            filteredProducts = catalogLoaded ? filterProducts(searchQuery) : products;
+            const emptyMessage = grid.querySelector('.grid-empty');
+            if (emptyMessage) emptyMessage.remove();
+
+            // Если ничего не найдено
+            if (filteredProducts.length === 0) {
+                releaseAllCards();
+                grid.style.paddingTop = '0px';
+                grid.style.paddingBottom = '0px';
+                grid.insertAdjacentHTML('beforeend', `
+                    <div class="grid-empty" style="grid-column: 1/-1; text-align: center; padding: 60px 20px; color: rgba(0,0,0,0.5);">
+                        <div style="font-size: 48px; margin-bottom: 16px;">🔍</div>
+                        <div style="font-size: 18px; font-weight: 600;">Ничего не найдено</div>
+                        <div style="font-size: 14px; margin-top: 8px;">Попробуйте изменить запрос</div>
+                    </div>
+                `);
+                updateCartFooter();
+                return;
+            }
+
+            renderVisibleCards();
+
+            // Сохраняем позицию прокрутки при смене фильтра (насколько позволяет высота)
+            const maxScroll = document.documentElement.scrollHeight - window.innerHeight;
+            if (window.scrollY !== Math.min(scrollY, maxScroll)) {
+                window.scrollTo(0, Math.min(scrollY, maxScroll));
+                renderVisibleCards();
+            }
+
+            updateCartFooter();
+        }
+
+        // Догружаем карточки при прокрутке (не чаще раза за кадр)
+        let gridFramePending = false;
+        window.addEventListener('scroll', () => {
+            if (gridFramePending) return;
+            gridFramePending = true;
+            requestAnimationFrame(() => {
+                gridFramePending = false;
+                renderVisibleCards();
+            });
+        }, { passive: true });
+
+        // Ширина колонок изменилась — высоту рядов меряем заново
+        window.addEventListener('resize', () => {
+            const grid = document.getElementById('productsGrid');
+            grid.style.gridAutoRows = '';
+            gridRowHeight = 0;
+            renderVisibleCards();
+        });
+
+        // Рендеринг вкладок категорий (группы)
+        function renderCategories() {
+            const categoriesContainer = document.getElementById('categoriesTabs');
+            categoriesContainer.innerHTML = '';
+
+            const categories = catalogLoaded
+                ? [...getCatalogIndex().category.keys()]
+                : (facets ? facets.categories.map(c => c.name) : []);
+
+            if (products.length === 0 && !facets) return;
+
+            if (categories.length === 0) {
+                const allTab = document.createElement('button');
+                allTab.className = 'category-tab active';
+                allTab.textContent = 'Все';
+                categoriesContainer.appendChild(allTab);
+                renderSubcategories();
+                renderBrands();
+                return;
+            }
+
+            // Вкладка "Все"
+            const allTab = document.createElement('button');
+            allTab.className = 'category-tab' + (!currentCategory ? ' active' : '');
+            allTab.textContent = 'Все';
+            allTab.onclick = () => {
+                if (!currentCategory) return;
+                currentCategory = null;
+                currentSubcategory = null;
+                currentBrand = null;
+                selectedSizes.clear();
+                currentGender = null;
+                renderCategories();
+                renderSubcategories();
+                renderBrands();
+                renderProducts(searchInput.value);
+            };
+            categoriesContainer.appendChild(allTab);
+
+            // Вкладки групп
+            categories.sort().forEach(category => {
+                const tab = document.createElement('button');
+                tab.className = 'category-tab' + (currentCategory === category ? ' active' : '');
+                tab.textContent = category;
+                tab.onclick = () => {
+                    if (currentCategory === category) {
+                        currentCategory = null;
+                        currentSubcategory = null;
+                    } else {
+                        currentCategory = category;
+                        currentSubcategory = null;
+                    }
+                    currentBrand = null;
+                    selectedSizes.clear();
+                currentGender = null;
+                    renderCategories();
+                    renderSubcategories();
+                    renderBrands();
+                    renderProducts(searchInput.value);
+                };
+                categoriesContainer.appendChild(tab);
+            });
+
+            renderSubcategories();
+            renderBrands();
+        }
+
+        // Рендеринг подвкладок (подгруппы)
+        function renderSubcategories() {
+            const container = document.getElementById('subcategoriesContainer');
+            const tabsContainer = document.getElementById('subcategoriesTabs');
+            tabsContainer.innerHTML = '';
+
+            // Если группа не выбрана — скрываем подвкладки
+            if (!currentCategory) {
+                container.classList.remove('visible');
+                return;
+            }
+
+            // Получаем подгруппы для выбранной группы
+            let subcategories;
+            if (catalogLoaded) {
+                const index = getCatalogIndex();
+                subcategories = [...facetCounts(index.subcategory, valueBits(index.category, currentCategory)).keys()];
+            } else {
+                const node = facets && facets.categories.find(c => c.name === currentCategory);
+                subcategories = node ? node.subcategories.map(s => s.name) : [];
+            }
+
+            // Если подгрупп нет или только одна — не показываем
+            if (subcategories.length <= 1) {
+                container.classList.remove('visible');
+                return;
+            }
+
+            // Показываем контейнер
+            container.classList.add('visible');
+
+            // Вкладка "Все" для подгрупп
+            const allTab = document.createElement('button');
+            allTab.className = 'subcategory-tab' + (!currentSubcategory ? ' active' : '');
+            allTab.textContent = 'Все';
+            allTab.onclick = () => {
+                if (!currentSubcategory) return;
+                currentSubcategory = null;
+                currentBrand = null;
+                selectedSizes.clear();
+                currentGender = null;
+                renderSubcategories();
+                renderBrands();
+                renderProducts(searchInput.value);
+            };
+            tabsContainer.appendChild(allTab);
+
+            // Вкладки подгрупп
+            subcategories.sort().forEach(sub => {
+                const tab = document.createElement('button');
+                tab.className = 'subcategory-tab' + (currentSubcategory === sub ? ' active' : '');
+                tab.textContent = sub;
+                tab.onclick = () => {
+                    if (currentSubcategory === sub) {
+                        currentSubcategory = null;
+                    } else {
+                        currentSubcategory = sub;
+                    }
+                    currentBrand = null;
+                    selectedSizes.clear();
+                currentGender = null;
+                    renderSubcategories();
+                    renderBrands();
+                    renderProducts(searchInput.value);
+                };
+                tabsContainer.appendChild(tab);
+            });
         }
 
-        .product-card {
-            background: linear-gradient(135deg, #ffffff 0%, #f8f9fa 100%);
-            border-radius: 16px;
-            padding: 14px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            box-shadow: 0 4px 12px rgba(0, 0, 0, 0.08);
-            position: relative;
-            overflow: hidden;
-            animation: fadeInUp 0.6s ease-out;
-            animation-fill-mode: both;
-            border: 1px solid rgba(0, 0, 0, 0.06);
-        }
+        // Рендеринг фильтра по брендам
+        function renderBrands() {
+            const container = document.getElementById('brandsContainer');
+            const tabsContainer = document.getElementById('brandsTabs');
+            tabsContainer.innerHTML = '';
 
-        .product-card:hover {
-            transform: translateY(-4px) scale(1.03);
-            box-shadow: 0 8px 20px rgba(0, 0, 0, 0.12);
-        }
+            // Получаем бренды для текущей выборки (с учётом группы и подгруппы)
+            const brandCounts = catalogLoaded
+                ? facetCounts(getCatalogIndex().brand, selectionBits('brand'))
+                : preloadedBrandCounts();
+            const brands = [...brandCounts.keys()];
 
-        .product-card:active {
-            transform: scale(0.98);
-        }
+            // Если брендов нет или только один — не показываем
+            if (brands.length <= 1) {
+                container.classList.remove('visible');
+                currentBrand = null;
+                renderSizeFilter();
+                return;
+            }
 
-        .product-card.in-cart {
-            border-color: #667eea;
-            box-shadow: 0 4px 16px rgba(102, 126, 234, 0.2);
-        }
+            container.classList.add('visible');
 
-        .product-image {
-            width: 100%;
-            height: 140px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            background: linear-gradient(135deg, #f0f4f8 0%, #e2e8f0 100%);
-            border-radius: 12px;
-            margin-bottom: 12px;
-            overflow: hidden;
-        }
+            // Вкладка "Все бренды"
+            const allTab = document.createElement('button');
+            allTab.className = 'brand-tab' + (!currentBrand ? ' active' : '');
+            allTab.textContent = 'Все';
+            allTab.onclick = () => {
+                if (!currentBrand) return;
+                currentBrand = null;
+                selectedSizes.clear();
+                currentGender = null;
+                renderBrands();
+                renderSizeFilter();
+                renderProducts(searchInput.value);
+            };
+            tabsContainer.appendChild(allTab);
 
-        .product-image img {
-            max-width: 100%;
-            max-height: 120px;
-            object-fit: contain;
-        }
+            // Вкладки брендов
+            brands.sort().forEach(brand => {
+                const count = brandCounts.get(brand);
+                const tab = document.createElement('button');
+                tab.className = 'brand-tab' + (currentBrand === brand ? ' active' : '');
+                tab.textContent = `${brand} (${count})`;
+                tab.onclick = () => {
+                    if (currentBrand === brand) {
+                        currentBrand = null;
+                    } else {
+                        currentBrand = brand;
+                    }
+                    selectedSizes.clear();
+                currentGender = null;
+                    renderBrands();
+                    renderSizeFilter();
+                    renderProducts(searchInput.value);
+                };
+                tabsContainer.appendChild(tab);
+            });
 
-        .product-image div {
-            font-size: 56px;
+            renderSizeFilter();
         }
 
-        .product-badge {
-            position: absolute;
-            top: 8px;
-            right: 8px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            padding: 4px 10px;
-            border-radius: 12px;
-            font-size: 10px;
-            font-weight: 700;
-            z-index: 3;
-            box-shadow: 0 2px 8px rgba(102, 126, 234, 0.4);
-            display: none;
-        }
+        // Рендеринг фильтра по размерам
+        function renderSizeFilter() {
+            const container = document.getElementById('sizeFilterContainer');
+            const grid = document.getElementById('sizeFilterGrid');
+            const resetBtn = document.getElementById('sizeFilterReset');
+            grid.innerHTML = '';
 
-        .product-card.in-cart .product-badge {
-            display: block;
-            animation: pulse 2s infinite;
-        }
+            // Собираем все размеры из текущей выборки
+            const allSizes = new Set(facetCounts(getCatalogIndex().size, selectionBits('size')).keys());
 
-        .product-name {
-            font-weight: 600;
-            font-size: 14px;
-            margin-bottom: 8px;
-            color: #2d3748;
-            line-height: 1.4;
-            display: -webkit-box;
-            -webkit-line-clamp: 2;
-            -webkit-box-orient: vertical;
-            overflow: hidden;
-            min-height: 40px;
-        }
+            if (allSizes.size <= 1) {
+                container.classList.remove('visible');
+                selectedSizes.clear();
+                currentGender = null;
+                renderGenderFilter();
+                return;
+            }
 
-        .product-price {
-            font-size: 20px;
-            font-weight: 800;
-            color: #667eea;
-            letter-spacing: -0.5px;
-        }
-        .price-delivery-hint {
-            font-size: 10px;
-            font-weight: 400;
-            color: #999;
-            letter-spacing: 0;
+            container.classList.add('visible');
+
+            // Сортировка размеров (числовая)
+            const sortedSizes = [...allSizes].sort((a, b) => {
+                const numA = parseFloat(a.replace(/[^\d.,]/g, '').replace(',', '.'));
+                const numB = parseFloat(b.replace(/[^\d.,]/g, '').replace(',', '.'));
+                if (!isNaN(numA) && !isNaN(numB)) return numA - numB;
+                return a.localeCompare(b);
+            });
+
+            // Кнопка сброса
+            resetBtn.style.display = selectedSizes.size > 0 ? 'block' : 'none';
+            resetBtn.onclick = () => {
+                selectedSizes.clear();
+                currentGender = null;
+                renderSizeFilter();
+                renderProducts(searchInput.value);
+            };
+
+            sortedSizes.forEach(size => {
+                const btn = document.createElement('button');
+                btn.className = 'size-filter-btn' + (selectedSizes.has(size) ? ' active' : '');
+                btn.textContent = size;
+                btn.onclick = () => {
+                    if (selectedSizes.has(size)) {
+                        selectedSizes.delete(size);
+                    } else {
+                        selectedSizes.add(size);
+                    }
+                    renderSizeFilter();
+                    renderProducts(searchInput.value);
+                };
+                grid.appendChild(btn);
+            });
+
+            renderGenderFilter();
         }
 
-        .product-quantity {
-            display: flex;
-            align-items: center;
-            justify-content: space-between;
-            margin-top: 10px;
-            gap: 10px;
-            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-            padding: 6px;
-            border-radius: 12px;
+        // Рендеринг фильтра по полу
+        function renderGenderFilter() {
+            const container = document.getElementById('genderFilterContainer');
+            container.innerHTML = '';
+
+            // Собираем полы из текущей выборки
+            const genders = [...facetCounts(getCatalogIndex().gender, selectionBits('size')).keys()];
+
+            if (genders.length <= 1) {
+                currentGender = null;
+                return;
+            }
+
+            // Вкладка "Все"
+            const allTab = document.createElement('button');
+            allTab.className = 'gender-tab' + (!currentGender ? ' active' : '');
+            allTab.textContent = 'Все';
+            allTab.onclick = () => {
+                if (!currentGender) return;
+                currentGender = null;
+                renderGenderFilter();
+                renderProducts(searchInput.value);
+            };
+            container.appendChild(allTab);
+
+            genders.sort().forEach(g => {
+                const tab = document.createElement('button');
+                tab.className = 'gender-tab' + (currentGender === g ? ' active' : '');
+                tab.textContent = g;
+                tab.onclick = () => {
+                    currentGender = currentGender === g ? null : g;
+                    renderGenderFilter();
+                    renderProducts(searchInput.value);
+                };
+                container.appendChild(tab);
+            });
         }
 
-        .quantity-btn {
-            width: 36px;
-            height: 36px;
-            border-radius: 10px;
-            border: none;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            font-size: 20px;
-            font-weight: bold;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            transition: all 0.3s ease;
-            box-shadow: 0 2px 8px rgba(102, 126, 234, 0.3);
-        }
+        function changeQuantity(productId, delta) {
+            if (!cart[productId]) {
+                cart[productId] = 0;
+            }
 
-        .quantity-btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 4px 12px rgba(102, 126, 234, 0.4);
-        }
+            cart[productId] += delta;
 
-        .quantity-btn:active {
-            transform: scale(0.95);
-        }
+            if (cart[productId] <= 0) {
+                delete cart[productId];
+            }
 
-        .quantity-display {
-            font-weight: 700;
-            font-size: 18px;
-            min-width: 30px;
-            text-align: center;
-            color: var(--tg-theme-text-color, #212529);
+            renderProducts();
+            tg.HapticFeedback.impactOccurred('light');
         }
 
-        .cart-footer {
-            position: fixed;
-            bottom: 0;
-            left: 0;
-            right: 0;
-            background: rgba(255, 255, 255, 0.25);
-            backdrop-filter: blur(30px) saturate(180%);
-            -webkit-backdrop-filter: blur(30px) saturate(180%);
-            padding: 20px;
-            box-shadow: 0 -8px 32px rgba(0, 0, 0, 0.2);
-            display: none;
-            border-top: 1px solid rgba(255, 255, 255, 0.4);
-            z-index: 100;
-        }
+        function updateCartFooter() {
+            const footer = document.getElementById('cartFooter');
+            const cartCount = document.getElementById('cartCount');
+            const cartTotal = document.getElementById('cartTotal');
 
-        .cart-footer.visible {
-            display: block;
-            animation: slideUp 0.4s cubic-bezier(0.4, 0, 0.2, 1);
-        }
+            let totalItems = 0;
+            let totalPrice = 0;
 
-        .cart-summary {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            margin-bottom: 14px;
-            font-size: 16px;
-            font-weight: 700;
-            color: #2d2d2d;
-            text-shadow: 0 1px 3px rgba(255,255,255,0.5);
-        }
+            for (const [productId, quantity] of Object.entries(cart)) {
+                const product = getCatalogIndex().byId.get(parseInt(productId));
+                if (product) {
+                    totalItems += quantity;
+                    totalPrice += product.price * quantity;
+                }
+            }
 
-        .cart-total {
-            font-size: 26px;
-            font-weight: 900;
-            background: linear-gradient(135deg, #FF6B35, #FFD93D);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            background-clip: text;
-            filter: drop-shadow(0 2px 4px rgba(255,107,53,0.3));
+            if (totalItems > 0) {
+                footer.classList.add('visible');
+                cartCount.textContent = totalItems;
+                cartTotal.textContent = formatPrice(totalPrice);
+            } else {
+                footer.classList.remove('visible');
+            }
         }
 
-        .order-btn {
-            width: 100%;
-            padding: 18px;
-            border-radius: 16px;
-            border: none;
-            background: linear-gradient(135deg, #FF6B35 0%, #FFD93D 100%);
-            color: white;
-            font-size: 18px;
-            font-weight: 800;
-            cursor: pointer;
-            box-shadow: 0 8px 24px rgba(255,107,53,0.4);
-            transition: all 0.4s cubic-bezier(0.4, 0, 0.2, 1);
-            letter-spacing: 1px;
-            text-transform: uppercase;
-            position: relative;
-            overflow: hidden;
-        }
+        // Подготовка данных для отправки
+        function prepareConsultationData() {
+            const items = [];
+            let total = 0;
 
-        .order-btn::before {
-            content: '';
-            position: absolute;
-            top: 0;
-            left: -100%;
-            width: 100%;
-            height: 100%;
-            background: linear-gradient(90deg, transparent, rgba(255,255,255,0.3), transparent);
-            transition: left 0.5s;
-        }
+            for (const [productId, quantity] of Object.entries(cart)) {
+                const product = getCatalogIndex().byId.get(parseInt(productId));
+                if (product) {
+                    items.push({
+                        id: product.id,
+                        name: product.name,
+                        price: product.price,
+                        quantity: quantity,
+                        image: product.image
+                    });
+                    total += product.price * quantity;
+                }
+            }
 
-        .order-btn:hover::before {
-            left: 100%;
+            return {
+                action: 'consultation',
+                items: items,
+                total: total
+            };
         }
 
-        .order-btn:hover {
-            transform: translateY(-3px) scale(1.02);
-            box-shadow: 0 12px 32px rgba(255,107,53,0.5);
-        }
+        // Кнопка консультации - открывает выбор менеджера
+        document.getElementById('orderBtn').addEventListener('click', () => {
+            const data = prepareConsultationData();
 
-        .order-btn:active {
-            transform: scale(0.98);
-        }
+            if (data.items.length === 0) {
+                tg.showAlert('Добавьте хотя бы один товар в интересное!');
+                return;
+            }
 
-        .empty-cart {
-            text-align: center;
-            padding: 60px 20px;
-            color: var(--tg-theme-hint-color, #6c757d);
-        }
+            // Формируем текст для отправки менеджеру
+            let messageText = 'Здравствуйте, подскажите о наличии товара:\\n\\n';
+            data.items.forEach(item => {
+                messageText += `• ${item.name} — ${formatPrice(item.price)} ₽\\n`;
+            });
+            messageText += `\\n💰 Общая стоимость: ${formatPrice(data.total)} ₽`;
 
-        .empty-cart-icon {
-            font-size: 72px;
-            margin-bottom: 20px;
-            opacity: 0.5;
-            animation: pulse 3s infinite;
-        }
+            // Случайно выбираем менеджера
+            const managers = ['AlexeyBakaev', 'musyanya'];
+            const username = managers[Math.floor(Math.random() * managers.length)];
+            const url = `https://t.me/${username}?text=${encodeURIComponent(messageText)}`;
 
-        /* Модальное окно товара */
-        .modal-overlay {
-            position: fixed;
-            top: 0;
-            left: 0;
-            right: 0;
-            bottom: 0;
-            background: rgba(0, 0, 0, 0.7);
-            backdrop-filter: blur(10px);
-            display: none;
-            align-items: center;
-            justify-content: center;
-            z-index: 1000;
-            padding: 20px;
-            animation: fadeIn 0.3s ease;
-        }
+            // Открываем чат с менеджером
+            tg.openTelegramLink(url);
+        });
+    </script>
+</body>
+</html>
+"""
 
-        @keyframes fadeIn {
-            from { opacity: 0; }
-            to { opacity: 1; }
+
+# Бенчмарк сетки (/bench/grid?n=10000): на страницу — только при GRID_BENCHMARK = True
+GRID_BENCH_SCRIPT = """
+        // ═══ Бенчмарк сетки: /bench/grid?n=10000 ═══
+        function makeSyntheticProducts(count) {
+            const categories = ['Падел', 'Теннис', 'Бег', 'Волейбол', 'Сквош'];
+            const genders = ['Мужские', 'Женские', 'Унисекс'];
+            const sizes = ['36', '37', '38', '39', '40', '41', '42', '43', '44', '45'];
+            const result = [];
+            for (let i = 0; i < count; i++) {
+                result.push({
+                    id: i + 1,
+                    name: `Товар ${i + 1} — кроссовки модель ${i % 97}`,
+                    price: 5000 + (i * 137) % 40000,
+                    category: categories[i % categories.length],
+                    subcategory: `Подгруппа ${i % 4}`,
+                    brand: `Бренд ${i % 40}`,
+                    sizes: sizes.filter((_, k) => (i + k) % 3 === 0),
+                    gender: genders[i % genders.length],
+                    balance: i % 5 === 0 ? 'Мощность' : '',
+                    priority: i % 50 === 0 ? 1 : 0,
+                    image: '👟'
+                });
+            }
+            return result;
         }
 
-        .modal-overlay.active {
-            display: flex;
+        function nextFrame() {
+            return new Promise(resolve => requestAnimationFrame(() => resolve()));
         }
 
-        .modal-content {
-            background: #ffffff;
-            border-radius: 20px;
-            max-width: 500px;
-            width: 100%;
-            max-height: 90vh;
-            overflow-y: auto;
-            position: relative;
-            box-shadow: 0 10px 40px rgba(0, 0, 0, 0.3);
-            animation: slideInUp 0.4s cubic-bezier(0.4, 0, 0.2, 1);
+        async function runGridBenchmark() {
+            const count = parseInt(new URLSearchParams(location.search).get('n')) || 10000;
+            products = makeSyntheticProducts(count);
+            catalogLoaded = true;
+            renderCategories();
+            renderProducts();
+            await nextFrame();
+
+            const resetFilters = () => {
+                currentCategory = null;
+                currentSubcategory = null;
+                currentBrand = null;
+                selectedSizes.clear();
+                currentGender = null;
+                searchInput.value = '';
+            };
+            const steps = [
+                ['Все товары', resetFilters],
+                ['Группа «Падел»', () => { resetFilters(); currentCategory = 'Падел'; }],
+                ['Группа «Бег»', () => { resetFilters(); currentCategory = 'Бег'; }],
+                ['Бренд', () => { currentBrand = 'Бренд 2'; }],
+                ['Размер 42', () => { currentBrand = null; selectedSizes.add('42'); }],
+                ['Пол', () => { currentGender = 'Женские'; }],
+                ['Поиск «модель 1»', () => { resetFilters(); searchInput.value = 'модель 1'; }],
+                ['Сброс', resetFilters]
+            ];
+
+            const results = [];
+            for (let round = 0; round < 3; round++) {
+                for (const [name, apply] of steps) {
+                    apply();
+                    const start = performance.now();
+                    renderBrands();
+                    renderProducts(searchInput.value);
+                    document.body.offsetHeight;  // Принудительный layout — входит в замер
+                    results.push({ name, ms: performance.now() - start, shown: filteredProducts.length, nodes: renderedCards.size });
+                    await nextFrame();
+                }
+            }
+
+            // Прокрутка по всему списку
+            resetFilters();
+            renderProducts();
+            const maxScroll = document.documentElement.scrollHeight - window.innerHeight;
+            for (let i = 1; i <= 20; i++) {
+                window.scrollTo(0, maxScroll * i / 20);
+                const start = performance.now();
+                renderVisibleCards();
+                document.body.offsetHeight;
+                results.push({ name: 'Прокрутка', ms: performance.now() - start, shown: filteredProducts.length, nodes: renderedCards.size });
+                await nextFrame();
+            }
+            window.scrollTo(0, 0);
+
+            // Сводка: среднее и максимум по каждому шагу
+            const summary = {};
+            results.forEach(r => {
+                const row = summary[r.name] || (summary[r.name] = { 'среднее, мс': 0, 'макс, мс': 0, 'показано': r.shown, 'карточек в DOM': 0, runs: 0 });
+                row['среднее, мс'] += r.ms;
+                row['макс, мс'] = Math.max(row['макс, мс'], r.ms);
+                row['карточек в DOM'] = Math.max(row['карточек в DOM'], r.nodes);
+                row.runs++;
+            });
+            Object.values(summary).forEach(row => {
+                row['среднее, мс'] = +(row['среднее, мс'] / row.runs).toFixed(1);
+                row['макс, мс'] = +row['макс, мс'].toFixed(1);
+                delete row.runs;
+            });
+            console.table(summary);
+
+            const overlay = document.createElement('pre');
+            overlay.id = 'benchResults';
+            overlay.style.cssText = 'position: fixed; left: 8px; bottom: 8px; z-index: 10000; margin: 0; padding: 10px; font-size: 11px; background: rgba(0,0,0,0.8); color: #fff; border-radius: 8px; max-height: 50vh; overflow: auto;';
+            overlay.textContent = `⏱ ${count} товаров\\n` + Object.entries(summary)
+                .map(([name, row]) => `${name}: ${row['среднее, мс']} / ${row['макс, мс']} мс, DOM ${row['карточек в DOM']}`)
+                .join('\\n');
+            document.body.appendChild(overlay);
         }
+"""
+
+# Service worker Mini App: оболочка и каталог — stale-while-revalidate
+# (каталог сверяется по ETag), фото с отпечатком — из кэша, прочие — из сети.
+SW_TEMPLATE = """
+const SHELL_CACHE = 'shell-v1';
+const CATALOG_CACHE = 'catalog-v1';
+const IMAGE_CACHE = 'images-v2';  // v2: без отпечатка — не cache-first
+const IMAGE_CACHE_MAX_ENTRIES = 400;
+const CATALOG_PATHS = ['/api/products', '/api/facets'];
+
+self.addEventListener('install', event => {
+    event.waitUntil(caches.open(SHELL_CACHE).then(cache => cache.add('/')).then(() => self.skipWaiting()));
+});
+
+self.addEventListener('activate', event => {
+    const keep = [SHELL_CACHE, CATALOG_CACHE, IMAGE_CACHE];
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => !keep.includes(name)).map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+// Отдаём копию из кэша сразу, а в фоне сверяемся с сервером по ETag
+async function staleWhileRevalidate(event, cacheName, request) {
+    const cache = await caches.open(cacheName);
+    const cached = await cache.match(request);
+
+    const headers = new Headers();
+    const etag = cached && cached.headers.get('ETag');
+    if (etag) headers.set('If-None-Match', etag);
+    const refresh = fetch(request.url, { headers, cache: 'no-store', credentials: 'same-origin' })
+        .then(response => {
+            if (response.status === 200) {
+                cache.put(request, response.clone());
+                return response;
+            }
+            return cached || response;  // 304 — копия актуальна
+        });
+
+    if (cached) {
+        event.waitUntil(refresh.catch(() => {}));
+        return cached;
+    }
+    return refresh;
+}
+
+// Фото с отпечатком (?v=хэш или имя-хэш) неизменны — кэш навсегда.
+// Кладём, только если сервер подтвердил immutable (чужой ?v= он не подтвердит)
+const CONTENT_ADDRESSED = /\\/[0-9a-f]{64}(_w\\d+)?\\.\\w+$/;
+
+function isFingerprinted(url) {
+    return url.searchParams.has('v') || CONTENT_ADDRESSED.test(url.pathname);
+}
+
+async function rememberImage(cache, request, response) {
+    await cache.put(request, response);
+    const keys = await cache.keys();  // Старые вытесняются по порядку добавления
+    for (let i = 0; i < keys.length - IMAGE_CACHE_MAX_ENTRIES; i++) {
+        await cache.delete(keys[i]);
+    }
+}
+
+async function cacheFirstImage(request) {
+    const cache = await caches.open(IMAGE_CACHE);
+    const cached = await cache.match(request);
+    if (cached) return cached;
+
+    const response = await fetch(request);
+    if (response.status === 200 && (response.headers.get('Cache-Control') || '').includes('immutable')) {
+        await rememberImage(cache, request, response.clone());
+    }
+    return response;
+}
+
+// Фото без отпечатка сервер отдаёт с no-cache — идём в сеть (с ETag браузера),
+// копия из кэша — только офлайн
+async function networkFirstImage(request) {
+    const cache = await caches.open(IMAGE_CACHE);
+    try {
+        const response = await fetch(request);
+        if (response.status === 200) await rememberImage(cache, request, response.clone());
+        return response;
+    } catch (error) {
+        const cached = await cache.match(request);
+        if (cached) return cached;
+        throw error;
+    }
+}
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) return;
+
+    if (request.mode === 'navigate' && url.pathname === '/') {
+        event.respondWith(staleWhileRevalidate(event, SHELL_CACHE, new Request('/')));
+    } else if (CATALOG_PATHS.includes(url.pathname) && !url.search) {
+        event.respondWith(staleWhileRevalidate(event, CATALOG_CACHE, new Request(url.pathname)));
+    } else if (url.pathname.startsWith('/images/') || url.pathname.startsWith('/thumb/')) {
+        event.respondWith(isFingerprinted(url) ? cacheFirstImage(request) : networkFirstImage(request));
+    }
+});
+"""
 
-        @keyframes slideInUp {
-            from {
-                opacity: 0;
-                transform: translateY(50px);
-            }
-            to {
-                opacity: 1;
-                transform: translateY(0);
-            }
-        }
 
-        .modal-close {
-            position: absolute;
-            top: 16px;
-            right: 16px;
-            width: 36px;
-            height: 36px;
-            border-radius: 50%;
-            background: rgba(0, 0, 0, 0.1);
-            border: none;
-            font-size: 24px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            z-index: 1;
-            transition: all 0.3s ease;
-        }
+async def handle_index(request: web.Request) -> web.Response:
+    """Отдаёт HTML страницу Mini App."""
+    return web.Response(text=HTML_TEMPLATE, content_type="text/html")
 
-        .modal-close:hover {
-            background: rgba(0, 0, 0, 0.2);
-            transform: rotate(90deg);
-        }
 
-        .modal-image-container {
-            position: relative;
-            width: 100%;
-            height: 300px;
-            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-            border-radius: 20px 20px 0 0;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            overflow: hidden;
-        }
+async def handle_grid_benchmark(request: web.Request) -> web.Response:
+    """Страница бенчмарка сетки: Mini App + скрипт замеров (только при GRID_BENCHMARK)."""
+    html = HTML_TEMPLATE.replace("</body>", f"<script>{GRID_BENCH_SCRIPT}</script>\n</body>", 1)
+    return web.Response(text=html, content_type="text/html")
 
-        .modal-image {
-            width: 100%;
-            height: 100%;
-            object-fit: cover;
-            transition: opacity 0.3s ease;
-        }
 
-        .gallery-nav {
-            position: absolute;
-            top: 50%;
-            transform: translateY(-50%);
-            width: 40px;
-            height: 40px;
-            background: rgba(255, 255, 255, 0.9);
-            border: none;
-            border-radius: 50%;
-            font-size: 24px;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            box-shadow: 0 2px 10px rgba(0, 0, 0, 0.2);
-            transition: all 0.3s ease;
-            z-index: 10;
-        }
+async def handle_service_worker(request: web.Request) -> web.Response:
+    """Отдаёт service worker Mini App (всегда сверяется с сервером — no-cache)."""
+    return web.Response(
+        text=SW_TEMPLATE,
+        content_type="application/javascript",
+        headers={"Cache-Control": "no-cache"},
+    )
 
-        .gallery-nav:hover {
-            background: white;
-            transform: translateY(-50%) scale(1.1);
-        }
 
-        .gallery-nav-prev {
-            left: 10px;
-        }
+# Предпочтение кодировок, если клиент принимает несколько
+PREFERRED_ENCODINGS = ("br", "gzip")
 
-        .gallery-nav-next {
-            right: 10px;
-        }
 
-        .gallery-counter {
-            position: absolute;
-            bottom: 10px;
-            left: 50%;
-            transform: translateX(-50%);
-            background: rgba(0, 0, 0, 0.7);
-            color: white;
-            padding: 6px 14px;
-            border-radius: 20px;
-            font-size: 12px;
-            font-weight: 600;
-            z-index: 10;
-        }
+def choose_encoding(request: web.Request, available) -> str:
+    """Выбирает Content-Encoding по заголовку Accept-Encoding."""
+    accepted = {}
+    for item in request.headers.get("Accept-Encoding", "").split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
 
-        .sizes-section {
-            margin-bottom: 20px;
-        }
+    for encoding in PREFERRED_ENCODINGS:
+        q = accepted.get(encoding, accepted.get("*", 0.0))
+        if encoding in available and q > 0:
+            return encoding
+    return "identity"
 
-        .sizes-title {
-            font-size: 16px;
-            font-weight: 700;
-            margin-bottom: 12px;
-            color: var(--tg-theme-text-color, #212529);
-        }
 
-        .sizes-grid {
-            display: grid;
-            grid-template-columns: repeat(auto-fill, minmax(60px, 1fr));
-            gap: 8px;
-        }
+def json_payload_response(request: web.Request, payload, extra_headers=None) -> web.Response:
+    """
+    Отдаёт заранее сериализованный JSON (см. build_json_payload).
 
-        .size-badge {
-            padding: 10px;
-            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-            border: 2px solid rgba(102, 126, 234, 0.3);
-            border-radius: 10px;
-            text-align: center;
-            font-weight: 600;
-            font-size: 14px;
-            color: #212529;
-            transition: all 0.3s ease;
-        }
+    Сильный ETag на каждую кодировку, If-None-Match → 304,
+    сжатое тело выбирается по Accept-Encoding.
+    """
+    encoding = choose_encoding(request, payload["bodies"])
+    etag = payload["etag"] if encoding == "identity" else f'{payload["etag"]}-{encoding}'
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        **(extra_headers or {}),
+    }
 
-        .size-badge:hover {
-            background: linear-gradient(135deg, rgba(102, 126, 234, 0.2) 0%, rgba(118, 75, 162, 0.2) 100%);
-            border-color: #667eea;
-            transform: translateY(-2px);
-        }
+    # Любая кодировка этой же версии считается совпадением
+    if_none_match = request.headers.get("If-None-Match", "")
+    for tag in if_none_match.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+        if tag == "*" or tag.split("-")[0] == payload["etag"]:
+            return web.Response(status=304, headers=headers)
+
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return web.Response(
+        body=payload["bodies"][encoding],
+        content_type="application/json",
+        charset="utf-8",
+        headers=headers,
+    )
 
-        .modal-body {
-            padding: 24px;
-        }
 
-        .modal-title {
-            font-size: 24px;
-            font-weight: 800;
-            margin-bottom: 12px;
-            color: #212529;
-            line-height: 1.3;
-        }
+# Размер страницы /api/products?limit=...
+PRODUCTS_PAGE_DEFAULT = 50
+PRODUCTS_PAGE_MAX = 500
 
-        .modal-price-section {
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-            padding: 16px;
-            background: linear-gradient(135deg, rgba(102, 126, 234, 0.1) 0%, rgba(118, 75, 162, 0.1) 100%);
-            border-radius: 14px;
-            margin-bottom: 20px;
-        }
 
-        .modal-price-label {
-            font-size: 14px;
-            font-weight: 600;
-            color: #6c757d;
-        }
+def query_catalog(catalog, filters, sizes=(), query=""):
+    """
+    Позиции товаров под фильтры, по возрастанию.
 
-        .modal-price {
-            font-size: 32px;
-            font-weight: 800;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            -webkit-background-clip: text;
-            -webkit-text-fill-color: transparent;
-            background-clip: text;
-        }
+    filters — {поле: значение} из CATALOG_FILTER_FIELDS (пересечение),
+    sizes — любой из размеров (объединение), query — подстрока в имени.
+    """
+    index = catalog.index
+    groups = [index["fields"][field].get(value, ()) for field, value in filters.items()]
+    if sizes:
+        size_index = index["fields"]["size"]
+        groups.append(set().union(*(size_index.get(size, ()) for size in sizes)))
+
+    if groups:
+        # Начинаем с самой короткой выборки — пересечение дешевле
+        groups.sort(key=len)
+        selected = set(groups[0])
+        for group in groups[1:]:
+            selected.intersection_update(group)
+        positions = sorted(selected)
+    else:
+        positions = range(len(catalog.products))
 
-        .modal-info-section {
-            margin-bottom: 20px;
-        }
+    if query:
+        names = index["names"]
+        query = query.lower()
+        positions = [pos for pos in positions if query in names[pos]]
+    return positions
 
-        .modal-info-title {
-            font-size: 16px;
-            font-weight: 700;
-            margin-bottom: 12px;
-            color: #212529;
-        }
 
-        .modal-info-item {
-            display: flex;
-            justify-content: space-between;
-            padding: 10px 0;
-            border-bottom: 1px solid rgba(0, 0, 0, 0.05);
-        }
+def products_page_response(request: web.Request, catalog) -> web.Response:
+    """
+    Страница каталога: фильтры, проекция полей и курсор.
 
-        .modal-info-item:last-child {
-            border-bottom: none;
-        }
+    Параметры: category, subcategory, brand, gender, size (через запятую),
+    q, fields (через запятую, id всегда включён), limit, cursor (next
+    предыдущей страницы: "<версия>:<id>"). id товаров — номера строк Excel
+    и после перезагрузки достаются другим товарам, поэтому курсор от любой
+    другой версии каталога → 409, клиент начинает заново.
+    """
+    import bisect
+    import hashlib
 
-        .modal-info-label {
-            font-size: 14px;
-            color: #6c757d;
-        }
+    etag = f'"{catalog.version}.{hashlib.sha1(request.query_string.encode()).hexdigest()[:12]}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag in (tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")):
+        return web.Response(status=304, headers=headers)
 
-        .modal-info-value {
-            font-size: 14px;
-            font-weight: 600;
-            color: #212529;
-        }
+    query = request.query
+    try:
+        limit = int(query.get("limit", PRODUCTS_PAGE_DEFAULT))
+        cursor = None
+        if query.get("cursor"):
+            cursor_version, _, cursor_id = query["cursor"].rpartition(":")
+            cursor = (cursor_version, int(cursor_id))
+    except ValueError:
+        raise web.HTTPBadRequest(text="limit должен быть числом, cursor — вида <версия>:<id>")
+    if not 1 <= limit <= PRODUCTS_PAGE_MAX:
+        raise web.HTTPBadRequest(text=f"limit должен быть от 1 до {PRODUCTS_PAGE_MAX}")
+
+    filters = {field: query[field] for field in CATALOG_FILTER_FIELDS if query.get(field)}
+    sizes = [size.strip() for size in query.get("size", "").split(",") if size.strip()]
+    positions = query_catalog(catalog, filters, sizes, query.get("q", "").strip())
+
+    start = 0
+    if cursor is not None:
+        cursor_version, cursor_id = cursor
+        cursor_pos = catalog.index["positions"].get(cursor_id)
+        if cursor_version != catalog.version or cursor_pos is None:
+            return web.json_response(
+                {"error": "stale_cursor", "version": catalog.version},
+                status=409,
+                headers={"Cache-Control": "no-store"},
+            )
+        start = bisect.bisect_right(positions, cursor_pos)
 
-        .modal-actions {
-            display: flex;
-            gap: 12px;
-        }
+    page = positions[start:start + limit]
+    items = [catalog.products[pos] for pos in page]
+    fields = [field.strip() for field in query.get("fields", "").split(",") if field.strip()]
+    if fields:
+        if "id" not in fields:
+            fields.insert(0, "id")
+        items = [{field: item[field] for field in fields if field in item} for item in items]
 
-        .modal-btn {
-            flex: 1;
-            padding: 16px;
-            border-radius: 14px;
-            border: none;
-            font-size: 16px;
-            font-weight: 700;
-            cursor: pointer;
-            transition: all 0.3s ease;
-        }
+    has_more = start + limit < len(positions)
+    body = json.dumps({
+        "version": catalog.version,
+        "total": len(positions),
+        "items": items,
+        "next": f"{catalog.version}:{catalog.products[page[-1]]['id']}" if has_more and page else None,
+    }, ensure_ascii=False, separators=(',', ':'))
 
-        .modal-btn-primary {
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            color: white;
-            box-shadow: 0 4px 16px rgba(102, 126, 234, 0.4);
-        }
+    response = web.Response(text=body, content_type="application/json", headers=headers)
+    response.enable_compression()
+    return response
 
-        .modal-btn-primary:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 6px 20px rgba(102, 126, 234, 0.5);
-        }
 
-        .modal-btn-secondary {
-            background: rgba(102, 126, 234, 0.1);
-            color: #667eea;
-        }
+# Параметры, с которыми /api/products отдаёт страницу, а не весь каталог
+PRODUCTS_PAGE_PARAMS = CATALOG_FILTER_FIELDS + ("size", "q", "fields", "limit", "cursor")
 
-        .modal-btn-secondary:hover {
-            background: rgba(102, 126, 234, 0.2);
-        }
-        /* Particles на фоне */
-        .particle {
-            position: fixed;
-            width: 4px;
-            height: 4px;
-            background: rgba(255, 255, 255, 0.5);
-            border-radius: 50%;
-            pointer-events: none;
-            animation: float-particle 8s infinite;
-        }
 
-        @keyframes float-particle {
-            0%, 100% {
-                transform: translateY(0) translateX(0);
-                opacity: 0;
-            }
-            10% {
-                opacity: 1;
-            }
-            90% {
-                opacity: 1;
-            }
-            100% {
-                transform: translateY(-100vh) translateX(20px);
-                opacity: 0;
-            }
-        }
+async def handle_products(request: web.Request) -> web.Response:
+    """
+    API: товары в формате JSON.
+
+    Без параметров страницы — весь каталог готовыми байтами (ETag, gzip/br),
+    посторонние параметры (tgWebAppStartParam и т.п.) не мешают; с ними —
+    страница с фильтрами (см. products_page_response).
+    """
+    if not any(param in request.query for param in PRODUCTS_PAGE_PARAMS):
+        # Ревизия тела — от неё клиент потом просит /api/products/changes
+        return json_payload_response(request, CATALOG.payload, {
+            "X-Catalog-Epoch": CATALOG_REVISIONS["epoch"],
+            "X-Catalog-Seq": str(CATALOG_REVISIONS["seq"]),
+        })
+    return products_page_response(request, CATALOG)
+
 
-        .badge {
-            position: absolute;
-            top: 10px;
-            right: 10px;
-            background: linear-gradient(135deg, #6c5ce7, #a855f7);
-            color: white;
-            padding: 5px 12px;
-            border-radius: 10px;
-            font-size: 11px;
-            font-weight: 700;
-            z-index: 2;
-            letter-spacing: 0.3px;
-            box-shadow: 0 2px 8px rgba(108, 92, 231, 0.4);
-            text-shadow: 0 1px 2px rgba(0,0,0,0.2);
-        }
+async def handle_products_changes(request: web.Request) -> web.Response:
+    """
+    API: изменения каталога после ревизии since.
 
-        .badge.new {
-            background: linear-gradient(135deg, #4facfe, #00f2fe);
-            box-shadow: 0 4px 15px rgba(79, 172, 254, 0.4);
-        }
+    Ответ: {epoch, seq, changed: [товары как в полном каталоге], removed: [id]}. Если epoch
+    клиента не совпадает или since из будущего — {reset: true}, клиент
+    скачивает /api/products целиком.
+    """
+    try:
+        since = int(request.query["since"])
+    except (KeyError, ValueError):
+        raise web.HTTPBadRequest(text="since должен быть числом")
+
+    catalog, revisions = CATALOG, CATALOG_REVISIONS
+    headers = {"Cache-Control": "no-store"}
+    epoch = request.query.get("epoch")
+    if (epoch and epoch != revisions["epoch"]) or not 0 <= since <= revisions["seq"]:
+        return web.json_response(
+            {"reset": True, "epoch": revisions["epoch"], "seq": revisions["seq"]},
+            headers=headers,
+        )
 
-        .gender-badge {
-            display: inline-block;
-            padding: 2px 8px;
-            border-radius: 8px;
-            font-size: 10px;
-            font-weight: 600;
-            margin-top: 4px;
-        }
-        .gender-badge.male {
-            background: rgba(66, 133, 244, 0.15);
-            color: #4285f4;
-        }
-        .gender-badge.female {
-            background: rgba(234, 67, 149, 0.15);
-            color: #ea4395;
-        }
-        .gender-badge.unisex {
-            background: rgba(102, 126, 234, 0.15);
-            color: #667eea;
-        }
+    changed = []
+    if since < revisions["seq"]:
+        product_revisions = revisions["products"]
+        # Те же поля, что в полном каталоге, — клиент хранит записи одного вида
+        changed = [
+            full_catalog_item(p) for p in catalog.products
+            if product_revisions[str(p['id'])][0] > since
+        ]
+    removed = [int(key) for key, rev in revisions["removed"].items() if rev > since]
 
-    </style>
-</head>
-<body>
-    <!-- Animated particles -->
-    <div class="particles-container"></div>
+    body = json.dumps({
+        "epoch": revisions["epoch"],
+        "seq": revisions["seq"],
+        "changed": changed,
+        "removed": removed,
+    }, ensure_ascii=False, separators=(',', ':'))
+    response = web.Response(text=body, content_type="application/json", headers=headers)
+    response.enable_compression()
+    return response
 
-    <div class="header">
-        <h1>🏐 NIMBLI</h1>
-        <p class="subtitle">Твой спорт • Твоя победа • Твой успех</p>
-    </div>
 
-    <div class="categories-container">
-        <div class="categories-tabs" id="categoriesTabs"></div>
-        <div class="subcategories-container" id="subcategoriesContainer">
-            <div class="subcategories-tabs" id="subcategoriesTabs"></div>
-        </div>
-        <div class="brands-container" id="brandsContainer">
-            <div class="brands-tabs" id="brandsTabs"></div>
-        </div>
-        <div class="size-filter-container" id="sizeFilterContainer">
-            <div class="size-filter-header">
-                <span class="size-filter-title">Размер (EU)</span>
-                <button class="size-filter-reset" id="sizeFilterReset" style="display:none;">Сбросить</button>
-            </div>
-            <div class="size-filter-grid" id="sizeFilterGrid"></div>
-        </div>
-        <div class="gender-filter-container" id="genderFilterContainer"></div>
-    </div>
+async def handle_facets(request: web.Request) -> web.Response:
+    """API: дерево фасетов (группы, подгруппы, бренды, размеры, пол) текущего каталога."""
+    return json_payload_response(request, CATALOG.facets)
 
-    <div class="search-container">
-        <div class="search-wrapper">
-            <span class="search-icon">🔍</span>
-            <input
-                type="text"
-                id="searchInput"
-                class="search-input"
-                placeholder="Поиск товаров..."
-                autocomplete="off"
-            />
-            <span class="clear-search" id="clearSearch" style="display: none;">✕</span>
-        </div>
-    </div>
 
-    <div class="products-grid" id="productsGrid"></div>
+# Готовое тело /api/catalog/manifest (future — одновременные запросы ждут
+# один обход папки); сбрасывается в clear_image_cache при замене каталога
+CATALOG_MANIFEST = None
 
-    <div class="cart-footer" id="cartFooter">
-        <div class="cart-summary">
-            <span>⭐ Интересных: <span id="cartCount">0</span></span>
-            <span class="cart-total"><span id="cartTotal">0</span> ₽</span>
-        </div>
-        <button class="order-btn" id="orderBtn">💬 Консультация</button>
-    </div>
 
-    <!-- Модальное окно детального просмотра -->
-    <div class="modal-overlay" id="productModal">
-        <div class="modal-content">
-            <button class="modal-close" onclick="closeProductModal()">×</button>
-            <div class="modal-image-container">
-                <img class="modal-image" id="modalImage" src="" alt="">
-            </div>
-            <div class="modal-body">
-                <h2 class="modal-title" id="modalTitle"></h2>
+def encode_live_manifest(images_dir):
+    return json.dumps(build_live_manifest(images_dir)).encode('utf-8')
 
-                <div class="modal-price-section">
-                    <span class="modal-price-label">Цена</span>
-                    <span class="modal-price" id="modalPrice"></span>
-                </div>
 
-                <div id="modalGenderSection" style="display: none; margin-bottom: 12px;">
-                    <span id="modalGenderBadge"></span>
-                </div>
+async def handle_catalog_manifest(request: web.Request) -> web.Response:
+    """
+    API: хэши фото, которые сейчас на сервере.
 
-                <div class="sizes-section" id="sizesSection" style="display: none;">
-                    <h3 class="sizes-title">👟 Размеры (EU)</h3>
-                    <div class="sizes-grid" id="sizesGrid"></div>
-                </div>
+    parser_gui.py считает от него архив изменений — вместо манифеста
+    последнего собранного (а возможно, так и не отправленного) архива.
+    Папка обходится один раз на версию каталога, дальше — из памяти.
+    """
+    global CATALOG_MANIFEST
+    if CATALOG_MANIFEST is None:
+        CATALOG_MANIFEST = asyncio.ensure_future(loop_run_io(encode_live_manifest, request.app["images_dir"]))
+    future = CATALOG_MANIFEST
+    try:
+        body = await asyncio.shield(future)
+    except Exception:
+        if CATALOG_MANIFEST is future:
+            CATALOG_MANIFEST = None  # Ошибку не кэшируем
+        raise
+    return web.Response(body=body, content_type="application/json", headers={"Cache-Control": "no-store"})
 
-                <div class="modal-actions">
-                    <button class="modal-btn modal-btn-secondary" onclick="closeProductModal()">Закрыть</button>
-                    <button class="modal-btn modal-btn-primary" id="modalAddBtn" onclick="">В корзину</button>
-                </div>
-            </div>
-        </div>
-    </div>
 
-    <script>
-        // Создаём floating particles
-        function createParticles() {
-            const particleCount = 25;
-            for (let i = 0; i < particleCount; i++) {
-                const particle = document.createElement('div');
-                particle.className = 'particle';
-                particle.style.left = Math.random() * 100 + '%';
-                particle.style.animationDelay = Math.random() * 8 + 's';
-                particle.style.animationDuration = (8 + Math.random() * 4) + 's';
-                document.body.appendChild(particle);
-            }
-        }
+def resolve_image_path(images_dir, rel_path):
+    """Путь к файлу внутри images_dir или None (нет файла / выход за папку)."""
+    try:
+        root = images_dir.resolve()
+        file_path = (root / rel_path).resolve()
+        file_path.relative_to(root)
+    except (OSError, ValueError):
+        return None
+    return file_path if file_path.is_file() else None
 
-        const tg = window.Telegram.WebApp;
-        tg.expand();
-        tg.MainButton.hide();
 
-        let cart = {};  // Теперь это список интересных товаров
-        let products = [];
-        let currentCategory = null;  // Текущая выбранная группа
-        let currentSubcategory = null;  // Текущая выбранная подгруппа
-        let currentBrand = null;  // Текущий выбранный бренд
-        let selectedSizes = new Set();  // Выбранные размеры для фильтра
-        let currentGender = null;  // Текущий выбранный пол
+# Форматы, которые можно отдать вместо исходника, если браузер их принимает
+NEGOTIATED_IMAGE_TYPES = (("image/avif", ".avif"), ("image/webp", ".webp"))
 
-        // Форматирование цены с пробелами (22000 → 22 000)
-        function formatPrice(price) {
-            return (Math.ceil(price / 100) * 100).toString().replace(/\B(?=(\d{3})+(?!\d))/g, ' ');
-        }
 
-        // Инициализация particles при загрузке
-        createParticles();
-        let currentProduct = null;  // Текущий товар в модальном окне
+def negotiate_image(request: web.Request, file_path):
+    """
+    Выбирает лучший формат фото по заголовку Accept.
 
-        // Загружаем товары с сервера
-        fetch('/api/products')
-            .then(res => res.json())
-            .then(data => {
-                products = data;
-                renderCategories();
-                renderProducts();
-            });
+    parser_gui.py кладёт рядом с фото копии <имя>.avif и <имя>.webp
+    (только если они меньше исходника). Возвращает путь к файлу для отдачи.
+    """
+    accept = request.headers.get("Accept", "")
+    for mime, ext in NEGOTIATED_IMAGE_TYPES:
+        if file_path.suffix.lower() == ext:
+            return file_path
+        if mime in accept:
+            candidate = file_path.with_suffix(ext)
+            if candidate.is_file():
+                return candidate
+    return file_path
 
-        // Поиск товаров
-        const searchInput = document.getElementById('searchInput');
-        const clearSearch = document.getElementById('clearSearch');
 
-        searchInput.addEventListener('input', (e) => {
-            const query = e.target.value;
-            renderProducts(query);
-            clearSearch.style.display = query ? 'block' : 'none';
-        });
+IMAGE_DIGESTS = {}  # Путь фото → (размер, mtime_ns, sha256) для проверки ?v=
 
-        clearSearch.addEventListener('click', () => {
-            searchInput.value = '';
-            clearSearch.style.display = 'none';
-            renderProducts('');
-            searchInput.focus();
-        });
 
-        // Открытие модального окна
-        function openProductModal(productId) {
-            currentProduct = products.find(p => p.id === productId);
-            if (!currentProduct) return;
+async def is_immutable_image_url(request: web.Request, rel_path, file_path):
+    """
+    Можно ли кэшировать ответ навсегда: имя файла — хэш, или ?v= совпадает
+    с началом sha256 файла. Чужой или устаревший ?v= — обычная перепроверка,
+    иначе такой URL навсегда застрял бы в кэше браузера и CDN.
+    """
+    if is_content_addressed(rel_path):
+        return True
+    version = request.query.get("v")
+    if not version or len(version) != IMAGE_VERSION_LENGTH:
+        return False
+    stat = file_path.stat()
+    cached = IMAGE_DIGESTS.get(file_path)
+    if cached is None or cached[:2] != (stat.st_size, stat.st_mtime_ns):
+        cached = (stat.st_size, stat.st_mtime_ns, await loop_run_io(file_sha256, file_path))
+        IMAGE_DIGESTS[file_path] = cached
+    return cached[2][:IMAGE_VERSION_LENGTH] == version
 
-            const modal = document.getElementById('productModal');
-            const modalImage = document.getElementById('modalImage');
-            const modalTitle = document.getElementById('modalTitle');
-            const modalPrice = document.getElementById('modalPrice');
-            const modalAddBtn = document.getElementById('modalAddBtn');
-            const sizesSection = document.getElementById('sizesSection');
-            const sizesGrid = document.getElementById('sizesGrid');
 
-            // Устанавливаем изображение (только первое)
-            if (currentProduct.image && currentProduct.image.startsWith('/images/')) {
-                modalImage.src = currentProduct.image;
-                modalImage.style.display = 'block';
-            } else {
-                modalImage.style.display = 'none';
-            }
+# ═══════════════════════════════════════════════════════════
+# 🔥 КЭШ ГОРЯЧИХ ФОТО В ПАМЯТИ
+# ═══════════════════════════════════════════════════════════
+#
+# При всплесках (пост в канале) тысячи запросов идут к нескольким
+# десяткам фото. Горячие — со второго запроса — лежат в памяти вместе
+# с готовыми заголовками: попадание не делает ни resolve, ни stat, ни
+# open. Остальное уходит через FileResponse (sendfile без копирования).
+
+IMAGE_MEMORY_CACHE_MAX_BYTES = 64 * 1024 * 1024   # Лимит кэша; 0 — выключить
+IMAGE_MEMORY_CACHE_MAX_ITEM = 512 * 1024          # Крупнее — всегда sendfile
+IMAGE_MEMORY_CACHE_ADMIT_AFTER = 2                # В память — с N-го запроса
+IMAGE_CACHE_SEEN_MAX = 10000                      # Сколько «кандидатов» помнить
+
+IMAGE_MEMORY_CACHE = OrderedDict()   # Ключ запроса → CachedImage (LRU)
+IMAGE_MEMORY_CACHE_BYTES = 0
+IMAGE_CACHE_SEEN = OrderedDict()     # Ключ запроса → число промахов
+IMAGE_CACHE_METRICS = {
+    "hits": 0,            # Отдано из памяти
+    "not_modified": 0,    # 304 по ETag из памяти
+    "misses": 0,          # Промахи (с диска или чтение в память)
+    "admitted": 0,        # Попало в память
+    "evicted": 0,         # Вытеснено по лимиту
+}
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    """Фото в памяти: байты и готовые заголовки ответа."""
+    file_path: Path
+    body: bytes
+    headers: dict
+    etag: str
+    mtime_ns: int
+    immutable: bool      # URL с отпечатком — файл не перепроверяем
+
+
+def image_cache_key(request: web.Request, kind, width=None):
+    """Ключ кэша до разбора пути: сам запрос и форматы, которые принимает браузер."""
+    accept = request.headers.get("Accept", "")
+    return (
+        kind,
+        width,
+        request.match_info["path"],
+        request.query.get("v"),
+        tuple(mime in accept for mime, _ in NEGOTIATED_IMAGE_TYPES),
+    )
 
-            modalTitle.textContent = currentProduct.name;
-            modalPrice.textContent = formatPrice(currentProduct.price) + ' ₽';
 
-            // Показываем пол, если указан
-            const genderSection = document.getElementById('modalGenderSection');
-            const genderBadge = document.getElementById('modalGenderBadge');
-            if (currentProduct.gender) {
-                const gl = currentProduct.gender.toLowerCase();
-                let genderClass = 'unisex';
-                if (gl.includes('мужск') || gl.includes('male') || gl.includes('man') || gl.includes('men')) genderClass = 'male';
-                else if (gl.includes('женск') || gl.includes('female') || gl.includes('woman') || gl.includes('women')) genderClass = 'female';
-                genderBadge.className = 'gender-badge ' + genderClass;
-                genderBadge.textContent = currentProduct.gender;
-                genderSection.style.display = 'block';
-            } else {
-                genderSection.style.display = 'none';
-            }
+def lookup_cached_image(key):
+    """Фото из памяти или None. Файлы без отпечатка сверяются по mtime."""
+    if not IMAGE_MEMORY_CACHE_MAX_BYTES:
+        return None
+    entry = IMAGE_MEMORY_CACHE.get(key)
+    if entry is None:
+        return None
+    if not entry.immutable:
+        try:
+            if entry.file_path.stat().st_mtime_ns != entry.mtime_ns:
+                raise FileNotFoundError
+        except OSError:
+            forget_cached_image(key)
+            return None
+    IMAGE_MEMORY_CACHE.move_to_end(key)
+    return entry
+
+
+def forget_cached_image(key):
+    global IMAGE_MEMORY_CACHE_BYTES
+    entry = IMAGE_MEMORY_CACHE.pop(key, None)
+    if entry is not None:
+        IMAGE_MEMORY_CACHE_BYTES -= len(entry.body)
+
+
+def clear_image_cache():
+    """Сбрасывает кэш фото и манифест папки (после замены папки images)."""
+    global IMAGE_MEMORY_CACHE_BYTES, CATALOG_MANIFEST
+    CATALOG_MANIFEST = None
+    IMAGE_MEMORY_CACHE.clear()
+    IMAGE_CACHE_SEEN.clear()
+    IMAGE_DIGESTS.clear()
+    IMAGE_MEMORY_CACHE_BYTES = 0
+
+
+def read_cached_image(file_path, headers, immutable):
+    """Читает фото целиком и готовит заголовки (в пуле ввода-вывода)."""
+    from email.utils import formatdate
+
+    stat = file_path.stat()
+    if stat.st_size > IMAGE_MEMORY_CACHE_MAX_ITEM:
+        return None
+    body = file_path.read_bytes()
+    # Тот же формат ETag, что у FileResponse, — кэш браузера не сбрасывается
+    etag = f'"{stat.st_mtime_ns:x}-{len(body):x}"'
+    headers = {
+        **headers,
+        "ETag": etag,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+        "Accept-Ranges": "bytes",
+    }
+    return CachedImage(file_path, body, headers, etag, stat.st_mtime_ns, immutable)
 
-            // Показываем размеры, если они есть
-            if (currentProduct.sizes && currentProduct.sizes.length > 0) {
-                sizesSection.style.display = 'block';
-                sizesGrid.innerHTML = '';
-                currentProduct.sizes.forEach(size => {
-                    const sizeBadge = document.createElement('div');
-                    sizeBadge.className = 'size-badge';
-                    sizeBadge.textContent = size;
-                    sizesGrid.appendChild(sizeBadge);
-                });
-            } else {
-                sizesSection.style.display = 'none';
-            }
 
-            // Обновляем кнопку
-            const isInteresting = cart[productId] && cart[productId] > 0;
-            modalAddBtn.textContent = isInteresting ? '✓ Убрать из интересного' : '⭐ Интересно';
-            modalAddBtn.onclick = () => toggleInteresting(productId);
+def remember_cached_image(key, entry):
+    """Кладёт фото в LRU и вытесняет старые, пока кэш не влезет в лимит."""
+    global IMAGE_MEMORY_CACHE_BYTES
+    forget_cached_image(key)
+    IMAGE_MEMORY_CACHE[key] = entry
+    IMAGE_MEMORY_CACHE_BYTES += len(entry.body)
+    IMAGE_CACHE_METRICS["admitted"] += 1
+    while IMAGE_MEMORY_CACHE_BYTES > IMAGE_MEMORY_CACHE_MAX_BYTES and IMAGE_MEMORY_CACHE:
+        _, old = IMAGE_MEMORY_CACHE.popitem(last=False)
+        IMAGE_MEMORY_CACHE_BYTES -= len(old.body)
+        IMAGE_CACHE_METRICS["evicted"] += 1
 
-            modal.classList.add('active');
-            tg.HapticFeedback.impactOccurred('medium');
-        }
 
-        // Закрытие модального окна
-        function closeProductModal() {
-            const modal = document.getElementById('productModal');
-            modal.classList.remove('active');
-            currentProduct = null;
-        }
+def cached_image_response(request: web.Request, entry) -> web.Response:
+    """Ответ из памяти: 304 по If-None-Match или готовые байты."""
+    if entry.etag in (tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")):
+        IMAGE_CACHE_METRICS["not_modified"] += 1
+        return web.Response(status=304, headers=entry.headers)
+    return web.Response(body=entry.body, headers=entry.headers)
+
+
+def cached_image_hit(request: web.Request, key, touch=False):
+    """
+    Ответ из памяти по ключу или None (промах или Range-запрос).
+
+    touch — отметить файл использованным для LRU дискового кэша превью:
+    иначе горячие превью, живущие в памяти, вытеснялись бы с диска первыми.
+    """
+    if "Range" in request.headers:
+        return None
+    entry = lookup_cached_image(key)
+    if entry is None:
+        return None
+    IMAGE_CACHE_METRICS["hits"] += 1
+    if touch:
+        touch_thumbnail(entry.file_path)
+    return cached_image_response(request, entry)
+
+
+async def serve_image_file(request: web.Request, key, file_path, headers, immutable):
+    """
+    Промах кэша: с N-го запроса фото читается в память и отдаётся оттуда,
+    до этого (и для крупных файлов) — FileResponse через sendfile.
+    """
+    IMAGE_CACHE_METRICS["misses"] += 1
+    if IMAGE_MEMORY_CACHE_MAX_BYTES and "Range" not in request.headers:
+        seen = IMAGE_CACHE_SEEN.pop(key, 0) + 1
+        if seen >= IMAGE_MEMORY_CACHE_ADMIT_AFTER:
+            try:
+                entry = await loop_run_io(read_cached_image, file_path, headers, immutable)
+            except OSError:
+                entry = None
+            if entry is not None:
+                remember_cached_image(key, entry)
+                return cached_image_response(request, entry)
+        else:
+            IMAGE_CACHE_SEEN[key] = seen
+            if len(IMAGE_CACHE_SEEN) > IMAGE_CACHE_SEEN_MAX:
+                IMAGE_CACHE_SEEN.popitem(last=False)
+    return web.FileResponse(file_path, headers=headers)
+
+
+def get_image_cache_metrics():
+    """Счётчики кэша фото и доля попаданий."""
+    metrics = dict(IMAGE_CACHE_METRICS)
+    total = metrics["hits"] + metrics["misses"]
+    metrics["hit_rate"] = round(metrics["hits"] / total, 4) if total else 0.0
+    metrics["entries"] = len(IMAGE_MEMORY_CACHE)
+    metrics["bytes"] = IMAGE_MEMORY_CACHE_BYTES
+    metrics["max_bytes"] = IMAGE_MEMORY_CACHE_MAX_BYTES
+    return metrics
+
+
+async def handle_image(request: web.Request) -> web.StreamResponse:
+    """
+    Отдаёт фото товара.
+
+    URL с отпечатком (?v=<хэш файла> или имя-хэш) не меняются — Cache-Control
+    immutable на год. Остальные — с ETag и обязательной перепроверкой.
+    Формат (AVIF/WebP/исходный) выбирается по Accept, поэтому Vary: Accept.
+    Горячие фото отдаются из памяти (см. КЭШ ГОРЯЧИХ ФОТО).
+    """
+    key = image_cache_key(request, "image")
+    response = cached_image_hit(request, key)
+    if response is not None:
+        return response
 
-        // Переключение "Интересно"
-        function toggleInteresting(productId) {
-            if (cart[productId] && cart[productId] > 0) {
-                delete cart[productId];
-            } else {
-                cart[productId] = 1;
-            }
-            renderProducts();
-            updateCartFooter();
-            closeProductModal();
-            tg.HapticFeedback.impactOccurred('light');
-        }
+    rel_path = request.match_info["path"]
+    file_path = resolve_image_path(request.app["images_dir"], rel_path)
+    if file_path is None:
+        raise web.HTTPNotFound()
 
-        // Закрытие модального окна при клике на overlay
-        document.getElementById('productModal').addEventListener('click', function(e) {
-            if (e.target === this) {
-                closeProductModal();
-            }
-        });
+    if await is_immutable_image_url(request, rel_path, file_path):
+        cache_control = IMAGE_CACHE_CONTROL
+    else:
+        cache_control = "no-cache"
 
-        function renderProducts(searchQuery = '') {
-            const grid = document.getElementById('productsGrid');
-            grid.innerHTML = '';
+    file_path = negotiate_image(request, file_path)
+    headers = image_headers(file_path, cache_control)
+    headers["Vary"] = "Accept"
+    return await serve_image_file(request, key, file_path, headers, cache_control == IMAGE_CACHE_CONTROL)
 
-            // Фильтруем товары по группе, подгруппе и поисковому запросу
-            const filteredProducts = products.filter(product => {
-                // Фильтр по группе
-                if (currentCategory && product.category !== currentCategory) {
-                    return false;
-                }
-                // Фильтр по подгруппе
-                if (currentSubcategory && product.subcategory !== currentSubcategory) {
-                    return false;
-                }
-                // Фильтр по бренду
-                if (currentBrand && product.brand !== currentBrand) {
-                    return false;
-                }
-                // Фильтр по размерам
-                if (selectedSizes.size > 0 && product.sizes && product.sizes.length > 0) {
-                    const hasSize = product.sizes.some(s => selectedSizes.has(s));
-                    if (!hasSize) return false;
-                }
-                if (selectedSizes.size > 0 && (!product.sizes || product.sizes.length === 0)) {
-                    return false;
-                }
-                // Фильтр по полу
-                if (currentGender && product.gender !== currentGender) {
-                    return false;
-                }
 
-                // Фильтр по поисковому запросу
-                if (!searchQuery) return true;
-                const query = searchQuery.toLowerCase();
-                return product.name.toLowerCase().includes(query);
-            });
+# ═══════════════════════════════════════════════════════════
+# 🖼 ПРЕВЬЮ ФОТО ДЛЯ СЕТКИ ТОВАРОВ
+# ═══════════════════════════════════════════════════════════
 
-            // Если ничего не найдено
-            if (filteredProducts.length === 0) {
-                grid.innerHTML = `
-                    <div style="grid-column: 1/-1; text-align: center; padding: 60px 20px; color: rgba(0,0,0,0.5);">
-                        <div style="font-size: 48px; margin-bottom: 16px;">🔍</div>
-                        <div style="font-size: 18px; font-weight: 600;">Ничего не найдено</div>
-                        <div style="font-size: 14px; margin-top: 8px;">Попробуйте изменить запрос</div>
-                    </div>
-                `;
-                return;
-            }
+# Разрешённые ширины превью (карточка в сетке ~150px, x2 для retina)
+THUMB_WIDTHS = (160, 320, 640)
+THUMB_QUALITY = 80
 
-            filteredProducts.forEach(product => {
-                const card = document.createElement('div');
-                card.className = 'product-card';
-                card.dataset.id = product.id;
-                if (cart[product.id]) {
-                    card.classList.add('in-cart');
-                }
+# Лимит дискового кэша превью; при превышении удаляются давно не читанные
+THUMB_CACHE_MAX_BYTES = 300 * 1024 * 1024
+# mtime превью (метка LRU) обновляется не чаще раза в столько секунд
+THUMB_TOUCH_INTERVAL = 60.0
 
-                const quantity = cart[product.id] || 0;
+THUMB_EXECUTOR = None
+THUMB_INFLIGHT = {}       # Путь превью → future генерации (без дублей)
+THUMB_CACHE_BYTES = None  # Текущий объём кэша (считается при первом обращении)
+THUMB_TOUCHED = {}        # Путь превью → monotonic последнего touch (по порядку touch)
 
-                // Определяем как показывать изображение
-                let imageHtml;
-                if (product.image.startsWith('/images/')) {
-                    // Реальная фотография
-                    imageHtml = `<img src="${product.image}" alt="${product.name}" onerror="this.outerHTML='<div>📦</div>'">`;
-                } else {
-                    // Placeholder эмодзи
-                    imageHtml = `<div>${product.image}</div>`;
-                }
 
-                // Определяем класс пола
-                let genderBadgeHtml = '';
-                if (product.gender) {
-                    const gl = product.gender.toLowerCase();
-                    let genderClass = 'unisex';
-                    if (gl.includes('мужск') || gl.includes('male') || gl.includes('man') || gl.includes('men')) genderClass = 'male';
-                    else if (gl.includes('женск') || gl.includes('female') || gl.includes('woman') || gl.includes('women')) genderClass = 'female';
-                    genderBadgeHtml = `<div class="gender-badge ${genderClass}">${product.gender}</div>`;
-                }
+def get_thumb_executor():
+    """Пул процессов для генерации превью (Pillow грузит CPU)."""
+    global THUMB_EXECUTOR
+    if THUMB_EXECUTOR is None:
+        THUMB_EXECUTOR = ProcessPoolExecutor(
+            max_workers=2,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return THUMB_EXECUTOR
 
-                card.innerHTML = `
-                    ${quantity > 0 ? '<div class="product-badge">⭐ Интересно</div>' : ''}
-                    ${product.priority === 1 ? '<div class="priority-badge hot">Hot</div>' : product.priority === 2 ? '<div class="priority-badge new">New</div>' : ''}
-                    <div class="product-image">${imageHtml}</div>
-                    <div class="product-name">${product.name}</div>
-                    <div class="product-price">${formatPrice(product.price)} ₽ <span class="price-delivery-hint">с доставкой</span></div>
-                    ${genderBadgeHtml}
-                `;
 
-                // При клике открываем модальное окно
-                card.onclick = () => openProductModal(product.id);
+def make_thumbnail(source_path, dest_path, width):
+    """Уменьшает фото до ширины width и сохраняет в WebP. Возвращает размер файла."""
+    import os
+    from PIL import Image, ImageOps
 
-                grid.appendChild(card);
-            });
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        if image.width > width:
+            image.thumbnail((width, width * 4), Image.LANCZOS)
 
-            // Добавляем badges на товары
-            setTimeout(() => {
-                // Бейджи баланса (Мощность и т.д.) — справа сверху
-                const productCards = document.querySelectorAll('.product-card');
-                productCards.forEach((card) => {
-                    const productId = parseInt(card.dataset.id);
-                    const product = products.find(p => p.id === productId);
-                    if (product && product.balance && !card.querySelector('.badge')) {
-                        const badge = document.createElement('div');
-                        badge.className = 'badge';
-                        badge.textContent = product.balance;
-                        card.appendChild(badge);
-                    }
-                });
-            }, 50);
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = dest_path.with_name(f"{dest_path.name}.{os.getpid()}.tmp")
+        image.save(tmp_path, "WEBP", quality=THUMB_QUALITY, method=4)
+    os.replace(tmp_path, dest_path)
+    return dest_path.stat().st_size
 
-            updateCartFooter();
-        }
 
-        // Рендеринг вкладок категорий (группы)
-        function renderCategories() {
-            const categoriesContainer = document.getElementById('categoriesTabs');
-            categoriesContainer.innerHTML = '';
+def get_thumb_path(width, rel_path, stat):
+    """
+    Путь превью в кэше: ключ — путь внутри images, размер и mtime фото.
 
-            const categories = [...new Set(products.map(p => p.category).filter(c => c && c.trim()))];
+    Путь относительный: после загрузки архива images указывает на новую
+    версию папки, а превью неизменённых (жёстко связанных) фото остаются.
+    """
+    import hashlib
 
-            if (products.length === 0) return;
+    key = hashlib.sha256(f"{rel_path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    return get_cache_dir() / 'thumbs' / str(width) / key[:2] / f"{key}.webp"
 
-            if (categories.length === 0) {
-                const allTab = document.createElement('button');
-                allTab.className = 'category-tab active';
-                allTab.textContent = 'Все';
-                categoriesContainer.appendChild(allTab);
-                renderSubcategories();
-                renderBrands();
-                return;
-            }
 
-            // Вкладка "Все"
-            const allTab = document.createElement('button');
-            allTab.className = 'category-tab' + (!currentCategory ? ' active' : '');
-            allTab.textContent = 'Все';
-            allTab.onclick = () => {
-                if (!currentCategory) return;
-                currentCategory = null;
-                currentSubcategory = null;
-                currentBrand = null;
-                selectedSizes.clear();
-                currentGender = null;
-                renderCategories();
-                renderSubcategories();
-                renderBrands();
-                renderProducts(searchInput.value);
-            };
-            categoriesContainer.appendChild(allTab);
+def evict_thumbnails(max_bytes):
+    """
+    Удаляет самые давно использованные превью, пока кэш не станет ≤ 90% лимита.
 
-            // Вкладки групп
-            categories.sort().forEach(category => {
-                const tab = document.createElement('button');
-                tab.className = 'category-tab' + (currentCategory === category ? ' active' : '');
-                tab.textContent = category;
-                tab.onclick = () => {
-                    if (currentCategory === category) {
-                        currentCategory = null;
-                        currentSubcategory = null;
-                    } else {
-                        currentCategory = category;
-                        currentSubcategory = null;
-                    }
-                    currentBrand = null;
-                    selectedSizes.clear();
-                currentGender = null;
-                    renderCategories();
-                    renderSubcategories();
-                    renderBrands();
-                    renderProducts(searchInput.value);
-                };
-                categoriesContainer.appendChild(tab);
-            });
+    «Использованность» — mtime файла: при каждом попадании в кэш он обновляется.
+    Возвращает итоговый объём кэша.
+    """
+    import os
 
-            renderSubcategories();
-            renderBrands();
-        }
+    files = []
+    total = 0
+    for path in (get_cache_dir() / 'thumbs').rglob('*.webp'):
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+        total += stat.st_size
+
+    if total > max_bytes:
+        target = max_bytes * 0.9
+        for _, size, path in sorted(files):
+            if total <= target:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+    return total
 
-        // Рендеринг подвкладок (подгруппы)
-        function renderSubcategories() {
-            const container = document.getElementById('subcategoriesContainer');
-            const tabsContainer = document.getElementById('subcategoriesTabs');
-            tabsContainer.innerHTML = '';
 
-            // Если группа не выбрана — скрываем подвкладки
-            if (!currentCategory) {
-                container.classList.remove('visible');
-                return;
-            }
+def touch_thumbnail(thumb_path):
+    """
+    Отмечает использование превью для LRU evict_thumbnails (mtime файла).
 
-            // Получаем подгруппы для выбранной группы
-            const subcategories = [...new Set(
-                products
-                    .filter(p => p.category === currentCategory)
-                    .map(p => p.subcategory)
-                    .filter(s => s && s.trim())
-            )];
+    Не чаще раза в THUMB_TOUCH_INTERVAL на файл; os.utime — в пуле
+    ввода-вывода, ответ его не ждёт.
+    """
+    import os
 
-            // Если подгрупп нет или только одна — не показываем
-            if (subcategories.length <= 1) {
-                container.classList.remove('visible');
-                return;
-            }
+    now = time.monotonic()
+    last = THUMB_TOUCHED.pop(thumb_path, None)
+    if last is not None and now - last < THUMB_TOUCH_INTERVAL:
+        THUMB_TOUCHED[thumb_path] = last
+        return
+    THUMB_TOUCHED[thumb_path] = now
+    # Словарь упорядочен по времени touch — устаревшие записи в начале
+    while THUMB_TOUCHED:
+        oldest = next(iter(THUMB_TOUCHED))
+        if now - THUMB_TOUCHED[oldest] < THUMB_TOUCH_INTERVAL:
+            break
+        del THUMB_TOUCHED[oldest]
+
+    def utime():
+        try:
+            os.utime(thumb_path)
+        except OSError:
+            pass
 
-            // Показываем контейнер
-            container.classList.add('visible');
+    get_io_executor().submit(utime)
 
-            // Вкладка "Все" для подгрупп
-            const allTab = document.createElement('button');
-            allTab.className = 'subcategory-tab' + (!currentSubcategory ? ' active' : '');
-            allTab.textContent = 'Все';
-            allTab.onclick = () => {
-                if (!currentSubcategory) return;
-                currentSubcategory = null;
-                currentBrand = null;
-                selectedSizes.clear();
-                currentGender = null;
-                renderSubcategories();
-                renderBrands();
-                renderProducts(searchInput.value);
-            };
-            tabsContainer.appendChild(allTab);
 
-            // Вкладки подгрупп
-            subcategories.sort().forEach(sub => {
-                const tab = document.createElement('button');
-                tab.className = 'subcategory-tab' + (currentSubcategory === sub ? ' active' : '');
-                tab.textContent = sub;
-                tab.onclick = () => {
-                    if (currentSubcategory === sub) {
-                        currentSubcategory = null;
-                    } else {
-                        currentSubcategory = sub;
-                    }
-                    currentBrand = null;
-                    selectedSizes.clear();
-                currentGender = null;
-                    renderSubcategories();
-                    renderBrands();
-                    renderProducts(searchInput.value);
-                };
-                tabsContainer.appendChild(tab);
-            });
-        }
+async def loop_run_io(func, *args):
+    """Выполняет func(*args) в пуле потоков ввода-вывода."""
+    return await asyncio.get_running_loop().run_in_executor(get_io_executor(), func, *args)
 
-        // Рендеринг фильтра по брендам
-        function renderBrands() {
-            const container = document.getElementById('brandsContainer');
-            const tabsContainer = document.getElementById('brandsTabs');
-            tabsContainer.innerHTML = '';
 
-            // Получаем бренды для текущей выборки (с учётом группы и подгруппы)
-            const filteredForBrands = products.filter(p => {
-                if (currentCategory && p.category !== currentCategory) return false;
-                if (currentSubcategory && p.subcategory !== currentSubcategory) return false;
-                return true;
-            });
+async def ensure_thumbnail(source_path, thumb_path, width):
+    """Создаёт превью в пуле процессов; одновременные запросы ждут одну генерацию."""
+    global THUMB_CACHE_BYTES
 
-            const brands = [...new Set(filteredForBrands.map(p => p.brand).filter(b => b && b.trim()))];
+    future = THUMB_INFLIGHT.get(thumb_path)
+    if future is None:
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(get_thumb_executor(), make_thumbnail, source_path, thumb_path, width)
+        THUMB_INFLIGHT[thumb_path] = future
+        future.add_done_callback(lambda _: THUMB_INFLIGHT.pop(thumb_path, None))
+    size = await asyncio.shield(future)
 
-            // Если брендов нет или только один — не показываем
-            if (brands.length <= 1) {
-                container.classList.remove('visible');
-                currentBrand = null;
-                renderSizeFilter();
-                return;
-            }
+    # Следим за объёмом кэша; чистим в потоке, когда вышли за лимит
+    if THUMB_CACHE_BYTES is None:
+        THUMB_CACHE_BYTES = await loop_run_io(evict_thumbnails, THUMB_CACHE_MAX_BYTES)
+    else:
+        THUMB_CACHE_BYTES += size
+        if THUMB_CACHE_BYTES > THUMB_CACHE_MAX_BYTES:
+            THUMB_CACHE_BYTES = await loop_run_io(evict_thumbnails, THUMB_CACHE_MAX_BYTES)
 
-            container.classList.add('visible');
 
-            // Вкладка "Все бренды"
-            const allTab = document.createElement('button');
-            allTab.className = 'brand-tab' + (!currentBrand ? ' active' : '');
-            allTab.textContent = 'Все';
-            allTab.onclick = () => {
-                if (!currentBrand) return;
-                currentBrand = null;
-                selectedSizes.clear();
-                currentGender = null;
-                renderBrands();
-                renderSizeFilter();
-                renderProducts(searchInput.value);
-            };
-            tabsContainer.appendChild(allTab);
+async def handle_thumb(request: web.Request) -> web.StreamResponse:
+    """
+    /thumb/{w}/{path} — уменьшенное фото для сетки товаров.
 
-            // Вкладки брендов
-            brands.sort().forEach(brand => {
-                // Считаем количество товаров этого бренда
-                const count = filteredForBrands.filter(p => p.brand === brand).length;
-                const tab = document.createElement('button');
-                tab.className = 'brand-tab' + (currentBrand === brand ? ' active' : '');
-                tab.textContent = `${brand} (${count})`;
-                tab.onclick = () => {
-                    if (currentBrand === brand) {
-                        currentBrand = null;
-                    } else {
-                        currentBrand = brand;
-                    }
-                    selectedSizes.clear();
-                currentGender = null;
-                    renderBrands();
-                    renderSizeFilter();
-                    renderProducts(searchInput.value);
-                };
-                tabsContainer.appendChild(tab);
-            });
+    Превью живут в дисковом кэше (cache/thumbs) и генерируются по требованию
+    в пуле процессов. Для URL с отпечатком — вечный кэш в браузере.
+    """
+    try:
+        width = int(request.match_info["width"])
+    except ValueError:
+        raise web.HTTPNotFound()
+    if width not in THUMB_WIDTHS:
+        raise web.HTTPNotFound()
+
+    key = image_cache_key(request, "thumb", width)
+    response = cached_image_hit(request, key, touch=True)
+    if response is not None:
+        return response
+
+    rel_path = request.match_info["path"]
+    source_path = resolve_image_path(request.app["images_dir"], rel_path)
+    if source_path is None:
+        raise web.HTTPNotFound()
+
+    stat = source_path.stat()
+    thumb_path = get_thumb_path(width, rel_path, stat)
+    if thumb_path.exists():
+        touch_thumbnail(thumb_path)
+    else:
+        try:
+            await ensure_thumbnail(source_path, thumb_path, width)
+        except Exception as e:
+            logger.warning("Не удалось сделать превью %s: %s", rel_path, e)
+            return await handle_image(request)
 
-            renderSizeFilter();
-        }
+    if await is_immutable_image_url(request, rel_path, source_path):
+        cache_control = IMAGE_CACHE_CONTROL
+    else:
+        cache_control = "no-cache"
+    headers = image_headers(thumb_path, cache_control)
+    return await serve_image_file(request, key, thumb_path, headers, cache_control == IMAGE_CACHE_CONTROL)
 
-        // Рендеринг фильтра по размерам
-        function renderSizeFilter() {
-            const container = document.getElementById('sizeFilterContainer');
-            const grid = document.getElementById('sizeFilterGrid');
-            const resetBtn = document.getElementById('sizeFilterReset');
-            grid.innerHTML = '';
 
-            // Собираем все размеры из текущей выборки
-            const filteredForSizes = products.filter(p => {
-                if (currentCategory && p.category !== currentCategory) return false;
-                if (currentSubcategory && p.subcategory !== currentSubcategory) return false;
-                if (currentBrand && p.brand !== currentBrand) return false;
-                return true;
-            });
+# ═══════════════════════════════════════════════════════════
+# 📨 ОЧЕРЕДЬ ОБНОВЛЕНИЙ WEBHOOK
+# ═══════════════════════════════════════════════════════════
+#
+# Webhook только проверяет обновление, кладёт его в очередь и сразу
+# отвечает 200 — Telegram не держит соединение, пока бот качает архив.
+# Очередь разбита на шарды по chat_id: у каждого шарда один воркер,
+# поэтому обновления одного чата обрабатываются строго по порядку.
+# Долгие обработчики (приём архива) уходят в отдельную задачу под
+# замком чата — шард не стоит, а порядок внутри чата сохраняется.
+
+UPDATE_WORKERS = 4             # Воркеров (= шардов очереди)
+UPDATE_QUEUE_SIZE = 1000       # Всего мест в очереди на все шарды
+UPDATE_DEDUPE_SIZE = 10000     # Сколько последних update_id помнить для дедупликации
+
+# /metrics извне — только с этим токеном в заголовке X-Metrics-Token;
+# None — метрики доступны лишь с localhost
+METRICS_TOKEN = None
+
+UPDATE_QUEUES = None           # Список asyncio.Queue по шардам (см. get_update_queues)
+UPDATE_WORKER_TASKS = []
+UPDATE_BACKGROUND = {}         # chat_id → [asyncio.Lock, задач чата в фоне]
+UPDATE_BACKGROUND_TASKS = set()
+RECENT_UPDATE_IDS = OrderedDict()
+UPDATE_METRICS = {
+    "received": 0,        # Пришло в webhook
+    "enqueued": 0,        # Поставлено в очередь
+    "duplicates": 0,      # Повторы update_id (ретраи Telegram)
+    "rejected": 0,        # Шард переполнен → 503
+    "invalid": 0,         # Не разобралось как Update
+    "processed": 0,       # Обработано воркерами
+    "failed": 0,          # Обработчик упал
+    "offloaded": 0,       # Отдано в фоновую задачу (долгие и следующие за ними в том же чате)
+    "wait_max_ms": 0.0,   # Максимальное ожидание в очереди
+    "wait_total_ms": 0.0,
+}
+
+
+def get_update_queues():
+    """Шарды очереди обновлений; при первом вызове запускает воркеров."""
+    global UPDATE_QUEUES
+    if UPDATE_QUEUES is None:
+        shard_size = max(1, UPDATE_QUEUE_SIZE // UPDATE_WORKERS)
+        UPDATE_QUEUES = [asyncio.Queue(maxsize=shard_size) for _ in range(UPDATE_WORKERS)]
+        UPDATE_WORKER_TASKS.extend(
+            asyncio.create_task(update_worker(queue), name=f"update-worker-{i}")
+            for i, queue in enumerate(UPDATE_QUEUES)
+        )
+    return UPDATE_QUEUES
+
+
+def update_chat_id(update_data):
+    """chat_id обновления (или id пользователя) — ключ шарда; 0, если не найден."""
+    for key, value in update_data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat and "id" in chat:
+            return chat["id"]
+        sender = value.get("from")
+        if sender and "id" in sender:
+            return sender["id"]
+    return 0
+
+
+def remember_update_id(update_id):
+    """Запоминает update_id; False, если такой уже был (повтор)."""
+    if update_id in RECENT_UPDATE_IDS:
+        return False
+    RECENT_UPDATE_IDS[update_id] = None
+    if len(RECENT_UPDATE_IDS) > UPDATE_DEDUPE_SIZE:
+        RECENT_UPDATE_IDS.popitem(last=False)
+    return True
 
-            const allSizes = new Set();
-            filteredForSizes.forEach(p => {
-                if (p.sizes) p.sizes.forEach(s => allSizes.add(s));
-            });
 
-            if (allSizes.size <= 1) {
-                container.classList.remove('visible');
-                selectedSizes.clear();
-                currentGender = null;
-                renderGenderFilter();
-                return;
-            }
+def enqueue_update(update, chat_id):
+    """
+    Ставит обновление в шард его чата.
+
+    Возвращает "enqueued", "duplicate" или "full" (шард переполнен —
+    webhook отвечает 503, Telegram повторит позже).
+    """
+    if update.update_id in RECENT_UPDATE_IDS:
+        UPDATE_METRICS["duplicates"] += 1
+        return "duplicate"
 
-            container.classList.add('visible');
+    queues = get_update_queues()
+    try:
+        queues[hash(chat_id) % len(queues)].put_nowait((time.monotonic(), update, chat_id))
+    except asyncio.QueueFull:
+        UPDATE_METRICS["rejected"] += 1
+        return "full"
 
-            // Сортировка размеров (числовая)
-            const sortedSizes = [...allSizes].sort((a, b) => {
-                const numA = parseFloat(a.replace(/[^\d.,]/g, '').replace(',', '.'));
-                const numB = parseFloat(b.replace(/[^\d.,]/g, '').replace(',', '.'));
-                if (!isNaN(numA) && !isNaN(numB)) return numA - numB;
-                return a.localeCompare(b);
-            });
+    remember_update_id(update.update_id)
+    UPDATE_METRICS["enqueued"] += 1
+    return "enqueued"
 
-            // Кнопка сброса
-            resetBtn.style.display = selectedSizes.size > 0 ? 'block' : 'none';
-            resetBtn.onclick = () => {
-                selectedSizes.clear();
-                currentGender = null;
-                renderSizeFilter();
-                renderProducts(searchInput.value);
-            };
 
-            sortedSizes.forEach(size => {
-                const btn = document.createElement('button');
-                btn.className = 'size-filter-btn' + (selectedSizes.has(size) ? ' active' : '');
-                btn.textContent = size;
-                btn.onclick = () => {
-                    if (selectedSizes.has(size)) {
-                        selectedSizes.delete(size);
-                    } else {
-                        selectedSizes.add(size);
-                    }
-                    renderSizeFilter();
-                    renderProducts(searchInput.value);
-                };
-                grid.appendChild(btn);
-            });
+def is_long_update(update):
+    """Обновления с долгим обработчиком: документ (архив каталога качается и разбирается минутами)."""
+    message = update.message
+    return message is not None and message.document is not None
 
-            renderGenderFilter();
-        }
 
-        // Рендеринг фильтра по полу
-        function renderGenderFilter() {
-            const container = document.getElementById('genderFilterContainer');
-            container.innerHTML = '';
+async def process_update(update):
+    """Передаёт обновление диспетчеру и считает результат."""
+    try:
+        await dp.feed_update(get_bot(), update)
+        UPDATE_METRICS["processed"] += 1
+    except Exception:
+        UPDATE_METRICS["failed"] += 1
+        logger.exception("❌ Ошибка обработки обновления %s", update.update_id)
 
-            // Собираем полы из текущей выборки
-            const filtered = products.filter(p => {
-                if (currentCategory && p.category !== currentCategory) return false;
-                if (currentSubcategory && p.subcategory !== currentSubcategory) return false;
-                if (currentBrand && p.brand !== currentBrand) return false;
-                return true;
-            });
 
-            const genders = [...new Set(filtered.map(p => p.gender).filter(g => g && g.trim()))];
+def start_background_update(update, chat_id):
+    """
+    Обрабатывает обновление в отдельной задаче под замком чата.
 
-            if (genders.length <= 1) {
-                currentGender = null;
-                return;
-            }
+    Замок честный (FIFO), поэтому обновления чата, пришедшие после
+    долгого, выполняются после него и по порядку.
+    """
+    entry = UPDATE_BACKGROUND.setdefault(chat_id, [asyncio.Lock(), 0])
+    entry[1] += 1
+    UPDATE_METRICS["offloaded"] += 1
 
-            // Вкладка "Все"
-            const allTab = document.createElement('button');
-            allTab.className = 'gender-tab' + (!currentGender ? ' active' : '');
-            allTab.textContent = 'Все';
-            allTab.onclick = () => {
-                if (!currentGender) return;
-                currentGender = null;
-                renderGenderFilter();
-                renderProducts(searchInput.value);
-            };
-            container.appendChild(allTab);
+    async def run():
+        try:
+            async with entry[0]:
+                await process_update(update)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                UPDATE_BACKGROUND.pop(chat_id, None)
 
-            genders.sort().forEach(g => {
-                const tab = document.createElement('button');
-                tab.className = 'gender-tab' + (currentGender === g ? ' active' : '');
-                tab.textContent = g;
-                tab.onclick = () => {
-                    currentGender = currentGender === g ? null : g;
-                    renderGenderFilter();
-                    renderProducts(searchInput.value);
-                };
-                container.appendChild(tab);
-            });
-        }
+    task = asyncio.create_task(run(), name=f"update-{update.update_id}")
+    UPDATE_BACKGROUND_TASKS.add(task)
+    task.add_done_callback(UPDATE_BACKGROUND_TASKS.discard)
 
-        function changeQuantity(productId, delta) {
-            if (!cart[productId]) {
-                cart[productId] = 0;
-            }
 
-            cart[productId] += delta;
+async def update_worker(queue):
+    """
+    Воркер шарда: по одному обновлению, в порядке поступления.
 
-            if (cart[productId] <= 0) {
-                delete cart[productId];
-            }
+    Долгие обновления и всё, что пришло в тот же чат, пока они
+    выполняются, — в фоновую задачу (см. start_background_update).
+    """
+    while True:
+        enqueued_at, update, chat_id = await queue.get()
+        wait_ms = (time.monotonic() - enqueued_at) * 1000
+        UPDATE_METRICS["wait_total_ms"] += wait_ms
+        UPDATE_METRICS["wait_max_ms"] = max(UPDATE_METRICS["wait_max_ms"], wait_ms)
+        try:
+            if is_long_update(update) or chat_id in UPDATE_BACKGROUND:
+                start_background_update(update, chat_id)
+            else:
+                await process_update(update)
+        finally:
+            queue.task_done()
 
-            renderProducts();
-            tg.HapticFeedback.impactOccurred('light');
-        }
 
-        function updateCartFooter() {
-            const footer = document.getElementById('cartFooter');
-            const cartCount = document.getElementById('cartCount');
-            const cartTotal = document.getElementById('cartTotal');
+async def stop_update_workers(timeout=10):
+    """Дожидается разбора очереди и фоновых задач (не дольше timeout) и останавливает воркеров."""
+    global UPDATE_QUEUES
+    if UPDATE_QUEUES is None:
+        return
+    deadline = time.monotonic() + timeout
+    try:
+        await asyncio.wait_for(asyncio.gather(*(queue.join() for queue in UPDATE_QUEUES)), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("⚠️  Очередь обновлений не разобрана за %s с", timeout)
+    if UPDATE_BACKGROUND_TASKS:
+        _, pending = await asyncio.wait(set(UPDATE_BACKGROUND_TASKS), timeout=max(0, deadline - time.monotonic()))
+        if pending:
+            logger.warning("⚠️  Не дождались фоновых обработчиков: %s", len(pending))
+    for task in UPDATE_WORKER_TASKS:
+        task.cancel()
+    await asyncio.gather(*UPDATE_WORKER_TASKS, return_exceptions=True)
+    UPDATE_WORKER_TASKS.clear()
+    UPDATE_QUEUES = None
+
+
+def get_update_metrics():
+    """Снимок метрик очереди: счётчики, глубина шардов, среднее ожидание."""
+    metrics = dict(UPDATE_METRICS)
+    done = metrics["processed"] + metrics["failed"]
+    metrics["wait_avg_ms"] = round(metrics.pop("wait_total_ms") / done, 2) if done else 0.0
+    metrics["wait_max_ms"] = round(metrics["wait_max_ms"], 2)
+    queues = UPDATE_QUEUES or []
+    metrics["queue_depth"] = [queue.qsize() for queue in queues]
+    metrics["queue_capacity"] = sum(queue.maxsize for queue in queues)
+    metrics["workers"] = len(UPDATE_WORKER_TASKS)
+    metrics["background"] = len(UPDATE_BACKGROUND_TASKS)
+    return metrics
+
+
+FORWARD_SESSION = None  # aiohttp.ClientSession для пересылки webhook владельцу
+
+
+def get_forward_session():
+    global FORWARD_SESSION
+    if FORWARD_SESSION is None:
+        import aiohttp
+        FORWARD_SESSION = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10))
+    return FORWARD_SESSION
+
+
+async def forward_webhook(request: web.Request) -> web.Response:
+    """Пересылает webhook воркеру-владельцу (диспетчер и очередь — только у него)."""
+    import aiohttp
+
+    headers = {"Content-Type": "application/json"}
+    secret = request.headers.get("X-Telegram-Bot-Api-Secret-Token")
+    if secret:
+        headers["X-Telegram-Bot-Api-Secret-Token"] = secret
+    try:
+        async with get_forward_session().post(
+            f"http://127.0.0.1:{WEBHOOK_FORWARD_PORT}/webhook",
+            data=await request.read(),
+            headers=headers,
+        ) as response:
+            forwarded = {"Retry-After": response.headers["Retry-After"]} if "Retry-After" in response.headers else None
+            return web.Response(status=response.status, body=await response.read(), headers=forwarded)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        webhook_logger.warning("⚠️  Владелец webhook недоступен: %s", e)
+        return web.Response(status=503, text="Busy", headers={"Retry-After": "1"})
 
-            let totalItems = 0;
-            let totalPrice = 0;
 
-            for (const [productId, quantity] of Object.entries(cart)) {
-                const product = products.find(p => p.id === parseInt(productId));
-                if (product) {
-                    totalItems += quantity;
-                    totalPrice += product.price * quantity;
-                }
-            }
+async def handle_webhook(request: web.Request) -> web.Response:
+    """Обработчик webhook от Telegram: проверка, очередь и сразу 200."""
+    if WORKER_ID:
+        return await forward_webhook(request)
+    UPDATE_METRICS["received"] += 1
+    try:
+        # Сырые байты → orjson → pydantic без промежуточной str и повторных импортов
+        update_data = loads_json(await request.read())
+        update = Update.model_validate(update_data, context={"bot": get_bot()})
+    except Exception as e:
+        # Битое тело повтором не исправится — 400, без ретраев в очередь
+        UPDATE_METRICS["invalid"] += 1
+        webhook_logger.warning("❌ Некорректное обновление: %s", e)
+        return web.Response(status=400, text=str(e))
+
+    chat_id = update_chat_id(update_data)
+    status = enqueue_update(update, chat_id)
+
+    # Полное тело — только на DEBUG: без него никакой сериализации
+    if webhook_logger.isEnabledFor(logging.DEBUG):
+        webhook_logger.debug("📥 WEBHOOK: %.500s", json.dumps(update_data, ensure_ascii=False))
+    webhook_logger.info(
+        "📥 Обновление %s (чат %s): %s", update.update_id, chat_id, status,
+        extra={"update_id": update.update_id, "chat_id": chat_id, "status": status},
+    )
 
-            if (totalItems > 0) {
-                footer.classList.add('visible');
-                cartCount.textContent = totalItems;
-                cartTotal.textContent = formatPrice(totalPrice);
-            } else {
-                footer.classList.remove('visible');
-            }
-        }
+    if status == "full":
+        return web.Response(status=503, text="Busy", headers={"Retry-After": "1"})
+    return web.Response(text="OK")
 
-        // Подготовка данных для отправки
-        function prepareConsultationData() {
-            const items = [];
-            let total = 0;
 
-            for (const [productId, quantity] of Object.entries(cart)) {
-                const product = products.find(p => p.id === parseInt(productId));
-                if (product) {
-                    items.push({
-                        id: product.id,
-                        name: product.name,
-                        price: product.price,
-                        quantity: quantity,
-                        image: product.image
-                    });
-                    total += product.price * quantity;
-                }
-            }
+def is_metrics_allowed(request: web.Request):
+    """/metrics — с верным X-Metrics-Token, а без METRICS_TOKEN — только с localhost."""
+    import hmac
 
-            return {
-                action: 'consultation',
-                items: items,
-                total: total
-            };
-        }
+    if METRICS_TOKEN:
+        return hmac.compare_digest(request.headers.get("X-Metrics-Token", ""), METRICS_TOKEN)
+    return request.remote in ("127.0.0.1", "::1")
 
-        // Кнопка консультации - открывает выбор менеджера
-        document.getElementById('orderBtn').addEventListener('click', () => {
-            const data = prepareConsultationData();
 
-            if (data.items.length === 0) {
-                tg.showAlert('Добавьте хотя бы один товар в интересное!');
-                return;
-            }
+# В режиме нескольких воркеров каждый раз в METRICS_DUMP_INTERVAL секунд
+# пишет свои метрики в cache/metrics — /metrics собирает их со всех
+METRICS_DUMP_INTERVAL = 5.0
 
-            // Формируем текст для отправки менеджеру
-            let messageText = 'Здравствуйте, подскажите о наличии товара:\\n\\n';
-            data.items.forEach(item => {
-                messageText += `• ${item.name} — ${formatPrice(item.price)} ₽\\n`;
-            });
-            messageText += `\\n💰 Общая стоимость: ${formatPrice(data.total)} ₽`;
 
-            // Случайно выбираем менеджера
-            const managers = ['AlexeyBakaev', 'musyanya'];
-            const username = managers[Math.floor(Math.random() * managers.length)];
-            const url = `https://t.me/${username}?text=${encodeURIComponent(messageText)}`;
+def get_process_metrics():
+    """Метрики этого процесса: очередь webhook (она только у владельца) и кэш фото."""
+    import os
 
-            // Открываем чат с менеджером
-            tg.openTelegramLink(url);
-        });
-    </script>
-</body>
-</html>
-"""
+    metrics = get_update_metrics()
+    metrics["image_cache"] = get_image_cache_metrics()
+    metrics["worker"] = WORKER_ID
+    metrics["pid"] = os.getpid()
+    return metrics
 
 
-async def handle_index(request: web.Request) -> web.Response:
-    """Отдаёт HTML страницу Mini App."""
-    return web.Response(text=HTML_TEMPLATE, content_type="text/html")
+def write_worker_metrics(metrics):
+    """Сохраняет метрики воркера для соседей (атомарно)."""
+    import os
 
+    metrics_dir = get_cache_dir() / 'metrics'
+    metrics_dir.mkdir(exist_ok=True)
+    path = metrics_dir / f"worker-{WORKER_ID}.json"
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    data = {"generation": WORKER_GENERATION, "time": time.time(), "metrics": metrics}
+    try:
+        tmp_path.write_text(json.dumps(data), encoding='utf-8')
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("⚠️  Не удалось записать метрики воркера: %s", e)
 
-async def handle_products(request: web.Request) -> web.Response:
-    """API: список товаров в формате JSON."""
-    return web.json_response(PRODUCTS)
 
+def read_worker_metrics():
+    """Последние метрики всех воркеров этого запуска: {номер: метрики + возраст}."""
+    workers = {}
+    for path in (get_cache_dir() / 'metrics').glob('worker-*.json'):
+        try:
+            data = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            continue
+        if data.get("generation") != WORKER_GENERATION:
+            continue
+        metrics = data["metrics"]
+        metrics["age_s"] = round(time.time() - data["time"], 1)
+        workers[str(metrics["worker"])] = metrics
+    return workers
 
-async def handle_webhook(request: web.Request) -> web.Response:
-    """Обработчик webhook от Telegram."""
-    try:
-        update_data = await request.json()
-        print(f"\n📥 WEBHOOK: {json.dumps(update_data, ensure_ascii=False)[:500]}\n", flush=True)
-        from aiogram.types import Update
-        update = Update(**update_data)
-        await dp.feed_update(bot, update)
-        return web.Response(text="OK")
-    except Exception as e:
-        print(f"\n❌ WEBHOOK ERROR: {e}\n", flush=True)
-        import traceback
-        print(traceback.format_exc(), flush=True)
-        return web.Response(status=500, text=str(e))
+
+async def dump_worker_metrics(interval=METRICS_DUMP_INTERVAL):
+    """Фоновая задача воркера: периодически публикует его метрики."""
+    while True:
+        await loop_run_io(write_worker_metrics, get_process_metrics())
+        await asyncio.sleep(interval)
+
+
+async def handle_metrics(request: web.Request) -> web.Response:
+    """
+    Метрики очереди обновлений webhook и кэша фото (JSON).
+
+    Один процесс — его метрики. Несколько воркеров — {"served_by": N,
+    "workers": {номер: метрики}}: свежие у ответившего воркера и
+    последние опубликованные (age_s секунд назад) у остальных.
+    """
+    if not is_metrics_allowed(request):
+        raise web.HTTPForbidden()
+    metrics = get_process_metrics()
+    if WORKER_ID is not None:
+        workers = await loop_run_io(read_worker_metrics)
+        workers[str(WORKER_ID)] = metrics
+        metrics = {"served_by": WORKER_ID, "workers": dict(sorted(workers.items(), key=lambda item: int(item[0])))}
+    return web.json_response(metrics, headers={"Cache-Control": "no-store"})
 
 
 def create_web_app() -> web.Application:
     """Создаёт веб-приложение aiohttp."""
     app = web.Application()
     app.router.add_get("/", handle_index)
+    app.router.add_get("/sw.js", handle_service_worker)
     app.router.add_get("/api/products", handle_products)
+    app.router.add_get("/api/products/changes", handle_products_changes)
+    app.router.add_get("/api/facets", handle_facets)
+    app.router.add_get("/api/catalog/manifest", handle_catalog_manifest)
+    if GRID_BENCHMARK:
+        app.router.add_get("/bench/grid", handle_grid_benchmark)  # Бенчмарк сетки на синтетическом каталоге
     app.router.add_post("/webhook", handle_webhook)  # Webhook endpoint
+    app.router.add_get("/metrics", handle_metrics)  # Метрики очереди webhook
 
-    # Раздаём статические файлы (фотографии товаров)
-    images_dir = get_images_dir()
-    if images_dir.exists():
-        app.router.add_static("/images/", path=images_dir, name="images")
-        logger.info(f"📁 Раздация изображений из: {images_dir}")
+    # Раздаём фотографии товаров (ETag + вечный кэш для URL с отпечатком)
+    app["images_dir"] = get_images_dir()
+    app.router.add_get("/images/{path:.+}", handle_image, name="images")
+    app.router.add_get("/thumb/{width}/{path:.+}", handle_thumb)
+    logger.info(f"📁 Раздача изображений из: {app['images_dir']}")
 
     return app
 
@@ -2640,21 +5685,11 @@ def create_web_app() -> web.Application:
 # 🚀 ЗАПУСК
 # ═══════════════════════════════════════════════════════════
 
-async def main():
-    """Запускает бота и веб-сервер одновременно."""
+def setup_public_url():
+    """Настраивает публичный URL (Serveo или ручной). Возвращает процесс туннеля или None."""
     global WEBAPP_URL
-
-    # Освобождаем порт перед запуском
-    print(f"🔍 Проверяю порт {WEBAPP_PORT}...")
-    kill_process_on_port(WEBAPP_PORT)
-    print(f"✅ Порт {WEBAPP_PORT} готов к использованию\n")
-
-    # Загружаем товары из Excel
-    load_products_from_excel()
-
     tunnel_process = None
 
-    # 1. Настраиваем публичный URL
     if MODE == "auto":
         # Автоматический режим с Serveo
         print("🔧 Режим: Автоматический (Serveo)\n")
@@ -2716,6 +5751,168 @@ async def main():
         print("📌 Ручной режим: используется URL из настроек")
         print(f"🌍 URL: {WEBAPP_URL}\n")
 
+    return tunnel_process
+
+
+async def run_bot():
+    """Запускает бота: webhook для продакшена (HTTPS URL) или polling локально."""
+    # Определяем режим работы
+    use_webhook = WEBAPP_URL and ("amvera.io" in WEBAPP_URL or WEBAPP_URL.startswith("https://"))
+
+    if use_webhook:
+        # Webhook mode для продакшена (Amvera и др.)
+        webhook_url = f"{WEBAPP_URL}/webhook"
+        logger.info("🔗 Режим: WEBHOOK")
+        logger.info(f"📍 Webhook URL: {webhook_url}")
+        # Устанавливаем webhook с поддержкой групповых сообщений
+        await get_bot().set_webhook(
+            url=webhook_url,
+            allowed_updates=["message", "callback_query", "inline_query", "web_app_data"],
+        )
+        logger.info("✅ Webhook установлен")
+        await asyncio.Event().wait()  # Бесконечное ожидание
+    else:
+        # Polling mode для локальной разработки
+        logger.info("🔄 Режим: POLLING (локальная разработка)")
+        await dp.start_polling(get_bot())
+
+
+async def run_worker(worker_id, webapp_url, generation):
+    """
+    Воркер в режиме нескольких процессов.
+
+    Все воркеры слушают WEBAPP_PORT с SO_REUSEPORT и отдают API и фото.
+    Воркер 0 — владелец: грузит Excel, держит бота (webhook/polling,
+    очередь обновлений, загрузку архивов) и публикует общий снимок
+    каталога; ещё он слушает 127.0.0.1:WEBHOOK_FORWARD_PORT, куда
+    остальные пересылают пришедшие к ним webhook. generation — метка
+    запуска supervisor (см. WORKER_GENERATION).
+    """
+    import os
+
+    global WORKER_ID, WORKER_GENERATION, WEBAPP_URL
+    WORKER_ID = worker_id
+    WORKER_GENERATION = generation
+    WEBAPP_URL = webapp_url
+    owner = worker_id == 0
+
+    watcher = None
+    metrics_dumper = asyncio.create_task(dump_worker_metrics())
+    if owner:
+        load_products_from_excel()
+    else:
+        # Ждём первый снимок от владельца, дальше следим за обновлениями
+        watcher = asyncio.create_task(watch_shared_catalog())
+        while CATALOG is None:
+            await asyncio.sleep(0.2)
+
+    runner = web.AppRunner(create_web_app())
+    await runner.setup()
+    await web.TCPSite(runner, WEBAPP_HOST, WEBAPP_PORT, reuse_port=True).start()
+    if owner:
+        await web.TCPSite(runner, "127.0.0.1", WEBHOOK_FORWARD_PORT).start()
+    logger.info("🧵 Воркер %s (PID %s) слушает порт %s", worker_id, os.getpid(), WEBAPP_PORT)
+
+    try:
+        if owner:
+            await run_bot()
+        else:
+            await asyncio.Event().wait()
+    finally:
+        metrics_dumper.cancel()
+        if watcher:
+            watcher.cancel()
+        await runner.cleanup()
+        await stop_update_workers()
+        if FORWARD_SESSION is not None:
+            await FORWARD_SESSION.close()
+        shutdown_executors()
+
+
+def worker_entry(worker_id, webapp_url, generation):
+    """Точка входа процесса-воркера (spawn)."""
+    setup_logging()
+    try:
+        asyncio.run(run_worker(worker_id, webapp_url, generation))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_supervisor(workers):
+    """
+    Supervisor: настраивает URL, запускает воркеров и перезапускает упавших.
+
+    SIGTERM (остановка контейнера) и Ctrl+C завершают всех воркеров.
+    """
+    import os
+    import shutil
+    import signal
+
+    print(f"🔍 Проверяю порт {WEBAPP_PORT}...")
+    kill_process_on_port(WEBAPP_PORT)
+    shutil.rmtree(get_data_dir() / ".staging", ignore_errors=True)
+    tunnel_process = setup_public_url()
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    context = multiprocessing.get_context("spawn")
+    # Перезапущенные воркеры получают ту же метку: свежий снимок владельца им подходит
+    generation = f"{os.getpid()}-{time.time_ns()}"
+
+    def start(worker_id):
+        process = context.Process(
+            target=worker_entry, args=(worker_id, WEBAPP_URL, generation), name=f"web-worker-{worker_id}",
+        )
+        process.start()
+        return process
+
+    logger.info("🧵 Supervisor: %d воркеров на порту %s", workers, WEBAPP_PORT)
+    processes = {worker_id: start(worker_id) for worker_id in range(workers)}
+    try:
+        while True:
+            for worker_id, process in list(processes.items()):
+                if not process.is_alive():
+                    logger.warning("⚠️  Воркер %s завершился (код %s), перезапускаю", worker_id, process.exitcode)
+                    processes[worker_id] = start(worker_id)
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info("Остановка воркеров...")
+    finally:
+        for process in processes.values():
+            process.terminate()
+        for process in processes.values():
+            process.join(10)
+        if tunnel_process:
+            tunnel_process.kill()
+
+
+def get_worker_count():
+    """Число воркеров: --workers N из командной строки или WEB_WORKERS."""
+    if "--workers" in sys.argv:
+        try:
+            return max(1, int(sys.argv[sys.argv.index("--workers") + 1]))
+        except (IndexError, ValueError):
+            print("⚠️  --workers ожидает число, запускаю один процесс")
+            return 1
+    return WEB_WORKERS
+
+
+async def main():
+    """Запускает бота и веб-сервер одновременно."""
+    # Освобождаем порт перед запуском
+    print(f"🔍 Проверяю порт {WEBAPP_PORT}...")
+    kill_process_on_port(WEBAPP_PORT)
+    print(f"✅ Порт {WEBAPP_PORT} готов к использованию\n")
+
+    # Чистим staging от прерванных загрузок архивов
+    import shutil
+    shutil.rmtree(get_data_dir() / ".staging", ignore_errors=True)
+
+    # Загружаем товары из Excel
+    load_products_from_excel()
+
+    # 1. Настраиваем публичный URL
+    tunnel_process = setup_public_url()
+
     # 2. Запускаем веб-сервер
     web_app = create_web_app()
     runner = web.AppRunner(web_app)
@@ -2732,37 +5929,31 @@ async def main():
     logger.info("🤖 Telegram бот запущен!")
     logger.info("💬 Напиши боту /start чтобы открыть магазин!\n")
 
-    # Определяем режим работы
-    use_webhook = WEBAPP_URL and ("amvera.io" in WEBAPP_URL or WEBAPP_URL.startswith("https://"))
-
     try:
-        if use_webhook:
-            # Webhook mode для продакшена (Amvera и др.)
-            webhook_url = f"{WEBAPP_URL}/webhook"
-            logger.info("🔗 Режим: WEBHOOK")
-            logger.info(f"📍 Webhook URL: {webhook_url}")
-            # Устанавливаем webhook с поддержкой групповых сообщений
-            await bot.set_webhook(
-                url=webhook_url,
-                allowed_updates=["message", "callback_query", "inline_query", "web_app_data"],
-            )
-            logger.info("✅ Webhook установлен")
-            await asyncio.Event().wait()  # Бесконечное ожидание
-        else:
-            # Polling mode для локальной разработки
-            logger.info("🔄 Режим: POLLING (локальная разработка)")
-            await dp.start_polling(bot)
+        await run_bot()
     finally:
         # Останавливаем всё при выходе
         logger.info("Останавливаю сервер...")
         await runner.cleanup()
+        await stop_update_workers()
+        shutdown_executors()
         if tunnel_process:
             logger.info("Останавливаю туннель...")
             tunnel_process.kill()
 
 
 if __name__ == "__main__":
+    import socket
+
+    setup_logging()
+    workers = get_worker_count()
+    if workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        print("⚠️  SO_REUSEPORT недоступен на этой ОС — запускаю один процесс")
+        workers = 1
     try:
-        asyncio.run(main())
+        if workers > 1:
+            run_supervisor(workers)
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         logger.info("Остановка бота...")
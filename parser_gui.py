@@ -15,9 +15,10 @@ import io
 import json
 import zipfile
 
-# Фикс кодировки для Windows консоли
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
-sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
+# Фикс кодировки для Windows консоли (при импорте из бенчмарков — их забота)
+if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8', errors='replace')
+    sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8', errors='replace')
 
 # ═══════════════════════════════════════════════════════════
 # 📦 АВТОУСТАНОВКА ЗАВИСИМОСТЕЙ
@@ -29,6 +30,7 @@ def install_dependencies():
         'openpyxl': 'openpyxl==3.1.2',
         'requests': 'requests==2.31.0',
         'yfinance': 'yfinance',
+        'PIL': 'Pillow==11.3.0',
     }
 
     missing_packages = []
@@ -56,8 +58,9 @@ def install_dependencies():
             print(f"❌ Ошибка установки зависимостей: {e}")
             sys.exit(1)
 
-# Устанавливаем зависимости
-install_dependencies()
+# Устанавливаем зависимости (только при запуске приложения, не при импорте)
+if __name__ == "__main__":
+    install_dependencies()
 
 import openpyxl
 import requests
@@ -432,13 +435,114 @@ def clean_product_name(name):
     return result
 
 
-def download_image(image_url, save_dir, product_id):
-    """Скачивает изображение и сохраняет локально (всегда перезаписывает)."""
+# Ширины готовых вариантов фото (для srcset в Mini App)
+VARIANT_WIDTHS = (160, 320, 640, 1280)
+VARIANT_QUALITY = 80
+
+
+def variant_path(image_path, width):
+    """Путь варианта фото: images/ab/<hash>.webp → images/ab/<hash>_w320.webp."""
+    return image_path.with_name(f"{image_path.stem}_w{width}.webp")
+
+
+def make_image_variants(image_path):
+    """
+    Создаёт уменьшенные копии фото для всех VARIANT_WIDTHS меньше оригинала.
+
+    Готовые варианты не пересоздаются, если они новее исходника.
+    Возвращает список путей вариантов.
+    """
+    from PIL import Image, ImageOps
+
+    variants = []
     try:
-        # Удаляем старые файлы для этого product_id (если есть)
-        for old_file in save_dir.glob(f"product_{product_id}.*"):
-            old_file.unlink()
+        with Image.open(image_path) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+
+            source_mtime = image_path.stat().st_mtime
+            for width in VARIANT_WIDTHS:
+                if width >= image.width:
+                    break
+                path = variant_path(image_path, width)
+                if not path.exists() or path.stat().st_mtime < source_mtime:
+                    resized = image.resize((width, round(image.height * width / image.width)), Image.LANCZOS)
+                    resized.save(path, "WEBP", quality=VARIANT_QUALITY, method=4)
+                variants.append(path)
+    except Exception as e:
+        print(f"      ⚠️ Не удалось сделать варианты фото {image_path.name}: {e}")
+    return variants
+
+
+# Перекодирование для отдачи по Accept: AVIF и WebP рядом с исходником
+AVIF_QUALITY = 55
+WEBP_QUALITY = 80
+
+
+def transcode_image(image_path):
+    """
+    Создаёт рядом с фото копии в AVIF и WebP: <имя>.avif, <имя>.webp.
+
+    Копия сохраняется, только если она меньше исходника — иначе смысла
+    отдавать её нет. AVIF пропускается, если Pillow собран без него.
+    Возвращает список созданных (или уже готовых) копий.
+    """
+    from PIL import Image, ImageOps, features
+
+    targets = [('.webp', 'WEBP', {'quality': WEBP_QUALITY, 'method': 4})]
+    if features.check('avif'):
+        targets.insert(0, ('.avif', 'AVIF', {'quality': AVIF_QUALITY}))
+
+    copies = []
+    try:
+        source_stat = image_path.stat()
+        image = None
+        for ext, fmt, options in targets:
+            if image_path.suffix.lower() == ext:
+                continue
+            path = image_path.with_suffix(ext)
+            if path.exists() and path.stat().st_mtime >= source_stat.st_mtime:
+                copies.append(path)
+                continue
+            if image is None:
+                with Image.open(image_path) as src:
+                    image = ImageOps.exif_transpose(src)
+                    if image.mode not in ("RGB", "RGBA"):
+                        image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+            buffer = io.BytesIO()
+            image.save(buffer, fmt, **options)
+            if buffer.tell() < source_stat.st_size:
+                path.write_bytes(buffer.getvalue())
+                copies.append(path)
+    except Exception as e:
+        print(f"      ⚠️ Не удалось перекодировать фото {image_path.name}: {e}")
+    return copies
 
+
+def prepare_image_files(image_path):
+    """Готовит все производные фото: варианты по ширине и их AVIF/WebP копии."""
+    derived = []
+    for path in [image_path, *make_image_variants(image_path)]:
+        if path != image_path:
+            derived.append(path)
+        derived.extend(transcode_image(path))
+    return derived
+
+
+def download_image(image_url, save_dir, product_id):
+    """
+    Скачивает изображение в хранилище по содержимому: images/ab/<sha256>.<ext>.
+
+    Одинаковые фото разных товаров хранятся один раз: если файл с таким
+    хэшем уже есть, новая копия не сохраняется. Возвращает путь для
+    колонки H (например images/ab/abcdef....webp).
+    """
+    import hashlib
+    import os
+
+    tmp_path = None
+    try:
         # Скачиваем изображение
         response = requests.get(image_url, timeout=10, stream=True)
         response.raise_for_status()
@@ -453,18 +557,30 @@ def download_image(image_url, save_dir, product_id):
         elif 'jpeg' in content_type or 'jpg' in content_type:
             ext = '.jpg'
 
-        # Генерируем имя файла: product_1.webp, product_2.jpg и т.д.
-        filename = f"product_{product_id}{ext}"
-        filepath = save_dir / filename
-
-        # Сохраняем файл (перезаписываем если существует)
-        with open(filepath, 'wb') as f:
+        # Пишем во временный файл, попутно считая хэш
+        tmp_path = save_dir / f".download_{product_id}_{threading.get_ident()}.tmp"
+        digest = hashlib.sha256()
+        with open(tmp_path, 'wb') as f:
             for chunk in response.iter_content(chunk_size=8192):
                 f.write(chunk)
+                digest.update(chunk)
+
+        name = digest.hexdigest()
+        filepath = save_dir / name[:2] / f"{name}{ext}"
+        if filepath.exists():
+            tmp_path.unlink()
+        else:
+            filepath.parent.mkdir(exist_ok=True)
+            os.replace(tmp_path, filepath)
+
+        # Сразу готовим уменьшенные варианты и AVIF/WebP копии
+        prepare_image_files(filepath)
 
-        return str(filepath.relative_to(save_dir.parent))
+        return filepath.relative_to(save_dir.parent).as_posix()
     except Exception as e:
         print(f"      ⚠️ Ошибка скачивания фото: {e}")
+        if tmp_path is not None and tmp_path.exists():
+            tmp_path.unlink()
         return None
 
 
@@ -835,6 +951,152 @@ def parse_product(url, script_dir, product_id):
         return parse_generic_product(url, script_dir, product_id)
 
 
+# ═══════════════════════════════════════════════════════════
+# 📦 АРХИВ ДЛЯ БОТА
+# ═══════════════════════════════════════════════════════════
+
+# Манифест внутри архива: хэши всех фото каталога
+ARCHIVE_MANIFEST_NAME = "manifest.json"
+
+# Сервер бота: архив изменений считается от фото, которые на нём сейчас
+CATALOG_SERVER_URL = "https://nimblicatalog-alexey20031986.amvera.io"
+
+# Манифест последнего собранного архива — запасная база, если сервер недоступен
+LAST_MANIFEST_FILE = "last_archive_manifest.json"
+
+
+# Уже сжатые форматы кладём в ZIP без сжатия (ZIP_STORED): DEFLATE почти
+# ничего не выигрывает, а время тратит и здесь, и на сервере при распаковке
+STORED_EXTENSIONS = {'.webp', '.jpg', '.jpeg', '.png', '.avif', '.gif'}
+
+
+def archive_compress_type(name):
+    """Метод сжатия для файла архива: STORED для картинок, DEFLATE для остального."""
+    if Path(name).suffix.lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def file_sha256(path):
+    """SHA-256 файла (читается блоками)."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_images(images_dir, only=None, max_workers=8):
+    """
+    Возвращает {"images/<путь>": sha256} для фото в папке (параллельно).
+
+    only — множество имён "images/..."; остальные файлы пропускаются.
+    """
+    image_files = {
+        f"images/{f.relative_to(images_dir).as_posix()}": f
+        for f in sorted(images_dir.rglob('*'))
+        if f.is_file() and not f.name.startswith('.')
+    }
+    if only is not None:
+        image_files = {name: f for name, f in image_files.items() if name in only}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        digests = executor.map(file_sha256, image_files.values())
+        return dict(zip(image_files, digests))
+
+
+def load_last_manifest(script_dir):
+    """Манифест прошлого архива или None, если архивов ещё не было."""
+    try:
+        return json.loads((script_dir / LAST_MANIFEST_FILE).read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return None
+
+
+def fetch_server_manifest(server_url=CATALOG_SERVER_URL):
+    """Манифест фото, которые сейчас на сервере бота, или None (сервер недоступен)."""
+    try:
+        response = requests.get(f"{server_url}/api/catalog/manifest", timeout=30)
+        response.raise_for_status()
+        manifest = response.json()
+    except (requests.RequestException, ValueError):
+        return None
+    if not isinstance(manifest, dict) or not isinstance(manifest.get("files"), dict):
+        return None
+    return manifest
+
+
+def referenced_images(excel_path):
+    """Фото, на которые ссылается колонка H Excel: {"images/ab/....webp", ...}."""
+    wb = load_workbook(excel_path, read_only=True, data_only=True)
+    try:
+        names = set()
+        for (local_images,) in wb.active.iter_rows(min_row=2, min_col=8, max_col=8, values_only=True):
+            if not local_images:
+                continue
+            for photo in str(local_images).split(','):
+                photo = photo.strip().replace('\\', '/')
+                if photo:
+                    names.add(photo if photo.startswith('images/') else f"images/{photo}")
+        return names
+    finally:
+        wb.close()
+
+
+def build_catalog_archive(archive_path, excel_path, images_dir, base_manifest=None,
+                          compress_type=archive_compress_type):
+    """
+    Собирает ZIP для бота: Excel, фото и manifest.json.
+
+    Без base_manifest — полный архив. С ним — архив изменений: только новые
+    и изменённые фото (Excel кладётся всегда). Манифест в обоих случаях
+    перечисляет ВСЕ фото каталога, чтобы бот мог собрать полную папку
+    из уже имеющихся файлов и удалить лишние.
+
+    Фото хэшируются параллельно; ZIP пишется последовательно, метод сжатия
+    каждого файла — compress_type(имя) (по умолчанию archive_compress_type:
+    фото без сжатия).
+
+    Возвращает (manifest, количество фото в архиве).
+    """
+    # В архив идут только фото, на которые ссылается Excel: старые версии
+    # из хранилища по хэшам не тянутся в архив и на сервер
+    used = referenced_images(excel_path)
+
+    # Варианты фото для srcset и AVIF/WebP копии: досоздаём недостающие
+    # (например, для фото, скачанных раньше) и кладём в архив с оригиналом
+    for name in list(used):
+        image_path = images_dir / name.removeprefix("images/")
+        if image_path.is_file():
+            for path in prepare_image_files(image_path):
+                used.add(f"images/{path.relative_to(images_dir).as_posix()}")
+
+    files = hash_images(images_dir, only=used)
+    if base_manifest is None:
+        included = list(files)
+    else:
+        base_files = base_manifest.get("files", {})
+        included = [name for name, digest in files.items() if base_files.get(name) != digest]
+
+    manifest = {
+        "format": 1,
+        "mode": "full" if base_manifest is None else "delta",
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "files": files,
+    }
+
+    with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        zipf.write(excel_path, excel_path.name)
+        for name in included:
+            zipf.write(images_dir / name.removeprefix("images/"), name,
+                       compress_type=compress_type(name))
+        zipf.writestr(ARCHIVE_MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False, indent=1))
+
+    return manifest, len(included)
+
+
 # ═══════════════════════════════════════════════════════════
 # 🖥️ GUI ПРИЛОЖЕНИЕ
 # ═══════════════════════════════════════════════════════════
@@ -937,6 +1199,22 @@ class ParserApp:
         )
         self.archive_btn.pack(side=tk.LEFT, padx=10)
 
+        # Кнопка архива изменений (только новые/изменённые фото)
+        self.delta_archive_btn = tk.Button(
+            button_frame,
+            text="🧩 Архив изменений",
+            command=lambda: self.archive_clicked(delta=True),
+            bg="#FFB74D",
+            fg="white",
+            font=("Segoe UI", 12, "bold"),
+            padx=20,
+            pady=10,
+            cursor="hand2",
+            relief=tk.RAISED,
+            bd=2
+        )
+        self.delta_archive_btn.pack(side=tk.LEFT, padx=10)
+
         # Выбор количества потоков
         threads_frame = tk.Frame(tab_parser, bg="#f5f5f5")
         threads_frame.pack(pady=5)
@@ -1376,11 +1654,11 @@ class ParserApp:
             self.update_status("❌ Ошибка создания шаблона")
             messagebox.showerror("Ошибка", f"Не удалось создать шаблон:\n{e}")
 
-    def archive_clicked(self):
-        """Обработчик кнопки архивирования."""
+    def archive_clicked(self, delta=False):
+        """Обработчик кнопки архивирования (delta=True — только изменения)."""
         self.update_status("📦 Создание архива...")
         self.log("\n" + "=" * 80)
-        self.log("📦 СОЗДАНИЕ ZIP АРХИВА ДЛЯ БОТА")
+        self.log("🧩 СОЗДАНИЕ АРХИВА ИЗМЕНЕНИЙ ДЛЯ БОТА" if delta else "📦 СОЗДАНИЕ ZIP АРХИВА ДЛЯ БОТА")
         self.log("=" * 80)
         self.log("")
 
@@ -1405,28 +1683,38 @@ class ParserApp:
                 self.update_status("❌ Папка images/ пуста")
                 return
 
+            # Архив изменений считается от того, что сейчас на сервере.
+            # Если сервер недоступен — от прошлого архива; бот сверит хэши
+            # и отклонит архив, если прошлый так и не был отправлен
+            base_manifest = None
+            if delta:
+                self.log("🌐 Запрашиваю список фото на сервере...")
+                base_manifest = fetch_server_manifest()
+                if base_manifest is None:
+                    self.log("⚠️ Сервер недоступен — считаю изменения от прошлого архива")
+                    base_manifest = load_last_manifest(self.script_dir)
+                if base_manifest is None:
+                    self.log("⚠️ Прошлых архивов нет — собираю полный архив")
+
             # Создаём ZIP архив
-            archive_name = f"catalog_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+            prefix = "catalog_delta" if base_manifest is not None else "catalog"
+            archive_name = f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
             archive_path = self.script_dir / archive_name
 
             self.log(f"📦 Создаю архив: {archive_name}")
+            self.log(f"   ✅ Добавляю {self.file_path.name}")
             self.log("")
 
-            with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                # Добавляем Excel файл
-                self.log(f"   ✅ Добавляю {self.file_path.name}")
-                zipf.write(self.file_path, self.file_path.name)
-
-                # Добавляем все фотографии из папки images
-                image_count = 0
-                for image_file in images_dir.iterdir():
-                    if image_file.is_file():
-                        # Добавляем с путём images/filename
-                        arcname = f"images/{image_file.name}"
-                        zipf.write(image_file, arcname)
-                        image_count += 1
-
-                self.log(f"   ✅ Добавлено фотографий: {image_count}")
+            manifest, image_count = build_catalog_archive(
+                archive_path, self.file_path, images_dir, base_manifest
+            )
+
+            # Запоминаем состав — запасная база, если сервер будет недоступен
+            (self.script_dir / LAST_MANIFEST_FILE).write_text(
+                json.dumps(manifest, ensure_ascii=False), encoding='utf-8'
+            )
+
+            self.log(f"   ✅ Добавлено фотографий: {image_count} из {len(manifest['files'])}")
 
             archive_size = archive_path.stat().st_size / 1024 / 1024  # MB
 